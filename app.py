@@ -9,17 +9,34 @@ import pandas as pd
 import json
 import requests
 import re
-from flask import Flask, render_template, jsonify, request, Response, send_from_directory
+from contextlib import nullcontext
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from io import BytesIO
+from typing import List
 
 # 匯入重構後的核心邏輯
 from config import Config
 from logger import get_logger, Logger
-from main import run_verification, run_single_verification
+from main import QAVerificationSystem, run_verification, run_single_verification
+from library import as_pair
+from sweep import build_sweep_targets, run_sweep
+from artifacts import iter_zip, list_artifacts, precompress_artifacts, send_artifact
+from task_lifecycle import TaskLifecycleManager
+from task_control import TaskCancelled, get_control, register_control, remove_control
+from concurrency import PRIORITY_BACKGROUND, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from batch_files import expand_excel_inputs, is_archive_file, is_excel_file, run_batch_verification
+from chunked_upload import UploadOffsetError, UploadSession, UploadStore, parse_content_range
 from excel_handler import ExcelHandler
+from tabular_handler import prescan_qa_file
+from similarity_analyzer import get_shared_analyzer
+from profiler import profile_run
+import metrics
+import telemetry
+import workspace_cache
+from workspace_cache import WorkspaceDirectory
 
 # --- App State & Initialization ---
 
@@ -33,7 +50,12 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50 MB
+app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200 MB (多檔案批次上傳的總大小)
+
+# 分段上傳：大型問答集以多個 PUT 請求直接串流寫入磁碟，整個檔案不受 MAX_CONTENT_LENGTH 限制 (每一段仍受限制)
+MAX_CHUNKED_UPLOAD_BYTES = 5 * 1024 * 1024 * 1024  # 5 GB
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 建議用戶端每段傳送的大小
+upload_store = UploadStore(os.path.join(UPLOAD_FOLDER, 'chunked'), max_size=MAX_CHUNKED_UPLOAD_BYTES)
 
 # 用於追蹤背景任務的狀態
 tasks = {}
@@ -41,21 +63,62 @@ tasks = {}
 # 建立一個給 Flask 應用本身使用的 logger
 app_logger = get_logger("FlaskWebApp")
 
-def cleanup_expired_tasks():
-    """清理過期的任務（超過1小時）"""
-    current_time = time.time()
-    expired_tasks = []
-    for task_id, task_info in tasks.items():
-        created_time = task_info.get('created_time', 0)
-        if current_time - created_time > 3600:  # 1小時過期
-            expired_tasks.append(task_id)
-    
-    for task_id in expired_tasks:
-        try:
-            del tasks[task_id]
-            app_logger.info(f"已清理過期任務: {task_id}")
-        except KeyError:
-            pass  # 任務可能已被其他進程清理
+# 快速單筆驗證共用的 HTTP 連線 (keep-alive)
+fast_path_session = requests.Session()
+
+# 佇列深度於 /metrics 輸出時才計算，避免在每次狀態變更時維護計數
+telemetry.TASK_QUEUE_DEPTH.labels(queue='pending_tasks').set_function(
+    lambda: sum(1 for task_info in list(tasks.values()) if task_info.get('status') == 'pending')
+)
+telemetry.TASK_QUEUE_DEPTH.labels(queue='sse_messages').set_function(
+    lambda: sum(task_info['queue'].qsize() for task_info in list(tasks.values()) if 'queue' in task_info)
+)
+
+def release_task_state(task_id: str):
+    """釋放到期任務在記憶體中的狀態 (SSE 佇列、單筆結果) 並關閉任務專用的 logger"""
+    task_info = tasks.pop(task_id, None)
+    if task_info and task_info.get('logger'):
+        task_info['logger'].close()
+    app_logger.info(f"已清理過期任務: {task_id}")
+
+# 任務結束後依到期時間釋放任務狀態，並在超過保留時間或磁碟配額時刪除任務的上傳檔案與輸出目錄 (由背景執行緒處理)
+_file_config = Config.load().file
+task_lifecycle = TaskLifecycleManager(
+    release_task_state,
+    state_ttl=_file_config.task_retention,
+    retention=_file_config.artifact_retention,
+    quota_bytes=_file_config.disk_quota_mb * 1024 * 1024,
+    logger=app_logger
+)
+task_lifecycle.adopt_existing(UPLOAD_FOLDER, OUTPUT_FOLDER)
+task_lifecycle.start()
+telemetry.TASK_DISK_BYTES.set_function(lambda: task_lifecycle.total_bytes)
+
+def save_batch_uploads(files, upload_dir: str) -> list:
+    """
+    儲存批次上傳的檔案並展開 zip 壓縮檔
+
+    Returns:
+        list: 要驗證的 Excel 檔案路徑 (依上傳順序)
+
+    Raises:
+        ValueError: zip 檔案無效或沒有任何 Excel 檔案
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    saved_paths = []
+    used_names = set()
+    for index, file in enumerate(files, 1):
+        filename = secure_filename(file.filename)
+        # secure_filename 會移除非 ASCII 字元，中文檔名可能因此失去副檔名，此時改用流水號
+        if not (is_excel_file(filename) or is_archive_file(filename)):
+            filename = f"workbook_{index}{os.path.splitext(file.filename)[1].lower()}"
+        if filename.lower() in used_names:
+            filename = f"{index}_{filename}"
+        used_names.add(filename.lower())
+        path = os.path.join(upload_dir, filename)
+        file.save(path)
+        saved_paths.append(path)
+    return expand_excel_inputs(saved_paths, os.path.join(upload_dir, 'extracted'))
 
 # --- Helper Function for Threading ---
 
@@ -83,37 +146,96 @@ def run_verification_threaded(task_id: str, config: Config, logger, args: argpar
 
         tasks[task_id]['status'] = 'running'
         logger.info(f"[INFO] Task {task_id}: 驗證流程開始。")
-        run_verification(config, logger, args, web_mode=True)
-        tasks[task_id]['status'] = 'completed'
-
-        # 驗證流程已經在 main.py 中處理了檔案儲存，這裡不需要額外的複製
-        logger.info(f"[INFO] Task {task_id}: 驗證流程成功完成。")
-        
-        logger.info(f"[INFO] Task {task_id}: 驗證流程成功完成。")
+        profiling = profile_run(args.output, logger) if advanced_options.get('profile') else nullcontext()
+        with telemetry.TASKS_RUNNING.labels(kind='batch').track_inprogress(), profiling:
+            if advanced_options.get('sweep_targets'):
+                run_sweep(config, logger, args, advanced_options['sweep_targets'], web_mode=True)
+            elif advanced_options.get('excel_files'):
+                run_batch_verification(config, logger, args, advanced_options['excel_files'], web_mode=True)
+            else:
+                run_verification(config, logger, args, web_mode=True)
+        # 驗證流程已經在 main.py 中處理了檔案儲存 (取消時為部分結果)，這裡只預先壓縮文字檔供下載使用
+        try:
+            precompress_artifacts(args.output)
+        except OSError as e:
+            logger.warning(f"[WARNING] Task {task_id}: 預先壓縮輸出檔案失敗: {e}")
+        if get_control(task_id).cancelled:
+            tasks[task_id]['status'] = 'cancelled'
+            logger.warning(f"[WARNING] Task {task_id}: 驗證流程已取消，已儲存部分結果。")
+        else:
+            tasks[task_id]['status'] = 'completed'
+            logger.info(f"[INFO] Task {task_id}: 驗證流程成功完成。")
+            
+            logger.info(f"[INFO] Task {task_id}: 驗證流程成功完成。")
+    except TaskCancelled:
+        tasks[task_id]['status'] = 'cancelled'
+        logger.warning(f"[WARNING] Task {task_id}: 驗證流程已取消。")
     except Exception as e:
         logger.error(f"[ERROR] Task {task_id}: 驗證流程發生錯誤: {e}", exc_info=True)
         tasks[task_id]['status'] = 'error'
     finally:
+        telemetry.TASKS_FINISHED.labels(kind='batch', status=tasks[task_id]['status']).inc()
+        telemetry.TASK_DURATION_SECONDS.labels(kind='batch').observe(time.time() - tasks[task_id]['created_time'])
+        remove_control(task_id)
         # 發送結束信號
         log_queue.put("<<TASK_DONE>>")
+        task_lifecycle.finish(task_id)
 
 @app.route('/api/verify', methods=['POST'])
 def verify():
     """處理 Excel 檔案驗證請求"""
+    task_id = None
     try:
         # 檢查必要欄位
         if 'workspace' not in request.form:
             return jsonify({"error": "缺少工作區名稱"}), 400
         
-        if 'excel_file' not in request.files:
+        if 'excel_file' not in request.files and 'upload_id' not in request.form:
             return jsonify({"error": "缺少 Excel 檔案"}), 400
         
         workspace = request.form['workspace']
-        excel_file = request.files['excel_file']
+        # 問答集驗證的優先等級 (batch 或 background)，interactive 保留給單筆驗證
+        priority = request.form.get('priority', '').strip() or PRIORITY_BATCH
+        if priority not in (PRIORITY_BATCH, PRIORITY_BACKGROUND):
+            return jsonify({"error": f"不支援的優先等級: {priority}"}), 400
+        # 可一次上傳多個 Excel 檔案或 zip 壓縮檔，於同一個任務中批次驗證
+        excel_files = [f for f in request.files.getlist('excel_file') if f.filename]
+        # 以分段上傳 (/api/uploads) 完成的檔案以 upload_id 指定，可與一般上傳的檔案混用
+        for upload_id in request.form.getlist('upload_id'):
+            try:
+                upload = upload_store.get(upload_id)
+            except KeyError:
+                return jsonify({"error": f"找不到上傳的檔案: {upload_id}"}), 400
+            if not upload.completed:
+                return jsonify({"error": f"檔案尚未上傳完成: {upload.filename}"}), 400
+            excel_files.append(upload)
         
-        if excel_file.filename == '':
+        if not excel_files:
             return jsonify({"error": "未選擇檔案"}), 400
         
+        for excel_file in excel_files:
+            if not (is_excel_file(excel_file.filename) or is_archive_file(excel_file.filename)):
+                return jsonify({"error": f"不支援的檔案格式: {excel_file.filename}"}), 400
+        
+        batch_mode = len(excel_files) > 1 or is_archive_file(excel_files[0].filename)
+        
+        # 多工作區比較模式：sweep_workspaces (逗號或換行分隔) 與 sweep_variants (JSON 陣列)
+        sweep_targets = None
+        sweep_workspaces = [w.strip() for w in re.split(r'[,\n]', request.form.get('sweep_workspaces', '')) if w.strip()]
+        sweep_variants_raw = request.form.get('sweep_variants', '').strip()
+        if sweep_workspaces or sweep_variants_raw:
+            try:
+                sweep_variants = json.loads(sweep_variants_raw) if sweep_variants_raw else None
+                if sweep_variants is not None and not isinstance(sweep_variants, list):
+                    raise ValueError("sweep_variants 必須是 JSON 陣列")
+                sweep_targets = build_sweep_targets(
+                    workspace, [workspace] + sweep_workspaces if sweep_workspaces else None, sweep_variants
+                )
+            except (ValueError, TypeError) as e:
+                return jsonify({"error": f"比較目標設定錯誤: {e}"}), 400
+            if batch_mode:
+                return jsonify({"error": "多工作區比較模式只支援單一 Excel 檔案"}), 400
+        
         # 生成任務 ID
         task_id = str(uuid.uuid4())
         
@@ -122,9 +244,40 @@ def verify():
         os.makedirs(task_dir, exist_ok=True)
         
         # 儲存上傳的檔案
-        filename = secure_filename(excel_file.filename)
-        excel_path = os.path.join(UPLOAD_FOLDER, f"{task_id}_{filename}")
-        excel_file.save(excel_path)
+        excel_paths = None
+        if batch_mode:
+            try:
+                excel_paths = save_batch_uploads(excel_files, os.path.join(UPLOAD_FOLDER, task_id))
+            except ValueError as e:
+                shutil.rmtree(task_dir, ignore_errors=True)
+                shutil.rmtree(os.path.join(UPLOAD_FOLDER, task_id), ignore_errors=True)
+                return jsonify({"error": str(e)}), 400
+            excel_path = excel_paths[0]
+        else:
+            filename = secure_filename(excel_files[0].filename)
+            # secure_filename 會移除非 ASCII 字元，中文檔名可能因此失去副檔名
+            if not is_excel_file(filename):
+                filename = f"workbook{os.path.splitext(excel_files[0].filename)[1].lower()}"
+            excel_path = os.path.join(UPLOAD_FOLDER, f"{task_id}_{filename}")
+            excel_files[0].save(excel_path)
+        for excel_file in excel_files:
+            if isinstance(excel_file, UploadSession):
+                upload_store.remove(excel_file.upload_id)
+        
+        # 排入佇列前以唯讀方式快速檢查所有檔案並計算問答對數量，無效的檔案立即拒絕
+        try:
+            qa_pair_counts = {
+                os.path.basename(path): sum(prescan_qa_file(path, app_logger).values())
+                for path in (excel_paths or [excel_path])
+            }
+        except ValueError as e:
+            shutil.rmtree(task_dir, ignore_errors=True)
+            if excel_paths:
+                shutil.rmtree(os.path.join(UPLOAD_FOLDER, task_id), ignore_errors=True)
+            elif os.path.exists(excel_path):
+                os.remove(excel_path)
+            return jsonify({"error": str(e)}), 400
+        total_qa_pairs = sum(qa_pair_counts.values())
         
         # 建立任務狀態追蹤
         tasks[task_id] = {
@@ -132,9 +285,12 @@ def verify():
             'queue': queue.Queue(),
             'created_time': time.time()
         }
+        task_lifecycle.track(task_id, task_dir, os.path.join(UPLOAD_FOLDER, task_id) if excel_paths else excel_path)
+        register_control(task_id)
         
         # 載入配置
         config = Config.load()
+        config.api.priority = priority
         
         # 解析進階選項
         advanced_options = {}
@@ -146,6 +302,12 @@ def verify():
             advanced_options['model'] = request.form['model']
         if 'similarity_threshold' in request.form and request.form['similarity_threshold']:
             advanced_options['similarity_threshold'] = request.form['similarity_threshold']
+        if request.form.get('profile', '').lower() in ('1', 'true', 'on', 'yes'):
+            advanced_options['profile'] = True
+        if sweep_targets:
+            advanced_options['sweep_targets'] = sweep_targets
+        if excel_paths:
+            advanced_options['excel_files'] = excel_paths
         
         # 建立參數物件
         args = argparse.Namespace()
@@ -157,6 +319,7 @@ def verify():
         
         # 建立任務專用的 logger
         task_logger = Logger(task_id, log_queue=tasks[task_id]['queue'])
+        tasks[task_id]['logger'] = task_logger
         
         # 在背景執行緒中執行驗證
         thread = threading.Thread(
@@ -165,17 +328,108 @@ def verify():
         )
         thread.daemon = True
         thread.start()
+        telemetry.TASKS_STARTED.labels(kind='batch').inc()
         
-        app_logger.info(f"[INFO] Task {task_id}: 已啟動 Excel 驗證任務")
-        return jsonify({"task_id": task_id, "message": "驗證任務已啟動"})
+        if excel_paths:
+            app_logger.info(f"[INFO] Task {task_id}: 已啟動多檔案批次驗證任務 ({len(excel_paths)} 個檔案、{total_qa_pairs} 個問答對)")
+            return jsonify({"task_id": task_id, "message": "驗證任務已啟動", "files": [os.path.basename(p) for p in excel_paths],
+                            "qa_pairs": total_qa_pairs, "qa_pairs_per_file": qa_pair_counts})
+        app_logger.info(f"[INFO] Task {task_id}: 已啟動 Excel 驗證任務 ({total_qa_pairs} 個問答對)")
+        return jsonify({"task_id": task_id, "message": "驗證任務已啟動", "qa_pairs": total_qa_pairs})
         
     except Exception as e:
         app_logger.error(f"[ERROR] 驗證請求處理錯誤: {e}", exc_info=True)
+        if task_id in tasks and tasks[task_id]['status'] == 'pending':
+            # 任務未能啟動
+            tasks[task_id]['status'] = 'error'
+            remove_control(task_id)
+            task_lifecycle.finish(task_id)
         return jsonify({"error": f"處理請求時發生錯誤: {str(e)}"}), 500
 
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """
+    建立分段上傳工作階段
+
+    請求內容為 JSON：{filename, size?, sha256?}。之後以 PUT /api/uploads/<upload_id> 依序傳送檔案的各段
+    (Content-Range: bytes start-end/total)，傳送完畢後呼叫 POST /api/uploads/<upload_id>/complete，
+    再將 upload_id 填入 /api/verify 的表單。
+    """
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '').strip()
+    if not filename:
+        return jsonify({"error": "缺少檔案名稱"}), 400
+    if not (is_excel_file(filename) or is_archive_file(filename)):
+        return jsonify({"error": f"不支援的檔案格式: {filename}"}), 400
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or isinstance(size, bool)):
+        return jsonify({"error": "size 必須是整數"}), 400
+
+    upload_store.cleanup_expired()
+    try:
+        upload = upload_store.create(os.path.basename(filename), size, data.get('sha256'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+    app_logger.info(f"[INFO] 建立分段上傳 {upload.upload_id}: {upload.filename} ({size if size is not None else '未知'} bytes)")
+    return jsonify({**upload.to_dict(), "chunk_size": UPLOAD_CHUNK_SIZE}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id: str):
+    """查詢上傳進度 (received 為已接收的位元組數，續傳時從此位置開始)"""
+    try:
+        return jsonify(upload_store.get(upload_id).to_dict())
+    except KeyError:
+        return jsonify({"error": "找不到上傳或已過期"}), 404
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def append_upload(upload_id: str):
+    """傳送檔案的一段，請求內容直接串流寫入磁碟 (起始位置以 Content-Range 或 ?offset= 指定)"""
+    try:
+        offset = parse_content_range(request.headers.get('Content-Range'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if offset is None:
+        offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "缺少 Content-Range 標頭或 offset 參數"}), 400
+
+    try:
+        upload = upload_store.append(upload_id, offset, request.stream)
+    except KeyError:
+        return jsonify({"error": "找不到上傳或已過期"}), 404
+    except UploadOffsetError as e:
+        # 用戶端應從 received 重新傳送
+        return jsonify({"error": str(e), "received": e.offset}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(upload.to_dict())
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id: str):
+    """結束上傳，核對檔案大小與 SHA-256"""
+    try:
+        upload = upload_store.complete(upload_id)
+    except KeyError:
+        return jsonify({"error": "找不到上傳或已過期"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    app_logger.info(f"[INFO] 分段上傳完成 {upload.upload_id}: {upload.filename} ({upload.size} bytes, sha256 {upload.sha256})")
+    return jsonify(upload.to_dict())
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id: str):
+    """取消上傳並刪除已接收的內容"""
+    try:
+        upload_store.get(upload_id)
+    except KeyError:
+        return jsonify({"error": "找不到上傳或已過期"}), 404
+    upload_store.remove(upload_id)
+    return jsonify({"upload_id": upload_id, "deleted": True})
+
 @app.route('/api/verify_single', methods=['POST'])
 def verify_single():
     """處理單筆文字驗證請求"""
+    task_id = None
     try:
         # 檢查必要欄位
         if 'workspace' not in request.form:
@@ -204,9 +458,12 @@ def verify_single():
             'queue': queue.Queue(),
             'created_time': time.time()
         }
+        task_lifecycle.track(task_id, task_dir, os.path.join(UPLOAD_FOLDER, f"{task_id}_single_verification.xlsx"))
+        register_control(task_id)
         
-        # 載入配置
+        # 載入配置 (單筆驗證以 interactive 等級排在批次任務之前)
         config = Config.load()
+        config.api.priority = PRIORITY_INTERACTIVE
         
         # 解析進階選項
         advanced_options = {}
@@ -221,6 +478,7 @@ def verify_single():
         
         # 建立任務專用的 logger
         task_logger = Logger(task_id, log_queue=tasks[task_id]['queue'])
+        tasks[task_id]['logger'] = task_logger
         
         # 在背景執行緒中執行單筆驗證
         thread = threading.Thread(
@@ -229,14 +487,243 @@ def verify_single():
         )
         thread.daemon = True
         thread.start()
+        telemetry.TASKS_STARTED.labels(kind='single').inc()
         
         app_logger.info(f"[INFO] Task {task_id}: 已啟動單筆文字驗證任務")
         return jsonify({"task_id": task_id, "message": "驗證任務已啟動"})
         
     except Exception as e:
         app_logger.error(f"[ERROR] 單筆驗證請求處理錯誤: {e}", exc_info=True)
+        if task_id in tasks and tasks[task_id]['status'] == 'pending':
+            # 任務未能啟動
+            tasks[task_id]['status'] = 'error'
+            remove_control(task_id)
+            task_lifecycle.finish(task_id)
         return jsonify({"error": f"處理請求時發生錯誤: {str(e)}"}), 500
 
+@app.route('/api/verify_single_fast', methods=['POST'])
+def verify_single_fast():
+    """
+    快速單筆驗證：在同一個請求內取得 LLM 回答並評分，以 JSON 回傳結果
+
+    不建立 Excel、不產生圖表，也不需要透過 SSE 輪詢；評分模型、HTTP 連線、API 金鑰驗證與工作區 slug 皆重複使用快取。
+    請求內容為 JSON：workspace、question、standard_answer，以及選用的 api_url、api_key、model、
+    similarity_threshold 與 artifacts (true 時同時產生 Excel 與圖表)。
+    結果保留在任務狀態中，之後可透過 /api/single_result/<task_id>/artifacts 產生輸出檔案。
+    """
+    data = request.get_json(silent=True) or {}
+    workspace = (data.get('workspace') or '').strip()
+    question = (data.get('question') or '').strip()
+    standard_answer = (data.get('standard_answer') or '').strip()
+    if not workspace:
+        return jsonify({"error": "缺少工作區名稱"}), 400
+    if not question:
+        return jsonify({"error": "缺少問題內容"}), 400
+    if not standard_answer:
+        return jsonify({"error": "缺少標準答案"}), 400
+    similarity_threshold = None
+    if data.get('similarity_threshold') not in (None, ''):
+        try:
+            similarity_threshold = float(data['similarity_threshold'])
+        except (TypeError, ValueError):
+            return jsonify({"error": f"相似度閾值必須是數字: {data['similarity_threshold']}"}), 400
+
+    task_id = str(uuid.uuid4())
+    start_time = time.time()
+    tasks[task_id] = {'status': 'running', 'created_time': start_time}
+    task_lifecycle.track(task_id, os.path.join(OUTPUT_FOLDER, task_id))
+    telemetry.TASKS_STARTED.labels(kind='single_fast').inc()
+    try:
+        config = Config.load()
+        config.api.priority = PRIORITY_INTERACTIVE
+        if data.get('api_url'):
+            config.api.base_url = data['api_url']
+        if data.get('api_key'):
+            config.api.api_key = data['api_key']
+        if data.get('model'):
+            config.workspace.model = data['model']
+        if similarity_threshold is not None:
+            config.analyzer.similarity_threshold = similarity_threshold
+
+        with telemetry.TASKS_RUNNING.labels(kind='single_fast').track_inprogress():
+            system = QAVerificationSystem(config, app_logger, session=fast_path_session, task_id=task_id)
+            if not system.validate_api_key():
+                tasks[task_id]['status'] = 'error'
+                return jsonify({"error": "API 金鑰無效"}), 401
+
+            workspace_slug = system.get_workspace_slug(workspace) or system.create_workspace(workspace)
+            if not workspace_slug:
+                tasks[task_id]['status'] = 'error'
+                return jsonify({"error": f"無法獲取或創建工作區: {workspace}"}), 502
+
+            chat_start = time.perf_counter()
+            answer = system.get_llm_answer(workspace_slug, question)
+            chat_seconds = time.perf_counter() - chat_start
+            if not answer:
+                tasks[task_id]['status'] = 'error'
+                return jsonify({"error": "無法從 LLM 獲取回答"}), 502
+            llm_response, chat_stats = answer
+
+            scoring_start = time.perf_counter()
+            similarity_scores = system.score_pairs([llm_response], [standard_answer])[0]
+            scoring_seconds = time.perf_counter() - scoring_start
+
+        pass_metric = config.analyzer.pass_metric
+        result = {
+            "task_id": task_id,
+            "question": question,
+            "standard_answer": standard_answer,
+            "llm_response": llm_response,
+            "similarity_scores": similarity_scores,
+            "score_headers": dict(zip(similarity_scores, metrics.score_headers(similarity_scores))),
+            "pass_metric": pass_metric,
+            "threshold": config.analyzer.similarity_threshold,
+            "passed": metrics.is_passed(similarity_scores, pass_metric, config.analyzer.similarity_threshold),
+            "chat_stats": chat_stats,
+            "timings": {"chat_seconds": round(chat_seconds, 4), "scoring_seconds": round(scoring_seconds, 4)}
+        }
+        tasks[task_id]['single_result'] = result
+        if data.get('artifacts'):
+            result['files'] = write_single_artifacts(config, app_logger, result, os.path.join(OUTPUT_FOLDER, task_id))
+        tasks[task_id]['status'] = 'completed'
+        return jsonify(result)
+
+    except Exception as e:
+        tasks[task_id]['status'] = 'error'
+        app_logger.error(f"[ERROR] 快速單筆驗證發生錯誤: {e}", exc_info=True)
+        return jsonify({"error": f"處理請求時發生錯誤: {str(e)}"}), 500
+    finally:
+        telemetry.TASKS_FINISHED.labels(kind='single_fast', status=tasks[task_id]['status']).inc()
+        telemetry.TASK_DURATION_SECONDS.labels(kind='single_fast').observe(time.time() - start_time)
+        task_lifecycle.finish(task_id)
+
+def iter_bulk_pairs(body_stream, is_json_array: bool):
+    """
+    解析批量驗證的請求內容，逐筆產生 (問題, 標準答案)
+
+    Args:
+        body_stream: 請求內容的串流
+        is_json_array (bool): 內容為 JSON 陣列 (否則為每行一個 JSON 物件的 NDJSON，逐行讀取)
+
+    Raises:
+        ValueError: 內容不是合法的 JSON
+    """
+    if is_json_array:
+        items = json.load(body_stream)
+        if not isinstance(items, list):
+            raise ValueError("JSON 內容必須是陣列")
+        for item in items:
+            yield as_pair(item)
+        return
+    for line_number, line in enumerate(body_stream, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield as_pair(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {line_number} 行不是合法的 JSON: {e}")
+
+def write_bulk_results_excel(path: str, results: List[dict], score_keys: List[str]):
+    """將批量驗證結果依輸入順序寫成 Excel"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "批量驗證"
+    headers = ['編號', '問題', '標準答案', 'LLM 回答', *metrics.score_headers(score_keys), '錯誤']
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+    for result in sorted(results, key=lambda r: r['index']):
+        scores = result.get('similarity_scores') or {}
+        ws.append([result['index'], result['question'], result['standard_answer'], result.get('llm_response'),
+                   *(scores.get(key) for key in score_keys), result.get('error')])
+    wb.save(path)
+
+@app.route('/api/verify_bulk', methods=['POST'])
+def verify_bulk():
+    """
+    批量驗證 API (適合 CI 整合)
+
+    請求內容為 {question, answer} 的 JSON 陣列 (Content-Type: application/json) 或 NDJSON 串流，
+    工作區以查詢參數 workspace 指定。問題以與 Excel 驗證相同的並行聊天與批次評分流程處理，
+    結果依完成順序以 NDJSON 串流回傳，每行附上輸入的 index，最後一行為摘要。
+    查詢參數 excel=true 時另將結果依輸入順序寫成 Excel (路徑列在摘要中)；
+    priority=background 時以最低的優先等級執行 (預設為 batch)。
+    可用 X-API-URL 與 X-API-Key 標頭覆寫 AnythingLLM 位址與 API 金鑰。
+    """
+    workspace = (request.args.get('workspace') or '').strip()
+    if not workspace:
+        return jsonify({"error": "缺少工作區名稱"}), 400
+    write_excel = request.args.get('excel', '').lower() in ('1', 'true', 'yes')
+    priority = request.args.get('priority') or PRIORITY_BATCH
+    if priority not in (PRIORITY_BATCH, PRIORITY_BACKGROUND):
+        return jsonify({"error": f"不支援的優先等級: {priority}"}), 400
+
+    config = Config.load()
+    config.api.priority = priority
+    if request.headers.get('X-API-URL'):
+        config.api.base_url = request.headers['X-API-URL']
+    if request.headers.get('X-API-Key'):
+        config.api.api_key = request.headers['X-API-Key']
+
+    task_id = str(uuid.uuid4())
+    system = QAVerificationSystem(config, app_logger, session=fast_path_session, task_id=task_id)
+    if not system.validate_api_key():
+        return jsonify({"error": "API 金鑰無效"}), 401
+    workspace_slug = system.get_workspace_slug(workspace) or system.create_workspace(workspace)
+    if not workspace_slug:
+        return jsonify({"error": f"無法獲取或創建工作區: {workspace}"}), 502
+
+    is_json_array = request.mimetype == 'application/json'
+    body_stream = request.stream if is_json_array else (line.decode('utf-8') for line in request.stream)
+    tasks[task_id] = {'status': 'running', 'created_time': time.time()}
+    task_lifecycle.track(task_id, os.path.join(OUTPUT_FOLDER, task_id))
+    telemetry.TASKS_STARTED.labels(kind='bulk').inc()
+    app_logger.info(f"[INFO] Task {task_id}: 已啟動批量驗證 (工作區: {workspace})")
+
+    def generate():
+        summary = {'task_id': task_id, 'total': 0, 'passed': 0, 'failed': 0, 'errors': 0}
+        collected = [] if write_excel else None
+        # Excel 的分數欄位依設定的指標決定，所有問題都失敗時欄位仍維持一致
+        score_keys = metrics.output_columns(config.analyzer.metrics, config.analyzer.cascade)
+        try:
+            with telemetry.TASKS_RUNNING.labels(kind='bulk').track_inprogress():
+                for result in system.verify_stream(workspace_slug, iter_bulk_pairs(body_stream, is_json_array)):
+                    summary['total'] += 1
+                    if 'error' in result:
+                        summary['errors'] += 1
+                    else:
+                        summary['passed' if result['passed'] else 'failed'] += 1
+                    if collected is not None:
+                        collected.append({key: result.get(key) for key in
+                                          ('index', 'question', 'standard_answer', 'llm_response', 'similarity_scores', 'error')})
+                    yield json.dumps(result, ensure_ascii=False) + '\n'
+            summary['scoring'] = system.scoring_stats.as_dict()
+            if collected is not None:
+                output_dir = os.path.join(OUTPUT_FOLDER, task_id)
+                os.makedirs(output_dir, exist_ok=True)
+                write_bulk_results_excel(os.path.join(output_dir, 'bulk_results.xlsx'), collected, score_keys)
+                summary['files'] = ['bulk_results.xlsx']
+            tasks[task_id]['status'] = 'completed'
+        except ValueError as e:
+            tasks[task_id]['status'] = 'error'
+            summary['error'] = str(e)
+        except Exception as e:
+            tasks[task_id]['status'] = 'error'
+            app_logger.error(f"[ERROR] Task {task_id}: 批量驗證發生錯誤: {e}", exc_info=True)
+            summary['error'] = f"處理請求時發生錯誤: {e}"
+        finally:
+            if tasks[task_id]['status'] == 'running':
+                # 用戶端提前中斷連線
+                tasks[task_id]['status'] = 'cancelled'
+            telemetry.TASKS_FINISHED.labels(kind='bulk', status=tasks[task_id]['status']).inc()
+            telemetry.TASK_DURATION_SECONDS.labels(kind='bulk').observe(time.time() - tasks[task_id]['created_time'])
+            task_lifecycle.finish(task_id)
+        yield json.dumps({'summary': summary}, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 def run_single_verification_threaded(task_id: str, config: Config, logger, workspace: str, question: str, standard_answer: str, advanced_options: dict):
     """在背景執行緒中運行的單筆驗證包裝函式"""
     log_queue = tasks[task_id]['queue']
@@ -264,7 +751,9 @@ def run_single_verification_threaded(task_id: str, config: Config, logger, works
         
         # 建立臨時的 Excel 檔案
         temp_excel_path = os.path.join(UPLOAD_FOLDER, f"{task_id}_single_verification.xlsx")
-        create_single_verification_excel(temp_excel_path, question, standard_answer)
+        create_single_verification_excel(temp_excel_path, question, standard_answer,
+                                         metrics.score_headers(metrics.output_columns(config.analyzer.metrics,
+                                                                                      config.analyzer.cascade)))
         
         # 建立參數物件
         args = argparse.Namespace()
@@ -274,7 +763,8 @@ def run_single_verification_threaded(task_id: str, config: Config, logger, works
         args.verbose = True
         
         # 執行驗證並獲取結果
-        result = run_single_verification_with_result(config, logger, args, question, standard_answer, web_mode=True)
+        with telemetry.TASKS_RUNNING.labels(kind='single').track_inprogress():
+            result = run_single_verification_with_result(config, logger, args, question, standard_answer, web_mode=True)
         
         # 儲存結果到任務狀態中
         if result:
@@ -282,16 +772,26 @@ def run_single_verification_threaded(task_id: str, config: Config, logger, works
             tasks[task_id]['status'] = 'completed'
             logger.info(f"Task {task_id}: 單筆驗證流程成功完成。")
             logger.info(f"Task {task_id}: 結果已儲存到記憶體中: {result}")
+        elif get_control(task_id).cancelled:
+            tasks[task_id]['status'] = 'cancelled'
+            logger.warning(f"Task {task_id}: 單筆驗證流程已取消。")
         else:
             tasks[task_id]['status'] = 'error'
             logger.error(f"Task {task_id}: 單筆驗證流程失敗。")
             
+    except TaskCancelled:
+        tasks[task_id]['status'] = 'cancelled'
+        logger.warning(f"Task {task_id}: 單筆驗證流程已取消。")
     except Exception as e:
         logger.error(f"Task {task_id}: 單筆驗證流程發生錯誤: {e}", exc_info=True)
         tasks[task_id]['status'] = 'error'
     finally:
+        telemetry.TASKS_FINISHED.labels(kind='single', status=tasks[task_id]['status']).inc()
+        telemetry.TASK_DURATION_SECONDS.labels(kind='single').observe(time.time() - tasks[task_id]['created_time'])
+        remove_control(task_id)
         # 發送結束信號
         log_queue.put("<<TASK_DONE>>")
+        task_lifecycle.finish(task_id)
 
 def run_single_verification_with_result(config: Config, logger, args: argparse.Namespace, question: str, standard_answer: str, web_mode: bool = False):
     """
@@ -312,7 +812,7 @@ def run_single_verification_with_result(config: Config, logger, args: argparse.N
     logger.info(f"工作區: {args.workspace}", progress=5, status="初始化...")
 
     # 直接在這裡實現單筆驗證邏輯，避免 Excel 檔案讀取問題
-    from main import QAVerificationSystem
+    from main import QAVerificationSystem, PartialResponseForwarder
     
     system = QAVerificationSystem(config, logger)
     
@@ -336,17 +836,17 @@ def run_single_verification_with_result(config: Config, logger, args: argparse.N
     try:
         logger.info("正在發送問題到 LLM...", progress=50, status="獲取 LLM 回答...")
         
-        response = system.send_chat_message(workspace_slug, question)
-        if response and 'textResponse' in response:
-            llm_response = response['textResponse']
-            # 清理<think></think>之間的文字
-            cleaned_llm_response = re.sub(r'<think>.*?</think>', '', llm_response, flags=re.DOTALL).strip()
+        forwarder = PartialResponseForwarder(logger)
+        answer = system.get_llm_answer(workspace_slug, question, on_partial=forwarder)
+        forwarder.flush()
+        if answer:
+            cleaned_llm_response, chat_stats = answer
+            if chat_stats.get('ttft') is not None:
+                logger.info(f"首個 token 延遲: {chat_stats['ttft']:.2f} 秒，生成速度: {chat_stats['tokens_per_second'] or 0:.1f} tokens/s")
             
             logger.info("正在計算相似度分數...", progress=70, status="計算相似度...")
             
-            similarity_scores = system.similarity_analyzer.calculate_similarity(
-                cleaned_llm_response, standard_answer
-            )
+            similarity_scores = system.score_pairs([cleaned_llm_response], [standard_answer])[0]
             
             logger.info(f"✅ 相似度分析完成", progress=80, status="生成報告...")
             
@@ -370,8 +870,9 @@ def run_single_verification_with_result(config: Config, logger, args: argparse.N
             try:
                 excel_handler = ExcelHandler(args.excel, logger)
                 # 將結果寫入 Excel
-                excel_handler.write_llm_response("單筆驗證", 0, cleaned_llm_response)
-                excel_handler.write_similarity_scores("單筆驗證", 0, similarity_scores)
+                # 第 1 列為標題，資料在第 2 列
+                excel_handler.write_llm_response("單筆驗證", 1, cleaned_llm_response)
+                excel_handler.write_similarity_scores("單筆驗證", 1, similarity_scores)
                 excel_handler.save_workbook(output_excel_path)
                 logger.info(f"💾 更新後的 Excel 檔案已儲存至: {output_excel_path}", progress=100, status="完成")
             except Exception as e:
@@ -384,7 +885,10 @@ def run_single_verification_with_result(config: Config, logger, args: argparse.N
                 "question": question,
                 "standard_answer": standard_answer,
                 "llm_response": cleaned_llm_response,
-                "similarity_scores": similarity_scores
+                "similarity_scores": similarity_scores,
+                "score_headers": dict(zip(similarity_scores, metrics.score_headers(similarity_scores))),
+                "pass_metric": config.analyzer.pass_metric,
+                "chat_stats": chat_stats
             }
             
         else:
@@ -395,17 +899,18 @@ def run_single_verification_with_result(config: Config, logger, args: argparse.N
         logger.error(f"❌ 相似度分析時發生錯誤: {e}", exc_info=True)
         return None
 
-def create_single_verification_excel(excel_path: str, question: str, standard_answer: str):
-    """建立單筆驗證用的 Excel 檔案"""
+def create_single_verification_excel(excel_path: str, question: str, standard_answer: str, score_headers: List[str]):
+    """建立單筆驗證用的 Excel 檔案 (分數欄位標題依啟用的指標產生)"""
     from openpyxl import Workbook
     from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
     
     wb = Workbook()
     ws = wb.active
     ws.title = "單筆驗證"
     
     # 設定標題 - 包含所有欄位
-    headers = ['問題', '標準答案', 'LLM 回答', 'BERT Score', '餘弦相似度']
+    headers = ['問題', '標準答案', 'LLM 回答', *score_headers]
     for col, header in enumerate(headers, 1):
         cell = ws.cell(row=1, column=col, value=header)
         cell.font = Font(bold=True, color="FFFFFF")
@@ -417,12 +922,34 @@ def create_single_verification_excel(excel_path: str, question: str, standard_an
     ws.cell(row=2, column=2, value=standard_answer)
     
     # 調整欄寬
-    for col in range(1, 6):  # 5 個欄位
-        ws.column_dimensions[chr(64 + col)].width = 40
+    for col in range(1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 40
     
     # 儲存檔案
     wb.save(excel_path)
 
+def write_single_artifacts(config: Config, logger, result: dict, output_dir: str) -> List[str]:
+    """
+    將單筆驗證結果寫成 Excel 與統計圖表 (與背景單筆驗證的輸出相同)
+
+    Returns:
+        List[str]: 產生的檔案名稱
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    similarity_scores = result['similarity_scores']
+    excel_path = os.path.join(output_dir, "single_verification.xlsx")
+    create_single_verification_excel(excel_path, result['question'], result['standard_answer'],
+                                     metrics.score_headers(similarity_scores))
+    excel_handler = ExcelHandler(excel_path, logger)
+    # 第 1 列為標題，資料在第 2 列
+    excel_handler.write_llm_response("單筆驗證", 1, result['llm_response'])
+    excel_handler.write_similarity_scores("單筆驗證", 1, similarity_scores)
+    excel_handler.save_workbook(excel_path)
+
+    analyzer = get_shared_analyzer(config.analyzer.model, config.analyzer.backend)
+    analyzer.generate_charts([similarity_scores], output_dir)
+    return sorted(os.listdir(output_dir))
+
 # --- Routes ---
 
 @app.route('/')
@@ -441,9 +968,6 @@ def index():
 @app.route('/stream/<task_id>')
 def stream(task_id: str):
     """此端點為客戶端提供 Server-Sent Events (SSE)"""
-    # 清理過期任務
-    cleanup_expired_tasks()
-    
     log_queue = tasks.get(task_id, {}).get('queue')
     if not log_queue:
         return Response("錯誤：找不到任務佇列或任務不存在。", status=404)
@@ -467,11 +991,17 @@ def stream(task_id: str):
                 elif task_status == 'error':
                     yield f"data: {json.dumps({'status': 'error', 'message': '任務執行失敗'})}\n\n"
                     break
+                elif task_status == 'cancelled':
+                    yield f"data: {json.dumps({'status': 'cancelled', 'message': '任務已取消'})}\n\n"
+                    break
                 
                 # 使用更短的超時時間，避免 Gunicorn 超時
                 message_str = log_queue.get(timeout=10)  # 10秒超時
                 if message_str == "<<TASK_DONE>>":
-                    yield f"data: {json.dumps({'status': 'completed', 'message': '任務已完成'})}\n\n"
+                    if tasks.get(task_id, {}).get('status') == 'cancelled':
+                        yield f"data: {json.dumps({'status': 'cancelled', 'message': '任務已取消'})}\n\n"
+                    else:
+                        yield f"data: {json.dumps({'status': 'completed', 'message': '任務已完成'})}\n\n"
                     break
                 
                 # 確保傳送給前端的永遠是標準的 JSON 格式
@@ -498,6 +1028,37 @@ def stream(task_id: str):
     
     return Response(event_stream(), mimetype='text/event-stream')
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """以 Prometheus 文字格式輸出系統監控指標"""
+    return Response(telemetry.generate_latest(), mimetype=telemetry.CONTENT_TYPE_LATEST)
+
+@app.route('/api/tasks/<task_id>/<action>', methods=['POST'])
+def control_task(task_id: str, action: str):
+    """
+    取消、暫停或繼續執行中的驗證任務 (action: cancel / pause / resume)
+
+    驗證流程在送出每個問題、上傳每個文件與每個評分批次之前檢查，已送出的請求會照常完成；
+    暫停中的任務不佔用聊天並行名額與速率限制的權杖，取消的任務會儲存已完成的部分結果。
+    """
+    if action not in ('cancel', 'pause', 'resume'):
+        return jsonify({"error": f"不支援的操作: {action}"}), 400
+    control = get_control(task_id)
+    if control is None or task_id not in tasks:
+        return jsonify({"error": "找不到執行中的任務"}), 404
+    task_logger = tasks[task_id].get('logger') or app_logger
+    if action == 'cancel':
+        control.cancel()
+        task_logger.warning("[WARNING] 已要求取消任務，等待進行中的請求完成後儲存部分結果...", status="正在取消...")
+    elif action == 'pause':
+        control.pause()
+        task_logger.info("[INFO] 任務已暫停，進行中的請求完成後不再送出新的請求", status="已暫停")
+    else:
+        control.resume()
+        task_logger.info("[INFO] 任務已繼續", status="已繼續")
+    app_logger.info(f"[INFO] Task {task_id}: {action}")
+    return jsonify({"task_id": task_id, "state": control.state})
+
 @app.route('/api/results/<task_id>')
 def get_results(task_id: str):
     """回傳指定任務的結果檔案列表"""
@@ -505,11 +1066,24 @@ def get_results(task_id: str):
     if not os.path.isdir(results_dir):
         return jsonify({"error": "找不到結果目錄"}), 404
 
-    files = []
-    for filename in os.listdir(results_dir):
-        files.append(filename)
-    
-    return jsonify(files)
+    # 多檔案批次驗證的結果位於子目錄中，回傳相對於任務目錄的路徑
+    return jsonify(list_artifacts(results_dir))
+
+@app.route('/api/results/<task_id>/bundle')
+def download_results_bundle(task_id: str):
+    """將任務的所有輸出 (結果檔、圖表、摘要) 即時打包為 zip 串流下載"""
+    results_dir = os.path.join(OUTPUT_FOLDER, task_id)
+    if not re.fullmatch(r'[\w-]+', task_id) or not os.path.isdir(results_dir):
+        return jsonify({"error": "找不到結果目錄"}), 404
+    files = list_artifacts(results_dir)
+    if not files:
+        return jsonify({"error": "沒有任何結果檔案"}), 404
+    entries = [(os.path.join(results_dir, *name.split('/')), name) for name in files]
+    return Response(
+        stream_with_context(iter_zip(entries)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=qa_results_{task_id}.zip'}
+    )
 
 @app.route('/api/single_result/<task_id>')
 def get_single_result(task_id: str):
@@ -533,10 +1107,10 @@ def get_single_result(task_id: str):
             "question": single_result.get("question", ""),
             "standard_answer": single_result.get("standard_answer", ""),
             "llm_response": single_result.get("llm_response", ""),
-            "similarity_scores": single_result.get("similarity_scores", {
-                "bert_score": 0,
-                "cosine_similarity": 0
-            })
+            "similarity_scores": single_result.get("similarity_scores", {}),
+            "score_headers": single_result.get("score_headers", {}),
+            "pass_metric": single_result.get("pass_metric", "cosine_similarity"),
+            "chat_stats": single_result.get("chat_stats", {})
         }
         
         app_logger.info(f"Task {task_id}: 回傳給前端的結果: {result}")
@@ -546,6 +1120,21 @@ def get_single_result(task_id: str):
         app_logger.error(f"獲取單筆結果時發生錯誤: {e}", exc_info=True)
         return jsonify({"error": f"獲取結果時發生錯誤: {str(e)}"}), 500
 
+@app.route('/api/single_result/<task_id>/artifacts', methods=['POST'])
+def create_single_result_artifacts(task_id: str):
+    """依已完成的單筆驗證結果產生 Excel 與統計圖表 (用於快速單筆驗證)"""
+    task_info = tasks.get(task_id)
+    if not task_info or 'single_result' not in task_info:
+        return jsonify({"error": "找不到指定的任務或結果不可用"}), 404
+    try:
+        files = write_single_artifacts(Config.load(), app_logger, task_info['single_result'],
+                                       os.path.join(OUTPUT_FOLDER, task_id))
+        task_lifecycle.refresh(task_id)
+        return jsonify({"task_id": task_id, "files": files})
+    except Exception as e:
+        app_logger.error(f"[ERROR] Task {task_id}: 產生單筆驗證輸出檔案時發生錯誤: {e}", exc_info=True)
+        return jsonify({"error": f"產生輸出檔案時發生錯誤: {str(e)}"}), 500
+
 @app.route('/api/download_single_result/<task_id>')
 def download_single_result(task_id: str):
     """下載單筆驗證的詳細報告"""
@@ -570,7 +1159,7 @@ def download_single_result(task_id: str):
                 return jsonify({"error": "找不到結果檔案"}), 404
         
         # 回傳 Excel 檔案供下載
-        return send_from_directory(
+        return send_artifact(
             os.path.dirname(excel_path),
             os.path.basename(excel_path),
             as_attachment=True,
@@ -596,7 +1185,7 @@ def preview_file(task_id: str, filename: str):
             # 注意：這裡回傳的是 HTML，而不是 JSON
             return f'<img src="/outputs/{task_id}/{filename}" style="max-width: 100%; height: auto;">'
         
-        elif file_ext == '.txt':
+        elif file_ext in ['.txt', '.folded']:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
             # 將純文字包在 <pre> 標籤中以保留格式
@@ -618,7 +1207,7 @@ def preview_file(task_id: str, filename: str):
 def serve_output_file(task_id: str, filename: str):
     """安全地提供輸出目錄中的檔案"""
     directory = os.path.join(os.getcwd(), OUTPUT_FOLDER, task_id)
-    return send_from_directory(directory, filename)
+    return send_artifact(directory, filename)
 
 @app.route('/api/validate_connection', methods=['POST'])
 def validate_connection():
@@ -675,15 +1264,20 @@ def get_workspaces():
         # 移除結尾的斜線以確保路徑正確
         workspaces_url = f"{api_url.rstrip('/')}/api/v1/workspaces"
         
-        response = requests.get(workspaces_url, headers=headers, timeout=10)
-        response.raise_for_status()
+        def load() -> WorkspaceDirectory:
+            response = requests.get(workspaces_url, headers=headers, timeout=10)
+            response.raise_for_status()
+            return WorkspaceDirectory(response.json().get('workspaces', []))
         
-        workspaces_data = response.json()
-        workspaces = workspaces_data.get('workspaces', [])
+        # 與驗證流程共用工作區快取 (依位址與金鑰)，重新整理頁面不需要每次下載
+        directory = workspace_cache.WORKSPACES.get_or_load(
+            workspace_cache.cache_key(api_url, api_key), load, Config.load().api.workspace_cache_ttl,
+            refresh=bool(data.get('refresh'))
+        )
         
         # 格式化工作區列表，包含 id、name 和 slug
         formatted_workspaces = []
-        for workspace in workspaces:
+        for workspace in directory.workspaces:
             formatted_workspaces.append({
                 'id': workspace.get('id'),
                 'name': workspace.get('name', '未命名工作區'),
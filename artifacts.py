@@ -0,0 +1,157 @@
+"""
+任務輸出檔案 (圖表、摘要、結果檔) 的下載
+- 以 ETag / Last-Modified 支援條件式請求 (304)，以 Range 支援續傳與部分下載
+- 文字檔 (CSV、TXT、JSONL 等) 在任務完成時預先壓縮為 .gz，用戶端接受 gzip 時直接傳送壓縮版本
+- 將任務的所有輸出即時打包為 zip 串流下載，不在記憶體或磁碟中暫存整個壓縮檔
+"""
+
+import gzip
+import io
+import mimetypes
+import os
+import shutil
+import zipfile
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from flask import Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+# 預先壓縮的文字檔類型 (圖片與 Excel 本身已壓縮)
+COMPRESSIBLE_EXTENSIONS = ('.csv', '.txt', '.json', '.jsonl', '.ndjson', '.folded', '.html', '.svg', '.log')
+PRECOMPRESSED_SUFFIX = '.gz'
+# 小於此大小的檔案不壓縮
+MIN_PRECOMPRESS_BYTES = 1024
+
+# 串流 zip 時每次讀取的大小
+_BLOCK_SIZE = 256 * 1024
+
+
+def is_compressible(filename: str) -> bool:
+    return filename.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def is_precompressed_variant(path: str) -> bool:
+    """是否為預先壓縮產生的 .gz 檔 (原始檔仍存在)"""
+    return (path.endswith(PRECOMPRESSED_SUFFIX) and is_compressible(path[:-len(PRECOMPRESSED_SUFFIX)])
+            and os.path.exists(path[:-len(PRECOMPRESSED_SUFFIX)]))
+
+
+def _variant_is_fresh(path: str, variant: str) -> bool:
+    try:
+        return os.path.getmtime(variant) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def precompress_artifacts(directory: str, min_size: int = MIN_PRECOMPRESS_BYTES) -> int:
+    """
+    將目錄 (含子目錄) 中的文字檔預先壓縮為 <檔名>.gz，已是最新的壓縮檔會略過
+
+    Returns:
+        int: 新產生的壓縮檔數量
+    """
+    created = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            variant = path + PRECOMPRESSED_SUFFIX
+            if not is_compressible(filename) or os.path.getsize(path) < min_size or _variant_is_fresh(path, variant):
+                continue
+            temp_path = variant + '.tmp'
+            with open(path, 'rb') as source, gzip.open(temp_path, 'wb', compresslevel=9) as target:
+                shutil.copyfileobj(source, target, _BLOCK_SIZE)
+            os.replace(temp_path, variant)
+            created += 1
+    return created
+
+
+def list_artifacts(directory: str) -> List[str]:
+    """目錄中所有輸出檔案相對於 directory 的路徑 (以 / 分隔，不含預先壓縮的版本)，依目錄與檔名排序"""
+    files = []
+    for root, dirs, filenames in os.walk(directory):
+        dirs.sort()
+        relative_root = os.path.relpath(root, directory)
+        for filename in sorted(filenames):
+            if is_precompressed_variant(os.path.join(root, filename)) or filename.endswith('.gz.tmp'):
+                continue
+            files.append(filename if relative_root == '.' else f"{relative_root}/{filename}".replace(os.sep, '/'))
+    return files
+
+
+def send_artifact(directory: str, filename: str, as_attachment: bool = False,
+                  download_name: Optional[str] = None) -> Response:
+    """
+    傳送輸出檔案，支援條件式請求 (ETag / Last-Modified)、Range 與預先壓縮的 gzip 版本
+
+    用戶端接受 gzip 且有最新的 .gz 版本時傳送壓縮內容 (Content-Encoding: gzip)，
+    此時 ETag 與 Range 皆對應壓縮後的內容。
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    name = download_name or os.path.basename(path)
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    compressible = is_compressible(path)
+    variant = path + PRECOMPRESSED_SUFFIX
+    use_variant = compressible and request.accept_encodings['gzip'] > 0 and _variant_is_fresh(path, variant)
+
+    response = send_file(variant if use_variant else path, mimetype=mimetype, as_attachment=as_attachment,
+                         download_name=name, conditional=True, etag=True)
+    if use_variant:
+        response.headers['Content-Encoding'] = 'gzip'
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    # 任務的輸出可能重新產生 (例如單筆驗證的報告)，每次使用前以 ETag 重新驗證
+    response.cache_control.no_cache = True
+    return response
+
+
+class _StreamBuffer(io.RawIOBase):
+    """zipfile 寫入的目標：累積寫入的內容，由產生器取出後送出 (不可 seek，zipfile 會改用資料描述區)"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: Deque[bytes] = deque()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries: List[Tuple[str, str]]) -> Iterator[bytes]:
+    """
+    即時產生 zip 的內容
+
+    Args:
+        entries (List[Tuple[str, str]]): (檔案路徑, 壓縮檔內的名稱)
+
+    Yields:
+        bytes: zip 內容，記憶體用量只與讀取區塊大小有關
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            # 文字檔壓縮，圖片、Excel 與已壓縮的檔案直接儲存
+            info.compress_type = zipfile.ZIP_DEFLATED if is_compressible(path) else zipfile.ZIP_STORED
+            # 無法回頭修改標頭，大檔案需預先使用 ZIP64
+            with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=info.file_size > 0x7FFFFFFF) as target:
+                for block in iter(lambda: source.read(_BLOCK_SIZE), b''):
+                    target.write(block)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+    # 最後的資料描述區與中央目錄
+    data = buffer.drain()
+    if data:
+        yield data
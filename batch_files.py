@@ -0,0 +1,265 @@
+"""
+多檔案批次驗證模組
+此模組讓一次提交多個 Excel 問答集 (或包含問答集的 zip 壓縮檔)，並在同一個任務中依序驗證。
+所有檔案共用 HTTP 連線、評分模型與工作區解析 (API 金鑰驗證與工作區搜尋只執行一次)，
+每個檔案的結果輸出至各自的子目錄，最後產生一份彙總摘要。
+"""
+
+import argparse
+import csv
+import glob
+import os
+import shutil
+import time
+import zipfile
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import Config
+from logger import Logger
+from main import QAVerificationSystem, prepare_workspace, verify_workbook
+from task_control import TaskCancelled
+import metrics
+import telemetry
+from tabular_handler import EXCEL_EXTENSIONS, TABULAR_EXTENSIONS
+ARCHIVE_EXTENSIONS = ('.zip',)
+
+# 解壓縮後的總大小上限，避免壓縮炸彈耗盡磁碟
+MAX_ARCHIVE_UNCOMPRESSED_BYTES = 500 * 1024 * 1024
+
+SUMMARY_CSV = 'batch_summary.csv'
+SUMMARY_TXT = 'batch_summary.txt'
+
+# 各檔案驗證所佔的進度範圍，剩餘部分用於彙總摘要
+_FILES_PROGRESS_RANGE = (30, 95)
+
+
+def is_excel_file(filename: str) -> bool:
+    """是否為支援的問答集檔案 (Excel、CSV、JSONL 或 Parquet，忽略 Office 的 ~$ 暫存檔)"""
+    name = os.path.basename(filename)
+    return name.lower().endswith(EXCEL_EXTENSIONS + TABULAR_EXTENSIONS) and not name.startswith('~$')
+
+
+def is_archive_file(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _unique_name(name: str, used: set) -> str:
+    stem, ext = os.path.splitext(name)
+    candidate, index = name, 2
+    while candidate.lower() in used:
+        candidate = f"{stem}_{index}{ext}"
+        index += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def extract_excel_archive(archive_path: str, extract_dir: str) -> List[str]:
+    """
+    解壓縮 zip 中的所有 Excel 檔案 (攤平目錄結構，同名檔案自動加上編號)
+
+    Args:
+        archive_path (str): zip 檔案路徑
+        extract_dir (str): 解壓縮目錄
+
+    Returns:
+        List[str]: 解壓縮後的 Excel 檔案路徑 (依壓縮檔內路徑排序)
+
+    Raises:
+        ValueError: 檔案不是有效的 zip、不含 Excel 檔案或解壓縮後超過大小上限
+    """
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile:
+        raise ValueError(f"'{os.path.basename(archive_path)}' 不是有效的 zip 檔案")
+
+    with archive:
+        members = sorted(
+            (info for info in archive.infolist()
+             if not info.is_dir() and '__MACOSX' not in info.filename and is_excel_file(info.filename)),
+            key=lambda info: info.filename
+        )
+        if not members:
+            raise ValueError(f"'{os.path.basename(archive_path)}' 中沒有任何 Excel 檔案")
+        if sum(info.file_size for info in members) > MAX_ARCHIVE_UNCOMPRESSED_BYTES:
+            raise ValueError(f"'{os.path.basename(archive_path)}' 解壓縮後超過 "
+                             f"{MAX_ARCHIVE_UNCOMPRESSED_BYTES // 1024 // 1024} MB 上限")
+
+        os.makedirs(extract_dir, exist_ok=True)
+        used = {name.lower() for name in os.listdir(extract_dir)}
+        paths = []
+        for info in members:
+            # 只取檔名，壓縮檔內的路徑 (包含 ../) 不會影響寫入位置
+            name = _unique_name(info.filename.replace('\\', '/').rsplit('/', 1)[-1], used)
+            path = os.path.join(extract_dir, name)
+            with archive.open(info) as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            paths.append(path)
+    return paths
+
+
+def expand_excel_inputs(paths: List[str], extract_dir: str) -> List[str]:
+    """
+    將輸入展開為 Excel 檔案列表：Excel 檔案直接使用，zip 解壓縮，目錄則取其中的 Excel 檔案
+
+    Raises:
+        ValueError: 輸入不存在、格式不支援或展開後沒有任何 Excel 檔案
+    """
+    excel_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            excel_paths.extend(sorted(p for p in glob.glob(os.path.join(path, '*')) if is_excel_file(p)))
+        elif not os.path.isfile(path):
+            raise ValueError(f"找不到檔案: {path}")
+        elif is_archive_file(path):
+            stem = os.path.splitext(os.path.basename(path))[0]
+            excel_paths.extend(extract_excel_archive(path, os.path.join(extract_dir, stem)))
+        elif is_excel_file(path):
+            excel_paths.append(path)
+        else:
+            raise ValueError(f"不支援的檔案格式: {os.path.basename(path)}")
+    if not excel_paths:
+        raise ValueError("沒有任何可驗證的 Excel 檔案")
+    return excel_paths
+
+
+def _summarize_file(name: str, output_subdir: str, total: int, scores: List[Dict[str, float]],
+                    chat_stats: List[Dict], elapsed: float, metric_names: List[str], pass_metric: str,
+                    threshold: float) -> Dict[str, Any]:
+    durations = [s['duration'] for s in chat_stats if s.get('duration') is not None]
+
+    def stat(values: np.ndarray) -> Optional[float]:
+        return round(float(np.mean(values)), 4) if values.size else None
+
+    summary = {
+        'file': name,
+        'output': output_subdir,
+        'status': 'completed',
+        'total': total,
+        'answered': len(scores),
+        'failed': total - len(scores),
+    }
+    for metric in metric_names:
+        summary[f'{metric}_mean'] = stat(np.array(metrics.metric_values(scores, metric)))
+    summary['pass_rate'] = stat(np.array([metrics.is_passed(s, pass_metric, threshold) for s in scores]))
+    summary['mean_latency'] = round(float(np.mean(durations)), 3) if durations else None
+    summary['elapsed_seconds'] = round(elapsed, 2)
+    return summary
+
+
+def _failed_summary(name: str, output_subdir: str, elapsed: float, metric_names: List[str]) -> Dict[str, Any]:
+    summary = {'file': name, 'output': output_subdir, 'status': 'error', 'total': 0, 'answered': 0, 'failed': 0}
+    summary.update({f'{metric}_mean': None for metric in metric_names})
+    summary.update({'pass_rate': None, 'mean_latency': None, 'elapsed_seconds': round(elapsed, 2)})
+    return summary
+
+
+def _write_summary(output_dir: str, summaries: List[Dict[str, Any]], all_scores: List[Dict[str, float]],
+                   metric_names: List[str], pass_metric: str, threshold: float):
+    fieldnames = list(summaries[0].keys())
+    with open(os.path.join(output_dir, SUMMARY_CSV), 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    total = sum(s['total'] for s in summaries)
+    with open(os.path.join(output_dir, SUMMARY_TXT), 'w', encoding='utf-8') as f:
+        f.write("多檔案批次驗證摘要\n")
+        f.write("=" * 50 + "\n\n")
+        f.write(f"檔案數量: {len(summaries)} (失敗 {sum(1 for s in summaries if s['status'] != 'completed')})\n")
+        f.write(f"問答對: {total} (成功 {len(all_scores)}，失敗 {total - len(all_scores)})\n")
+        f.write(f"合格標準: {metrics.get_metric(pass_metric).header} >= {threshold}\n")
+        if all_scores:
+            for metric in metric_names:
+                values = metrics.metric_values(all_scores, metric)
+                if values:
+                    f.write(f"平均 {metrics.get_metric(metric).header}: {np.mean(values):.4f}\n")
+            f.write(f"合格率: {np.mean([metrics.is_passed(s, pass_metric, threshold) for s in all_scores]):.2%}\n")
+        f.write("\n")
+        for summary in summaries:
+            f.write(f"{summary['file']} → {summary['output']}/\n")
+            f.write("-" * 30 + "\n")
+            for key in fieldnames[2:]:
+                f.write(f"{key}: {summary[key]}\n")
+            f.write("\n")
+
+
+def run_batch_verification(config: Config, logger: Logger, args: argparse.Namespace, excel_paths: List[str],
+                           web_mode: bool = False):
+    """
+    在同一個任務中依序驗證多個 Excel 檔案
+
+    API 金鑰驗證、工作區解析與參考文件上傳只執行一次，評分模型與 HTTP 連線由所有檔案共用。
+    每個檔案的結果 (Excel、圖表、串流統計) 輸出至 args.output/<檔名>/，
+    args.output 下另有所有問答對的彙總圖表與 batch_summary.csv / batch_summary.txt。
+
+    Args:
+        config (Config): 系統配置物件
+        logger (Logger): 日誌記錄器實例
+        args (argparse.Namespace): 命令列參數 (使用 workspace、directory 與 output)
+        excel_paths (List[str]): 要驗證的 Excel 檔案路徑
+        web_mode (bool): 是否為 Web 模式
+    """
+    logger.info(f"[START] 多檔案批次驗證啟動，共 {len(excel_paths)} 個檔案", progress=0, status="系統初始化中...")
+    logger.info(f"[INFO] 工作區: {args.workspace}", progress=5, status="載入配置...")
+
+    with telemetry.STAGE_SECONDS.labels(stage='init').time():
+        system = QAVerificationSystem(config, logger)
+
+    workspace_slug = prepare_workspace(system, args)
+    if not workspace_slug:
+        return
+
+    output_dir = args.output
+    os.makedirs(output_dir, exist_ok=True)
+    threshold = config.analyzer.similarity_threshold
+    pass_metric = config.analyzer.pass_metric
+    metric_names = system.metric_names
+    start, end = _FILES_PROGRESS_RANGE
+    span = (end - start) / len(excel_paths)
+
+    summaries: List[Dict[str, Any]] = []
+    all_scores: List[Dict[str, float]] = []
+    used_names = set()
+    for index, excel_path in enumerate(excel_paths):
+        if system.cancelled:
+            logger.warning(f"[WARNING] 任務已取消，略過其餘 {len(excel_paths) - index} 個檔案")
+            break
+        name = os.path.basename(excel_path)
+        output_subdir = _unique_name(os.path.splitext(name)[0], used_names)
+        logger.info(f"[INFO] 檔案 {index + 1}/{len(excel_paths)}: {name}",
+                    progress=start + span * index, status=f"驗證檔案 {index + 1}/{len(excel_paths)}: {name}")
+        file_start = time.perf_counter()
+        try:
+            total, scores = verify_workbook(
+                system, workspace_slug, excel_path, os.path.join(output_dir, output_subdir),
+                web_mode=web_mode, progress_range=(start + span * index, start + span * (index + 1))
+            )
+            summaries.append(_summarize_file(name, output_subdir, total, scores, system.chat_stats,
+                                             time.perf_counter() - file_start, metric_names, pass_metric, threshold))
+            all_scores.extend(scores)
+        except TaskCancelled:
+            logger.warning(f"[WARNING] 任務已取消，略過其餘 {len(excel_paths) - index} 個檔案")
+            break
+        except Exception as e:
+            # 單一檔案失敗 (例如格式錯誤) 不影響其他檔案
+            logger.error(f"[ERROR] 驗證檔案 '{name}' 時發生錯誤: {e}", exc_info=True)
+            summaries.append(_failed_summary(name, output_subdir, time.perf_counter() - file_start, metric_names))
+
+    # 彙總所有檔案的結果
+    logger.info("[INFO] 生成彙總摘要...", progress=end, status="生成彙總摘要...")
+    try:
+        if all_scores:
+            with telemetry.STAGE_SECONDS.labels(stage='charts').time():
+                system.similarity_analyzer.generate_charts(all_scores, output_dir)
+        _write_summary(output_dir, summaries, all_scores, metric_names, pass_metric, threshold)
+        logger.info(f"[SUCCESS] 彙總摘要已儲存至: {os.path.join(output_dir, SUMMARY_TXT)}")
+    except Exception as e:
+        logger.error(f"[ERROR] 生成彙總摘要時發生錯誤: {e}", exc_info=True)
+
+    failed_files = sum(1 for s in summaries if s['status'] != 'completed')
+    if failed_files:
+        logger.warning(f"[WARNING] {failed_files} 個檔案驗證失敗，詳見彙總摘要。")
+    logger.info(f"[COMPLETE] 多檔案批次驗證完成，共 {len(excel_paths)} 個檔案、{len(all_scores)} 個問答對",
+                progress=100, status="完成")
@@ -0,0 +1,149 @@
+"""
+評分批次排程模組
+LLM 回答的長度從十幾個字到數千字不等，若依原順序固定筆數組成批次，模型大部分的運算會浪費在填充 (padding) 上。
+此模組依 token 長度將待評分的 (回答, 標準答案) 排序分桶，在 token 預算內組成批次，
+評分後依原始順序還原結果，並統計填充效率。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+import telemetry
+
+R = TypeVar('R')
+
+# 中日韓文字以單字計，英文單字、數字與標點各計一個 token (近似 BERT 系列 tokenizer 的切分結果)
+_TOKEN_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]|[A-Za-z]+|\d+|[^\sA-Za-z\d\u3400-\u9fff\uf900-\ufaff]')
+
+# [CLS] 與 [SEP]
+_SPECIAL_TOKENS = 2
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文字經 tokenizer 切分後的 token 數 (包含特殊 token)"""
+    return len(_TOKEN_PATTERN.findall(text)) + _SPECIAL_TOKENS
+
+
+def token_spans(text: str) -> List[Tuple[int, int]]:
+    """以與 estimate_tokens 相同的規則切分文字，回傳每個 token 在原文中的 (起點, 終點)"""
+    return [match.span() for match in _TOKEN_PATTERN.finditer(text)]
+
+
+@dataclass
+class BatchStats:
+    """評分批次統計"""
+    batches: int = 0
+    pairs: int = 0
+    tokens: int = 0          # 實際內容的 token 數
+    padded_tokens: int = 0   # 填充到批次內最長長度後的 token 數
+
+    @property
+    def padding_efficiency(self) -> float:
+        """實際 token 佔填充後 token 的比例 (1.0 表示完全沒有填充)"""
+        return self.tokens / self.padded_tokens if self.padded_tokens else 1.0
+
+    def merge(self, other: 'BatchStats') -> 'BatchStats':
+        """累加另一次排程的統計 (例如同一次執行中的各個區塊)，返回自身"""
+        self.batches += other.batches
+        self.pairs += other.pairs
+        self.tokens += other.tokens
+        self.padded_tokens += other.padded_tokens
+        return self
+
+    def as_dict(self) -> dict:
+        return {
+            'batches': self.batches,
+            'pairs': self.pairs,
+            'tokens': self.tokens,
+            'padded_tokens': self.padded_tokens,
+            'padding_efficiency': round(self.padding_efficiency, 4),
+        }
+
+
+class LengthBucketScheduler:
+    """
+    依長度分桶的評分批次排程器
+
+    回答與標準答案在模型中各自填充到批次內的最長長度，因此一個批次的成本為
+    批次筆數 x (最長回答 + 最長標準答案)。排程器依長度排序後，在不超過 token 預算的前提下
+    盡量把相近長度的組合放在同一批次。
+    """
+
+    def __init__(self, token_budget: int = 16384, max_length: Optional[int] = 512,
+                 length_fn: Callable[[str], int] = estimate_tokens):
+        """
+        Args:
+            token_budget (int): 每個批次含填充的 token 上限 (單筆超過上限時獨立成一批)
+            max_length (Optional[int]): 模型的最大序列長度，超過的部分會被截斷，不計入成本；
+                長文模式下會切成多個視窗評分，此時為 None (不截斷)
+            length_fn (Callable[[str], int]): 計算文字 token 數的函式
+        """
+        self.token_budget = token_budget
+        self.max_length = max_length
+        self.length_fn = length_fn
+
+    def _lengths(self, texts: Sequence[str]) -> List[int]:
+        if self.max_length is None:
+            return [self.length_fn(text) for text in texts]
+        return [min(self.length_fn(text), self.max_length) for text in texts]
+
+    def plan(self, responses: Sequence[str], references: Sequence[str]) -> Tuple[List[List[int]], BatchStats]:
+        """
+        規劃批次
+
+        Returns:
+            Tuple[List[List[int]], BatchStats]: (每個批次包含的原始索引, 批次統計)
+        """
+        response_lengths = self._lengths(responses)
+        reference_lengths = self._lengths(references)
+        order = sorted(range(len(responses)),
+                       key=lambda i: (max(response_lengths[i], reference_lengths[i]), response_lengths[i] + reference_lengths[i]))
+
+        batches: List[List[int]] = []
+        stats = BatchStats(pairs=len(order))
+        batch: List[int] = []
+        max_response = max_reference = 0
+
+        def close_batch():
+            stats.batches += 1
+            stats.padded_tokens += len(batch) * (max_response + max_reference)
+            batches.append(batch)
+
+        for index in order:
+            new_response = max(max_response, response_lengths[index])
+            new_reference = max(max_reference, reference_lengths[index])
+            if batch and (len(batch) + 1) * (new_response + new_reference) > self.token_budget:
+                close_batch()
+                batch = []
+                new_response, new_reference = response_lengths[index], reference_lengths[index]
+            batch.append(index)
+            max_response, max_reference = new_response, new_reference
+            stats.tokens += response_lengths[index] + reference_lengths[index]
+        if batch:
+            close_batch()
+        return batches, stats
+
+    def run(self, responses: Sequence[str], references: Sequence[str],
+            score_fn: Callable[[List[str], List[str]], List[R]]) -> Tuple[List[R], BatchStats]:
+        """
+        依規劃的批次呼叫 score_fn，並依輸入順序回傳結果
+
+        Args:
+            responses (Sequence[str]): LLM 回答
+            references (Sequence[str]): 對應的標準答案
+            score_fn (Callable): 批次評分函式，接收 (回答列表, 標準答案列表) 並回傳同順序的結果
+
+        Returns:
+            Tuple[List[R], BatchStats]: (與輸入順序相同的結果, 批次統計)
+        """
+        batches, stats = self.plan(responses, references)
+        results: List[R] = [None] * len(responses)
+        for batch in batches:
+            batch_results = score_fn([responses[i] for i in batch], [references[i] for i in batch])
+            for index, result in zip(batch, batch_results):
+                results[index] = result
+        telemetry.SCORING_BATCHES.inc(stats.batches)
+        telemetry.SCORING_TOKENS.labels(kind='real').inc(stats.tokens)
+        telemetry.SCORING_TOKENS.labels(kind='padded').inc(stats.padded_tokens)
+        return results, stats
@@ -0,0 +1 @@
+"""以模擬 AnythingLLM 伺服器與合成資料進行的效能測試工具"""
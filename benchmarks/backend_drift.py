@@ -0,0 +1,141 @@
+"""
+評分模型推論後端比較
+以內附的評估資料集 (benchmarks/data/analyzer_eval.jsonl) 對每個推論後端評分，
+回報相對 fp32 基準的分數偏差、合格判定一致率與 CPU 評分吞吐量，並將結果存成 JSON。
+
+使用方式:
+    python -m benchmarks.backend_drift
+    python -m benchmarks.backend_drift --backends fp32 int8 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from similarity_analyzer import BACKENDS, SimilarityAnalyzer  # noqa: E402
+from benchmarks.run_benchmarks import RESULTS_DIR, _git_revision  # noqa: E402
+
+EVAL_SET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'analyzer_eval.jsonl')
+
+METRICS = ('bert_score', 'cosine_similarity')
+
+
+def load_eval_set(path: str = EVAL_SET_PATH) -> Tuple[List[str], List[str]]:
+    """讀取評估資料集，回傳 (回答, 標準答案)"""
+    responses, references = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                responses.append(item['response'])
+                references.append(item['reference'])
+    return responses, references
+
+
+def score_backend(analyzer: SimilarityAnalyzer, responses: List[str], references: List[str],
+                  repeat: int) -> Tuple[Dict[str, np.ndarray], float]:
+    """
+    以指定分析器重複評分 repeat 次 (先暖機一次)
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], float]: (各指標的分數, 平均每次評分秒數)
+    """
+    if repeat < 1:
+        raise ValueError(f"repeat 必須大於 0: {repeat}")
+    analyzer.calculate_similarity_batch(responses, references)
+    elapsed = 0.0
+    for _ in range(repeat):
+        # 清除標準答案快取，讓每次評分都包含完整的編碼成本
+        analyzer._reference_cache.clear()
+        start = time.perf_counter()
+        scores = analyzer.calculate_similarity_batch(responses, references)
+        elapsed += time.perf_counter() - start
+    return {metric: np.array([s[metric] for s in scores]) for metric in METRICS}, elapsed / repeat
+
+
+def compute_drift(baseline: Dict[str, np.ndarray], candidate: Dict[str, np.ndarray], threshold: float) -> Dict[str, Dict[str, float]]:
+    """計算各指標相對基準的偏差與合格判定一致率"""
+    drift = {}
+    for metric in METRICS:
+        diff = np.abs(candidate[metric] - baseline[metric])
+        drift[metric] = {
+            'max_abs_diff': round(float(diff.max()), 6),
+            'mean_abs_diff': round(float(diff.mean()), 6),
+            'pearson': round(float(np.corrcoef(baseline[metric], candidate[metric])[0, 1]), 6),
+            'decision_agreement': round(float(np.mean((baseline[metric] >= threshold) == (candidate[metric] >= threshold))), 4),
+        }
+    return drift
+
+
+def parse_arguments() -> argparse.Namespace:
+    config = Config()
+    parser = argparse.ArgumentParser(description="評分模型推論後端比較")
+    parser.add_argument("--backends", nargs='+', default=list(BACKENDS), choices=list(BACKENDS),
+                        help="要比較的推論後端 (fp32 一律作為基準)")
+    parser.add_argument("--model", default=config.analyzer.model, help="SentenceTransformer 模型名稱")
+    parser.add_argument("--eval-set", default=EVAL_SET_PATH, help="評估資料集 (JSONL，包含 response 與 reference)")
+    parser.add_argument("--threshold", type=float, default=config.analyzer.similarity_threshold,
+                        help="計算合格判定一致率時使用的閾值")
+    parser.add_argument("--repeat", type=int, default=3, help="每個後端的評分次數")
+    parser.add_argument("--output", type=str, default=None, help="結果 JSON 路徑 (預設: benchmarks/results/)")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat 必須大於 0")
+    return args
+
+
+def main_cli():
+    args = parse_arguments()
+    responses, references = load_eval_set(args.eval_set)
+    backends = ['fp32'] + [backend for backend in args.backends if backend != 'fp32']
+
+    results = []
+    baseline = baseline_seconds = None
+    for backend in backends:
+        analyzer = SimilarityAnalyzer(args.model, backend)
+        if analyzer.backend != backend:
+            print(f"[{backend}] 此環境不支援，已略過")
+            continue
+        scores, seconds = score_backend(analyzer, responses, references, args.repeat)
+        if baseline is None:
+            baseline, baseline_seconds = scores, seconds
+        result = {
+            'backend': backend,
+            'pairs_per_second': round(len(responses) / seconds, 3),
+            'speedup': round(baseline_seconds / seconds, 3),
+            'drift': compute_drift(baseline, scores, args.threshold),
+        }
+        results.append(result)
+        print(f"[{backend}] {result['pairs_per_second']} pairs/s (x{result['speedup']})")
+        for metric, drift in result['drift'].items():
+            print(f"    {metric:<18} max={drift['max_abs_diff']:.4f} mean={drift['mean_abs_diff']:.4f} "
+                  f"pearson={drift['pearson']:.4f} 判定一致率={drift['decision_agreement']:.2%}")
+        del analyzer
+
+    report = {
+        'revision': _git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'parameters': vars(args),
+        'pairs': len(responses),
+        'results': results,
+    }
+    output_path = args.output
+    if not output_path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output_path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['revision']}-backends.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"推論後端比較結果已儲存至: {output_path}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,317 @@
+"""
+模擬 AnythingLLM 伺服器
+此模組提供一個本機的 AnythingLLM API 替身，實作驗證系統會呼叫的端點，
+並可設定回應延遲、錯誤注入與回答長度，用於在沒有真實 LLM 的環境下進行效能測試。
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+_CHAT_PATH = re.compile(r'^/api/v1/workspace/(?P<slug>[^/]+)/chat$')
+_STREAM_CHAT_PATH = re.compile(r'^/api/v1/workspace/(?P<slug>[^/]+)/stream-chat$')
+_UPLOAD_PATH = re.compile(r'^/api/v1/workspace/(?P<slug>[^/]+)/upload$')
+
+# 用於產生回答內容的中文字元池，讓回答長度與 tokenizer 行為接近真實資料
+_FILLER = "系統驗證回答內容包含機器學習模型推論資料處理與相似度分析的相關說明"
+
+
+@dataclass
+class MockServerConfig:
+    """模擬伺服器的行為設定"""
+    host: str = "127.0.0.1"
+    port: int = 0                      # 0 表示由作業系統分配
+    api_key: Optional[str] = None      # 設定後會驗證 Bearer token
+    chat_latency: float = 0.05         # 聊天回應的平均延遲 (秒)；串流模式下為首個 token 延遲
+    chat_jitter: float = 0.0           # 聊天延遲的標準差 (秒)
+    api_latency: float = 0.0           # 其他端點的延遲 (秒)
+    error_rate: float = 0.0            # 聊天請求回傳錯誤的機率 (0-1)
+    error_status: int = 500            # 錯誤注入時回傳的 HTTP 狀態碼
+    response_length: int = 200         # 回答的字元數
+    think_length: int = 0              # 在回答前加入 <think> 區塊的字元數
+    stream_chunk_chars: int = 4        # 串流模式下每個 chunk 的字元數
+    token_latency: float = 0.0         # 串流模式下每個 chunk 之間的延遲 (秒)
+    workspace_count: int = 10          # 預先建立的工作區數量
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockServerStats:
+    """伺服器端的請求統計"""
+    requests: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "MockAnythingLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # 由 MockAnythingLLMServer 注入
+    mock: 'MockAnythingLLMServer' = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- 共用工具 ---
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        expected = self.mock.config.api_key
+        if expected is None:
+            return self.headers.get('Authorization', '').startswith('Bearer ')
+        return self.headers.get('Authorization') == f'Bearer {expected}'
+
+    def _reject(self):
+        self._send_json(403, {"error": "No valid api key found."})
+
+    # --- 路由 ---
+
+    def do_GET(self):
+        self._read_body()
+        if not self._authorized():
+            return self._reject()
+        self.mock.sleep(self.mock.config.api_latency)
+
+        if self.path == '/api/v1/auth':
+            self.mock.stats.record('auth')
+            return self._send_json(200, {"authenticated": True})
+        if self.path == '/api/v1/workspaces':
+            self.mock.stats.record('workspaces')
+            return self._send_json(200, {"workspaces": self.mock.list_workspaces()})
+        self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        body = self._read_body()
+        if not self._authorized():
+            return self._reject()
+
+        if self.path == '/api/v1/workspace/new':
+            self.mock.stats.record('workspace_new')
+            self.mock.sleep(self.mock.config.api_latency)
+            payload = json.loads(body or b'{}')
+            workspace = self.mock.create_workspace(payload.get('name', 'workspace'), payload)
+            return self._send_json(200, {"workspace": workspace, "message": "Workspace created"})
+
+        match = _CHAT_PATH.match(self.path)
+        if match:
+            return self._handle_chat(match.group('slug'), body)
+
+        match = _STREAM_CHAT_PATH.match(self.path)
+        if match:
+            return self._handle_stream_chat(match.group('slug'), body)
+
+        match = _UPLOAD_PATH.match(self.path)
+        if match:
+            self.mock.stats.record('upload')
+            self.mock.sleep(self.mock.config.api_latency)
+            return self._send_json(200, {"success": True, "error": None, "documents": []})
+
+        self._send_json(404, {"error": "Not found"})
+
+    def _handle_chat(self, slug: str, body: bytes):
+        self.mock.stats.record('chat')
+        if slug not in self.mock.slugs():
+            return self._send_json(400, {"error": f"Workspace {slug} is not a valid workspace."})
+
+        payload = json.loads(body or b'{}')
+        self.mock.sleep(self.mock.chat_delay())
+        if self.mock.inject_error():
+            self.mock.stats.record_error()
+            return self._send_json(self.mock.config.error_status, {"error": "Injected failure"})
+
+        self._send_json(200, {
+            "id": str(uuid.uuid4()),
+            "type": "textResponse",
+            "textResponse": self.mock.make_response(payload.get('message', '')),
+            "sources": [],
+            "close": True,
+            "error": None,
+        })
+
+    def _handle_stream_chat(self, slug: str, body: bytes):
+        self.mock.stats.record('stream_chat')
+        if slug not in self.mock.slugs():
+            return self._send_json(400, {"error": f"Workspace {slug} is not a valid workspace."})
+
+        payload = json.loads(body or b'{}')
+        self.mock.sleep(self.mock.chat_delay())
+        if self.mock.inject_error():
+            self.mock.stats.record_error()
+            return self._send_json(self.mock.config.error_status, {"error": "Injected failure"})
+
+        # 不使用 chunked 編碼，以關閉連線標示串流結束
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        message_id = str(uuid.uuid4())
+        text = self.mock.make_response(payload.get('message', ''))
+        size = max(1, self.mock.config.stream_chunk_chars)
+        for start in range(0, len(text), size):
+            if start:
+                self.mock.sleep(self.mock.config.token_latency)
+            self._write_event({"uuid": message_id, "type": "textResponseChunk", "textResponse": text[start:start + size],
+                               "sources": [], "close": False, "error": False})
+        self._write_event({"uuid": message_id, "type": "finalizeResponseStream", "textResponse": None,
+                           "sources": [], "close": True, "error": False})
+
+    def _write_event(self, event: dict):
+        self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+
+class MockAnythingLLMServer:
+    """
+    在背景執行緒中運行的模擬 AnythingLLM 伺服器
+
+    可作為 context manager 使用：
+        with MockAnythingLLMServer(MockServerConfig(chat_latency=0.2)) as server:
+            config.api.base_url = server.base_url
+    """
+
+    def __init__(self, config: Optional[MockServerConfig] = None):
+        self.config = config or MockServerConfig()
+        self.stats = MockServerStats()
+        self._random = random.Random(self.config.seed)
+        self._random_lock = threading.Lock()
+        self._workspaces: Dict[str, dict] = {}
+        self._workspaces_lock = threading.Lock()
+        for i in range(self.config.workspace_count):
+            self.create_workspace(f"workspace-{i}", {})
+
+        handler = type('MockHandler', (_Handler,), {'mock': self})
+        self._httpd = ThreadingHTTPServer((self.config.host, self.config.port), handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockAnythingLLMServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # --- 工作區狀態 ---
+
+    def create_workspace(self, name: str, settings: dict) -> dict:
+        with self._workspaces_lock:
+            slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'workspace'
+            if slug in self._workspaces:
+                slug = f"{slug}-{uuid.uuid4().hex[:8]}"
+            workspace = {"id": len(self._workspaces) + 1, "name": name, "slug": slug, **settings}
+            self._workspaces[slug] = workspace
+            return workspace
+
+    def list_workspaces(self):
+        with self._workspaces_lock:
+            return list(self._workspaces.values())
+
+    def slugs(self):
+        with self._workspaces_lock:
+            return set(self._workspaces)
+
+    # --- 行為模擬 ---
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def chat_delay(self) -> float:
+        with self._random_lock:
+            return max(0.0, self._random.gauss(self.config.chat_latency, self.config.chat_jitter))
+
+    def inject_error(self) -> bool:
+        with self._random_lock:
+            return self._random.random() < self.config.error_rate
+
+    def make_response(self, message: str) -> str:
+        """依問題內容產生固定長度的回答，讓同一題的回答可重現"""
+        seed_text = (message + _FILLER) or _FILLER
+        repeated = (seed_text * (self.config.response_length // len(seed_text) + 1))[:self.config.response_length]
+        if self.config.think_length:
+            thinking = (_FILLER * (self.config.think_length // len(_FILLER) + 1))[:self.config.think_length]
+            return f"<think>{thinking}</think>{repeated}"
+        return repeated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬 AnythingLLM 伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--api-key", default=None, help="要求的 API 金鑰 (預設接受任何 Bearer token)")
+    parser.add_argument("--chat-latency", type=float, default=0.05)
+    parser.add_argument("--chat-jitter", type=float, default=0.0)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--response-length", type=int, default=200)
+    parser.add_argument("--think-length", type=int, default=0)
+    parser.add_argument("--stream-chunk-chars", type=int, default=4)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--workspace-count", type=int, default=10)
+    args = parser.parse_args()
+
+    server = MockAnythingLLMServer(MockServerConfig(
+        host=args.host, port=args.port, api_key=args.api_key,
+        chat_latency=args.chat_latency, chat_jitter=args.chat_jitter, api_latency=args.api_latency,
+        error_rate=args.error_rate, error_status=args.error_status,
+        response_length=args.response_length, think_length=args.think_length,
+        stream_chunk_chars=args.stream_chunk_chars, token_latency=args.token_latency,
+        workspace_count=args.workspace_count,
+    ))
+    print(f"模擬 AnythingLLM 伺服器已啟動: {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
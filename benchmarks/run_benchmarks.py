@@ -0,0 +1,273 @@
+"""
+驗證流程效能測試
+以模擬 AnythingLLM 伺服器與合成 Excel 資料執行各條驗證路徑，
+回報端對端吞吐量 (rows/sec)、記憶體峰值與各階段耗時，並將結果存成 JSON 以便逐次提交比較。
+
+使用方式:
+    python -m benchmarks.run_benchmarks --rows 200 --chat-latency 0.05
+    python -m benchmarks.run_benchmarks --paths batch --scorer lexical
+"""
+
+import argparse
+import difflib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_files  # noqa: E402
+import main  # noqa: E402
+import sweep  # noqa: E402
+import telemetry  # noqa: E402
+from config import Config  # noqa: E402
+from logger import Logger  # noqa: E402
+from metrics import DEFAULT_METRICS  # noqa: E402
+from similarity_analyzer import BACKENDS, SimilarityAnalyzer  # noqa: E402
+from benchmarks.mock_anythingllm import MockAnythingLLMServer, MockServerConfig  # noqa: E402
+from benchmarks.synthetic_excel import generate_workbook  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# 各階段耗時來源：(結果名稱前綴, 直方圖)
+_TIMED_HISTOGRAMS = [
+    ('stage', telemetry.STAGE_SECONDS),
+    ('scoring', telemetry.SCORING_SECONDS),
+]
+
+
+class LexicalAnalyzer(SimilarityAnalyzer):
+    """
+    不載入任何模型的評分器，以字元比對取代 BERTScore 與向量相似度，
+    用於單獨量測 HTTP 與 Excel 處理路徑的開銷。
+    """
+
+    def __init__(self, model_name: str):
+        self.logger = Logger("similarity_analyzer")
+        os.makedirs('similarity_charts', exist_ok=True)
+
+    def load_models(self, metrics: Sequence[str] = DEFAULT_METRICS) -> None:
+        pass
+
+    def precompute_references(self, references: List[str]) -> None:
+        pass
+
+    def calculate_similarity_batch(self, responses: List[str], references: List[str],
+                                   batch_size: Optional[int] = None, metrics: Sequence[str] = DEFAULT_METRICS,
+                                   long_text_overlap: Optional[float] = None) -> List[Dict[str, float]]:
+        with telemetry.SCORING_SECONDS.labels(metric='lexical').time():
+            ratios = [difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(responses, references)]
+        return [{metric: ratio for metric in metrics} for ratio in ratios]
+
+
+def _histogram_state() -> Dict[str, Dict[str, float]]:
+    state = {}
+    for prefix, histogram in _TIMED_HISTOGRAMS:
+        for key, snap in histogram.snapshots().items():
+            state[f"{prefix}:{'/'.join(key)}"] = snap
+    state['chat'] = telemetry.CHAT_LATENCY_SECONDS.snapshot()
+    state['chat_ttft'] = telemetry.CHAT_TTFT_SECONDS.snapshot()
+    return state
+
+
+def _histogram_delta(before: Dict[str, Dict[str, float]], after: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    delta = {}
+    for name, snap in after.items():
+        prev = before.get(name, {'count': 0, 'sum': 0.0})
+        count = snap['count'] - prev['count']
+        if count:
+            total = snap['sum'] - prev['sum']
+            delta[name] = {'count': count, 'total_seconds': round(total, 6), 'mean_seconds': round(total / count, 6)}
+    return delta
+
+
+def _scoring_tokens():
+    return telemetry.SCORING_TOKENS.labels(kind='real').get(), telemetry.SCORING_TOKENS.labels(kind='padded').get()
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+# --- 驗證路徑 ---
+
+def bench_batch(config: Config, logger: Logger, workdir: str, args: argparse.Namespace) -> int:
+    """完整的 Excel 批次驗證 (run_verification)"""
+    excel_path = os.path.join(workdir, 'bench_batch.xlsx')
+    rows = generate_workbook(excel_path, args.rows, args.sheets, args.question_length, args.answer_length, seed=args.seed)
+    run_args = argparse.Namespace(
+        workspace='workspace-0', excel=excel_path, output=os.path.join(workdir, 'output_batch'), directory=None
+    )
+    main.run_verification(config, logger, run_args, web_mode=True)
+    return rows
+
+
+def bench_batch_stream(config: Config, logger: Logger, workdir: str, args: argparse.Namespace) -> int:
+    """使用串流聊天端點的 Excel 批次驗證"""
+    config.api.streaming = True
+    return bench_batch(config, logger, workdir, args)
+
+
+def bench_single(config: Config, logger: Logger, workdir: str, args: argparse.Namespace) -> int:
+    """單筆文字驗證 (run_single_verification)，重複執行 --single-repeat 次"""
+    excel_path = os.path.join(workdir, 'bench_single.xlsx')
+    generate_workbook(excel_path, 1, 1, args.question_length, args.answer_length, sheet_names=['單筆驗證'], seed=args.seed)
+    run_args = argparse.Namespace(workspace='workspace-0', excel=excel_path, output=os.path.join(workdir, 'output_single'))
+    for i in range(args.single_repeat):
+        main.run_single_verification(config, logger, run_args, f"問題 {i}", "標準答案" * (args.answer_length // 4 + 1), web_mode=True)
+    return args.single_repeat
+
+
+def bench_multi_file(config: Config, logger: Logger, workdir: str, args: argparse.Namespace) -> int:
+    """多檔案批次驗證 (run_batch_verification)，回報的列數為所有檔案的問答對總數"""
+    excel_paths = []
+    rows = 0
+    for i in range(args.batch_files):
+        excel_path = os.path.join(workdir, f'bench_multi_{i}.xlsx')
+        rows += generate_workbook(excel_path, args.rows, args.sheets, args.question_length, args.answer_length, seed=args.seed + i)
+        excel_paths.append(excel_path)
+    run_args = argparse.Namespace(workspace='workspace-0', output=os.path.join(workdir, 'output_multi'), directory=None)
+    batch_files.run_batch_verification(config, logger, run_args, excel_paths, web_mode=True)
+    return rows
+
+
+def bench_sweep(config: Config, logger: Logger, workdir: str, args: argparse.Namespace) -> int:
+    """多工作區比較 (run_sweep)，回報的列數為 問答對數 x 目標數"""
+    excel_path = os.path.join(workdir, 'bench_sweep.xlsx')
+    rows = generate_workbook(excel_path, args.rows, args.sheets, args.question_length, args.answer_length, seed=args.seed)
+    workspaces = [f'workspace-{i}' for i in range(args.sweep_targets)]
+    run_args = argparse.Namespace(workspace=workspaces[0], excel=excel_path, output=os.path.join(workdir, 'output_sweep'))
+    sweep.run_sweep(config, logger, run_args, sweep.build_sweep_targets(workspaces[0], workspaces), web_mode=True)
+    return rows * len(workspaces)
+
+
+BENCHMARK_PATHS: Dict[str, Callable[[Config, Logger, str, argparse.Namespace], int]] = {
+    'batch': bench_batch,
+    'batch_stream': bench_batch_stream,
+    'multi_file': bench_multi_file,
+    'single': bench_single,
+    'sweep': bench_sweep,
+}
+
+
+def run_path(name: str, config: Config, logger: Logger, args: argparse.Namespace) -> Dict:
+    """執行單一路徑並收集吞吐量、記憶體與階段耗時"""
+    bench = BENCHMARK_PATHS[name]
+    with tempfile.TemporaryDirectory(prefix=f'qa_bench_{name}_') as workdir:
+        before = _histogram_state()
+        errors_before = telemetry.CHAT_REQUESTS.labels(status='error').get()
+        tokens_before = _scoring_tokens()
+        if args.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        rows = bench(config, logger, workdir, args)
+        elapsed = time.perf_counter() - start
+        peak = None
+        if args.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        after = _histogram_state()
+        real_tokens, padded_tokens = (now - before for now, before in zip(_scoring_tokens(), tokens_before))
+
+    return {
+        'path': name,
+        'rows': rows,
+        'elapsed_seconds': round(elapsed, 4),
+        'rows_per_second': round(rows / elapsed, 3) if elapsed > 0 else None,
+        'memory_peak_bytes': peak,
+        'chat_errors': int(telemetry.CHAT_REQUESTS.labels(status='error').get() - errors_before),
+        'padding_efficiency': round(real_tokens / padded_tokens, 4) if padded_tokens else None,
+        'timings': _histogram_delta(before, after),
+    }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="QA 驗證系統效能測試")
+    parser.add_argument("--paths", nargs='+', default=list(BENCHMARK_PATHS), choices=list(BENCHMARK_PATHS),
+                        help="要執行的驗證路徑")
+    parser.add_argument("--rows", type=int, default=50, help="每個工作表的列數")
+    parser.add_argument("--sheets", type=int, default=1, help="工作表數量")
+    parser.add_argument("--question-length", type=int, default=20, help="問題字元數")
+    parser.add_argument("--answer-length", type=int, default=200, help="標準答案字元數")
+    parser.add_argument("--single-repeat", type=int, default=5, help="單筆驗證的重複次數")
+    parser.add_argument("--batch-files", type=int, default=3, help="多檔案批次驗證的檔案數")
+    parser.add_argument("--sweep-targets", type=int, default=3, help="多工作區比較的目標數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scorer", choices=['model', 'lexical'], default='model',
+                        help="model: 使用真實評分模型; lexical: 以字元比對取代，僅量測 I/O 路徑")
+    parser.add_argument("--backend", choices=list(BACKENDS), default='fp32',
+                        help="--scorer model 時使用的評分模型推論後端")
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="模擬聊天延遲 (秒)")
+    parser.add_argument("--chat-jitter", type=float, default=0.0, help="模擬聊天延遲標準差 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="聊天錯誤注入機率")
+    parser.add_argument("--response-length", type=int, default=200, help="模擬回答字元數")
+    parser.add_argument("--think-length", type=int, default=0, help="模擬 <think> 區塊字元數")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="串流模式下每個 chunk 的延遲 (秒)")
+    parser.add_argument("--workspace-count", type=int, default=10, help="模擬伺服器上的工作區數量")
+    parser.add_argument("--no-trace-memory", dest='trace_memory', action='store_false',
+                        help="停用 tracemalloc (降低量測開銷)")
+    parser.add_argument("--output", type=str, default=None, help="結果 JSON 路徑 (預設: benchmarks/results/)")
+    return parser.parse_args()
+
+
+def main_cli():
+    args = parse_arguments()
+    logger = Logger("benchmark", log_level="WARNING")
+
+    server_config = MockServerConfig(
+        chat_latency=args.chat_latency, chat_jitter=args.chat_jitter, error_rate=args.error_rate,
+        response_length=args.response_length, think_length=args.think_length,
+        token_latency=args.token_latency, workspace_count=args.workspace_count, seed=args.seed,
+    )
+
+    original_factories = (main.get_shared_analyzer, sweep.get_shared_analyzer)
+    if args.scorer == 'lexical':
+        lexical = LexicalAnalyzer('lexical')
+        main.get_shared_analyzer = sweep.get_shared_analyzer = lambda model_name, backend=None: lexical
+
+    results: List[Dict] = []
+    try:
+        with MockAnythingLLMServer(server_config) as server:
+            for name in args.paths:
+                config = Config()
+                config.api.base_url = server.base_url
+                config.api.api_key = 'benchmark'
+                config.analyzer.backend = args.backend
+                result = run_path(name, config, logger, args)
+                results.append(result)
+                print(f"[{name}] {result['rows']} 列, {result['elapsed_seconds']:.2f}s, "
+                      f"{result['rows_per_second']} rows/s, 記憶體峰值 {result['memory_peak_bytes']} bytes, "
+                      f"評分填充效率 {result['padding_efficiency']}")
+                for stage, timing in result['timings'].items():
+                    print(f"    {stage:<32} n={timing['count']:<6} total={timing['total_seconds']:.4f}s mean={timing['mean_seconds']:.4f}s")
+            server_stats = dict(server.stats.requests)
+    finally:
+        main.get_shared_analyzer, sweep.get_shared_analyzer = original_factories
+
+    report = {
+        'revision': _git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'parameters': vars(args),
+        'server_requests': server_stats,
+        'results': results,
+    }
+    output_path = args.output
+    if not output_path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output_path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['revision']}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"效能測試結果已儲存至: {output_path}")
+
+
+if __name__ == "__main__":
+    main_cli()
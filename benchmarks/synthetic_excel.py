@@ -0,0 +1,69 @@
+"""
+合成問答資料產生器
+產生指定列數、工作表數與文字長度的 Excel 問答檔，供效能測試使用。
+"""
+
+import argparse
+import random
+from typing import List, Optional
+
+from openpyxl import Workbook
+
+_QUESTION_TOPICS = ["機器學習", "資料庫", "容器化", "微服務", "深度學習", "網路協定", "作業系統", "編譯器"]
+_ANSWER_CHARS = "系統驗證回答內容包含機器學習模型推論資料處理與相似度分析的相關說明以及部署架構效能調校和監控指標"
+
+
+def _make_text(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice(_ANSWER_CHARS) for _ in range(max(1, length)))
+
+
+def generate_workbook(path: str, rows: int = 100, sheets: int = 1, question_length: int = 20,
+                      answer_length: int = 200, sheet_names: Optional[List[str]] = None,
+                      seed: int = 0) -> int:
+    """
+    產生合成問答 Excel 檔案
+
+    Args:
+        path (str): 輸出路徑
+        rows (int): 每個工作表的問答列數
+        sheets (int): 工作表數量
+        question_length (int): 問題的字元數
+        answer_length (int): 標準答案的字元數
+        sheet_names (Optional[List[str]]): 自訂工作表名稱，未提供時使用 Sheet1..N
+        seed (int): 亂數種子，確保每次產生的內容相同
+
+    Returns:
+        int: 產生的問答對總數
+    """
+    rng = random.Random(seed)
+    names = sheet_names or [f"Sheet{i + 1}" for i in range(sheets)]
+
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet_index, name in enumerate(names):
+        ws = wb.create_sheet(title=name)
+        for row in range(1, rows + 1):
+            topic = _QUESTION_TOPICS[(sheet_index + row) % len(_QUESTION_TOPICS)]
+            question = f"{topic}問題{sheet_index + 1}-{row}：{_make_text(rng, question_length)}"
+            ws.cell(row=row, column=1, value=question)
+            ws.cell(row=row, column=2, value=_make_text(rng, answer_length))
+    wb.save(path)
+    return rows * len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生合成問答 Excel 檔案")
+    parser.add_argument("output", help="輸出的 .xlsx 路徑")
+    parser.add_argument("--rows", type=int, default=100, help="每個工作表的列數")
+    parser.add_argument("--sheets", type=int, default=1, help="工作表數量")
+    parser.add_argument("--question-length", type=int, default=20)
+    parser.add_argument("--answer-length", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    total = generate_workbook(args.output, args.rows, args.sheets, args.question_length, args.answer_length, seed=args.seed)
+    print(f"已產生 {total} 個問答對: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
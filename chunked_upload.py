@@ -0,0 +1,239 @@
+"""
+分段上傳 (可續傳)
+大型問答集不經過 Werkzeug 的表單解析與整檔緩衝：用戶端先建立上傳工作階段，再以多個 PUT 請求依序傳送檔案的各段，
+伺服器將請求內容直接串流寫入磁碟並累計 SHA-256。連線中斷時用戶端查詢已接收的位元組數，從該位置繼續傳送。
+工作階段的資訊另存為 JSON，伺服器重新啟動後仍可續傳 (以磁碟上已接收的內容重新計算雜湊)。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import BinaryIO, Dict, List, Optional
+
+# 每次從請求讀取並寫入磁碟的大小
+_BLOCK_SIZE = 1024 * 1024
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class UploadOffsetError(Exception):
+    """PUT 的起始位置與已接收的位元組數不符 (用戶端應從 offset 繼續傳送)"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"上傳位置不符，伺服器已接收 {offset} bytes")
+        self.offset = offset
+
+
+def parse_content_range(header: Optional[str]) -> Optional[int]:
+    """
+    取得 Content-Range 標頭 (bytes start-end/total) 的起始位置
+
+    Raises:
+        ValueError: 標頭格式錯誤
+    """
+    if not header:
+        return None
+    match = _CONTENT_RANGE.match(header.strip())
+    if not match or int(match.group(2)) < int(match.group(1)):
+        raise ValueError(f"Content-Range 格式錯誤: {header}")
+    return int(match.group(1))
+
+
+@dataclass
+class UploadSession:
+    """一個分段上傳的狀態"""
+    upload_id: str
+    filename: str
+    path: str
+    size: Optional[int] = None  # 用戶端宣告的檔案大小 (未宣告時於完成時決定)
+    expected_sha256: Optional[str] = None  # 用戶端宣告的 SHA-256，完成時比對
+    received: int = 0
+    sha256: Optional[str] = None  # 完成後的 SHA-256
+    completed: bool = False
+    created_time: float = field(default_factory=time.time)
+    updated_time: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        self.lock = threading.Lock()
+        self._hash = hashlib.sha256()
+
+    def to_dict(self) -> Dict:
+        return {key: value for key, value in asdict(self).items() if key != 'path'}
+
+    def save(self, destination: str):
+        """將已完成的檔案移至 destination (與 werkzeug FileStorage.save 相同的用法)"""
+        if not self.completed:
+            raise ValueError(f"上傳尚未完成: {self.filename}")
+        shutil.move(self.path, destination)
+
+
+class UploadStore:
+    """分段上傳工作階段的管理 (檔案與工作階段資訊皆存放於 directory)"""
+
+    def __init__(self, directory: str, max_size: int, ttl: float = 24 * 3600):
+        """
+        Args:
+            directory (str): 存放上傳中檔案的目錄
+            max_size (int): 單一檔案的大小上限 (bytes)
+            ttl (float): 工作階段閒置多久 (秒) 後刪除
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _persist(self, session: UploadSession):
+        with open(self._meta_path(session.upload_id), 'w', encoding='utf-8') as f:
+            json.dump(session.to_dict(), f, ensure_ascii=False)
+
+    def create(self, filename: str, size: Optional[int] = None, sha256: Optional[str] = None) -> UploadSession:
+        """
+        建立上傳工作階段
+
+        Raises:
+            ValueError: 宣告的檔案大小超過上限
+        """
+        if size is not None and (size < 0 or size > self.max_size):
+            raise ValueError(f"檔案大小超過上限 {self.max_size // 1024 // 1024} MB")
+        upload_id = uuid.uuid4().hex
+        session = UploadSession(upload_id, filename, os.path.join(self.directory, f"{upload_id}.part"),
+                                size=size, expected_sha256=sha256.lower() if sha256 else None)
+        open(session.path, 'wb').close()
+        self._persist(session)
+        with self._lock:
+            self._sessions[upload_id] = session
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        """
+        取得上傳工作階段 (伺服器重新啟動後從磁碟載入)
+
+        Raises:
+            KeyError: 上傳不存在或已過期
+        """
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            raise KeyError(upload_id)
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is not None:
+                return session
+            try:
+                with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                raise KeyError(upload_id)
+            session = UploadSession(path=os.path.join(self.directory, f"{upload_id}.part"), **data)
+            if not os.path.exists(session.path):
+                raise KeyError(upload_id)
+            # 以磁碟上的內容為準 (最後一次寫入可能在更新工作階段資訊前中斷)
+            session.received = 0
+            with open(session.path, 'rb') as f:
+                for block in iter(lambda: f.read(_BLOCK_SIZE), b''):
+                    session._hash.update(block)
+                    session.received += len(block)
+            self._sessions[upload_id] = session
+            return session
+
+    def append(self, upload_id: str, offset: int, stream: BinaryIO) -> UploadSession:
+        """
+        將請求內容從 offset 起串流寫入檔案
+
+        連線在傳送途中中斷時保留已寫入的內容，用戶端查詢 offset 後從該位置繼續。
+
+        Raises:
+            KeyError: 上傳不存在
+            UploadOffsetError: offset 與已接收的位元組數不符
+            ValueError: 上傳已完成或超過大小上限 (超過時本次寫入的內容會被捨棄)
+        """
+        session = self.get(upload_id)
+        with session.lock:
+            if session.completed:
+                raise ValueError("上傳已完成")
+            if offset != session.received:
+                raise UploadOffsetError(session.received)
+            limit = session.size if session.size is not None else self.max_size
+            block_hash = session._hash.copy()
+            written = 0
+            overflow = False
+            with open(session.path, 'r+b') as f:
+                f.seek(offset)
+                try:
+                    for block in iter(lambda: stream.read(_BLOCK_SIZE), b''):
+                        if offset + written + len(block) > limit:
+                            overflow = True
+                            raise ValueError(f"上傳內容超過{'宣告的檔案大小' if session.size is not None else '大小上限'}")
+                        f.write(block)
+                        block_hash.update(block)
+                        written += len(block)
+                finally:
+                    if overflow:
+                        # 捨棄這一段
+                        f.truncate(offset)
+                    else:
+                        f.truncate(offset + written)
+                        session._hash = block_hash
+                        session.received = offset + written
+                        session.updated_time = time.time()
+                        self._persist(session)
+            return session
+
+    def complete(self, upload_id: str) -> UploadSession:
+        """
+        結束上傳並核對大小與 SHA-256
+
+        Raises:
+            KeyError: 上傳不存在
+            ValueError: 大小或 SHA-256 與宣告不符
+        """
+        session = self.get(upload_id)
+        with session.lock:
+            if session.completed:
+                return session
+            if session.size is not None and session.received != session.size:
+                raise ValueError(f"上傳尚未完成: 已接收 {session.received} / {session.size} bytes")
+            if session.received == 0:
+                raise ValueError("上傳的檔案是空的")
+            digest = session._hash.hexdigest()
+            if session.expected_sha256 and digest != session.expected_sha256:
+                raise ValueError("SHA-256 與宣告不符，請重新上傳")
+            session.size = session.received
+            session.sha256 = digest
+            session.completed = True
+            session.updated_time = time.time()
+            self._persist(session)
+            return session
+
+    def remove(self, upload_id: str):
+        """刪除上傳工作階段與檔案"""
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        for path in (self._meta_path(upload_id), os.path.join(self.directory, f"{upload_id}.part")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def cleanup_expired(self) -> List[str]:
+        """刪除閒置超過 ttl 的上傳，回傳被刪除的 upload_id"""
+        last_modified: Dict[str, float] = {}
+        for name in os.listdir(self.directory):
+            upload_id, extension = os.path.splitext(name)
+            if extension in ('.json', '.part'):
+                mtime = os.path.getmtime(os.path.join(self.directory, name))
+                last_modified[upload_id] = max(mtime, last_modified.get(upload_id, 0))
+        now = time.time()
+        expired = [upload_id for upload_id, mtime in last_modified.items() if now - mtime > self.ttl]
+        for upload_id in expired:
+            self.remove(upload_id)
+        return expired
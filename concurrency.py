@@ -0,0 +1,486 @@
+"""
+AnythingLLM 請求的流量控制
+- 自適應並行控制：AnythingLLM 背後的模型服務 (例如 Ollama) 能同時處理的請求數因部署而異：並行數太低浪費吞吐量，
+  太高則讓請求排隊、逾時。AdaptiveLimiter 以 AIMD (加法增加、乘法減少) 調整同時進行的聊天請求數上限：
+  吞吐量提升時逐步增加，延遲攀升、錯誤率升高或收到 429 / 503 時立即減半。
+- 速率限制：多個任務同時對同一個 AnythingLLM 發送請求時，RateLimiter 以權杖桶 (token bucket) 限制整個程序的請求速率，
+  並在任務之間輪流分配權杖，避免大型任務佔滿配額而讓小型的互動任務一直等待。
+- 優先等級：任務分為 interactive (單筆驗證)、batch (問答集驗證) 與 background 三個等級。
+  並行名額、速率限制的權杖與評分批次的名額都先分配給等級較高的等待者 (同一等級內先到先得)，
+  並可在上限之外另外保留名額只給 interactive 使用，讓單筆驗證不必排在長時間的批次任務之後。
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Hashable, Iterator, Optional
+
+import requests
+
+import telemetry
+
+# 視為伺服器過載的 HTTP 狀態碼
+OVERLOAD_STATUS_CODES = (429, 503)
+
+# 優先等級 (依優先順序)
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BATCH = 'batch'
+PRIORITY_BACKGROUND = 'background'
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_BACKGROUND)
+
+
+def validate_priority(priority: str) -> str:
+    """
+    Raises:
+        ValueError: 未知的優先等級
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的優先等級: {priority} (可用: {', '.join(PRIORITIES)})")
+    return priority
+
+
+def normalize_target(base_url: str) -> str:
+    """共用控制器的鍵：去除結尾斜線，並將通訊協定與主機名稱轉為小寫"""
+    parts = urlsplit(base_url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, parts.fragment)).rstrip('/')
+
+
+def is_overload(error: BaseException) -> bool:
+    """請求失敗是否代表伺服器過載 (429 / 503 或逾時)"""
+    if isinstance(error, requests.Timeout):
+        return True
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.HTTPError) and response is not None \
+        and response.status_code in OVERLOAD_STATUS_CODES
+
+
+class _PriorityWaiters:
+    """依優先等級排隊的等待者，同一等級內先到先得"""
+
+    def __init__(self):
+        self._queues: Dict[str, Deque[object]] = {priority: deque() for priority in PRIORITIES}
+
+    def add(self, priority: str) -> object:
+        ticket = object()
+        self._queues[validate_priority(priority)].append(ticket)
+        return ticket
+
+    def remove(self, priority: str, ticket: object):
+        self._queues[priority].remove(ticket)
+
+    def is_next(self, priority: str, ticket: object) -> bool:
+        """ticket 是否排在同一等級的最前面，且沒有等級更高的等待者"""
+        for level in PRIORITIES:
+            if level == priority:
+                return self._queues[level][0] is ticket
+            if self._queues[level]:
+                return False
+        return False
+
+
+class PriorityLimiter:
+    """
+    依優先等級分配名額的並行控制器
+
+    名額依優先等級 (interactive > batch > background) 分配給等待者；batch 與 background 最多使用 limit 個名額，
+    interactive 另外可以使用 reserved 個保留名額 (最多 limit + reserved 個)，
+    因此即使批次請求佔滿上限，互動請求也不必等待批次請求結束。
+    """
+
+    def __init__(self, name: str, limit: int, reserved: int = 0):
+        """
+        Args:
+            name (str): 控制器名稱 (用於監控指標)
+            limit (int): 並行上限
+            reserved (int): 上限之外另外保留給 interactive 的名額
+        """
+        self.name = name
+        self.reserved = max(0, reserved)
+        self._cond = threading.Condition()
+        self._limit = max(1, limit)
+        self._in_flight = 0
+        self._waiters = _PriorityWaiters()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _publish(self):
+        """名額變化時更新監控指標"""
+
+    def configure(self, limit: int, reserved: int):
+        """更新並行上限與保留名額 (共用控制器以最近一次取得時的設定為準)"""
+        with self._cond:
+            self._limit = max(1, limit)
+            self.reserved = max(0, reserved)
+            self._cond.notify_all()
+            self._publish()
+
+    def _class_limit(self, priority: str) -> int:
+        if priority == PRIORITY_INTERACTIVE:
+            return self._limit + self.reserved
+        return self._limit
+
+    def acquire(self, priority: str = PRIORITY_BATCH) -> float:
+        """
+        等待直到輪到此優先等級且進行中的請求數低於該等級可用的上限
+
+        Returns:
+            float: 等待的秒數
+        """
+        start = time.perf_counter()
+        with self._cond:
+            ticket = self._waiters.add(priority)
+            try:
+                while not (self._waiters.is_next(priority, ticket) and self._in_flight < self._class_limit(priority)):
+                    self._cond.wait()
+            finally:
+                self._waiters.remove(priority, ticket)
+                # 排在後面的等待者可能已經可以取得名額
+                self._cond.notify_all()
+            self._in_flight += 1
+            self._publish()
+        waited = time.perf_counter() - start
+        telemetry.PRIORITY_WAIT_SECONDS.labels(limiter=self.name, priority=priority).observe(waited)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+            self._publish()
+
+    @contextmanager
+    def slot(self, priority: str = PRIORITY_BATCH) -> Iterator[None]:
+        """取得一個名額，區塊結束時釋放"""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AdaptiveLimiter(PriorityLimiter):
+    """
+    AIMD 並行上限控制器
+
+    以「一輪」(完成的請求數達到目前上限) 為單位評估：
+    - 收到過載訊號時立即將上限乘以 decrease_factor (每輪最多一次)
+    - 一輪的錯誤率超過 max_error_rate，或平均延遲超過基準延遲的 latency_tolerance 倍時，同樣乘法減少
+    - 否則若吞吐量比上一輪提升，上限加 1；若上次增加後吞吐量沒有提升，退回增加前的上限
+
+    基準延遲取各輪平均延遲的最小值，並緩慢向目前延遲漂移，以適應模型或負載的長期變化。
+    """
+
+    def __init__(self, name: str, initial: int = 1, min_limit: int = 1, max_limit: int = 16,
+                 latency_tolerance: float = 2.0, decrease_factor: float = 0.5, max_error_rate: float = 0.1,
+                 reserved: int = 0):
+        """
+        Args:
+            name (str): 控制器名稱 (用於監控指標)
+            initial (int): 初始並行上限
+            min_limit (int): 並行上限的下限
+            max_limit (int): 並行上限的上限
+            latency_tolerance (float): 平均延遲超過基準延遲的幾倍時降低上限
+            decrease_factor (float): 乘法減少的倍率
+            max_error_rate (float): 一輪中可容忍的錯誤比例
+            reserved (int): 上限之外另外保留給 interactive 的名額 (見 PriorityLimiter)
+        """
+        super().__init__(name, initial, reserved)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.max_error_rate = max_error_rate
+
+        self._limit = min(max(initial, self.min_limit), self.max_limit)
+        self._baseline_latency: Optional[float] = None
+        self._previous_throughput: Optional[float] = None
+        self._probing_from: Optional[int] = None  # 上一輪增加前的上限，吞吐量沒有提升時退回
+        self._round = 0
+        self._decreased_round = -1
+        self._reset_window()
+        self._publish()
+
+    def configure(self, max_limit: int, latency_tolerance: float, reserved: int):
+        """更新調整參數 (共用控制器以最近一次取得時的設定為準)，目前的上限超過新的最大值時立即降低"""
+        with self._cond:
+            self.max_limit = max(self.min_limit, max_limit)
+            self.latency_tolerance = latency_tolerance
+            self.reserved = max(0, reserved)
+            self._set_limit(self._limit)
+            self._publish()
+
+    def _reset_window(self):
+        self._window_start = time.perf_counter()
+        self._window_completed = 0
+        self._window_errors = 0
+        self._window_latency = 0.0
+
+    def _publish(self):
+        telemetry.CHAT_CONCURRENCY_LIMIT.labels(target=self.name).set(self._limit)
+        telemetry.CHAT_IN_FLIGHT.labels(target=self.name).set(self._in_flight)
+
+    def _set_limit(self, limit: int):
+        self._limit = min(max(limit, self.min_limit), self.max_limit)
+        self._cond.notify_all()
+
+    def _decrease(self):
+        # 同一輪內的多個過載訊號只減少一次，避免並行請求同時失敗時上限一路降到底
+        if self._decreased_round == self._round:
+            return
+        self._decreased_round = self._round
+        self._probing_from = None
+        self._set_limit(int(self._limit * self.decrease_factor))
+        self._previous_throughput = None
+        self._reset_window()
+        self._round += 1
+
+    def _end_round(self):
+        elapsed = time.perf_counter() - self._window_start
+        throughput = self._window_completed / elapsed if elapsed > 0 else 0.0
+        mean_latency = self._window_latency / self._window_completed
+        if self._baseline_latency is None or mean_latency < self._baseline_latency:
+            self._baseline_latency = mean_latency
+        else:
+            self._baseline_latency += (mean_latency - self._baseline_latency) * 0.05
+
+        if (self._window_errors / self._window_completed > self.max_error_rate
+                or mean_latency > self._baseline_latency * self.latency_tolerance):
+            self._decrease()
+            return
+
+        if self._probing_from is not None and self._previous_throughput is not None \
+                and throughput <= self._previous_throughput:
+            # 上次增加並行數沒有帶來更高的吞吐量，退回並維持
+            self._set_limit(self._probing_from)
+            self._probing_from = None
+        elif self._limit < self.max_limit:
+            self._probing_from = self._limit
+            self._set_limit(self._limit + 1)
+        self._previous_throughput = throughput
+        self._reset_window()
+        self._round += 1
+
+    def release(self, latency: float = 0.0, outcome: str = 'success'):
+        """
+        請求結束
+
+        Args:
+            latency (float): 請求耗時 (秒)
+            outcome (str): success / error / overload
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if outcome == 'overload':
+                self._decrease()
+            else:
+                self._window_completed += 1
+                self._window_latency += latency
+                if outcome == 'error':
+                    self._window_errors += 1
+                # 只有上限確實被用滿時的結果才能代表目前上限的吞吐量
+                if self._window_completed >= self._limit:
+                    self._end_round()
+            self._cond.notify_all()
+            self._publish()
+
+    @contextmanager
+    def slot(self, priority: str = PRIORITY_BATCH) -> Iterator[None]:
+        """
+        依優先等級取得一個並行名額，區塊結束時回報耗時與結果
+
+        區塊內拋出的例外視為錯誤，其中 429 / 503 與逾時視為過載 (見 is_overload)；
+        呼叫端應在區塊內呼叫 raise_for_status，讓 HTTP 錯誤被計入。
+        """
+        self.acquire(priority)
+        start = time.perf_counter()
+        outcome = 'success'
+        try:
+            yield
+        except BaseException as e:
+            outcome = 'overload' if is_overload(e) else 'error'
+            raise
+        finally:
+            self.release(time.perf_counter() - start, outcome)
+
+
+# 依 AnythingLLM 位址共用控制器：同一個模型服務的所有任務與工作區共用同一個並行上限
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_chat_limiter(base_url: str, max_limit: int = 16, latency_tolerance: float = 2.0,
+                     reserved: int = 0) -> AdaptiveLimiter:
+    """
+    取得 (必要時建立) 指定 AnythingLLM 位址的自適應聊天並行控制器
+
+    每個位址只有一個控制器；已存在時以這次的參數更新 (見 AdaptiveLimiter.configure)，
+    因此以不同設定 (例如前端覆寫) 存取同一位址的任務仍共用同一個並行上限。
+
+    Args:
+        base_url (str): AnythingLLM 位址
+        max_limit (int): 並行上限的最大值
+        latency_tolerance (float): 平均延遲超過基準延遲的幾倍時降低上限
+        reserved (int): 上限之外另外保留給 interactive 任務的名額
+    """
+    key = normalize_target(base_url)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = AdaptiveLimiter(key, initial=1, max_limit=max_limit, latency_tolerance=latency_tolerance,
+                                      reserved=reserved)
+            _limiters[key] = limiter
+        else:
+            limiter.configure(max_limit, latency_tolerance, reserved)
+        return limiter
+
+
+_priority_limiters: Dict[str, PriorityLimiter] = {}
+
+
+def get_priority_limiter(name: str, limit: int, reserved: int = 0) -> PriorityLimiter:
+    """
+    取得 (必要時建立) 固定上限的優先等級並行控制器，同一個程序內以相同名稱取得的任務共用
+
+    用於同一個 AnythingLLM 位址所有任務合計的聊天並行上限 (api.shared_concurrency)，
+    以及所有任務共用的評分批次名額 (analyzer.scoring_concurrency)。
+    每個名稱只有一個控制器；已存在時以這次的參數更新 (見 PriorityLimiter.configure)。
+
+    Args:
+        name (str): 控制器名稱 (AnythingLLM 位址或 'scoring')
+        limit (int): 並行上限
+        reserved (int): 上限之外另外保留給 interactive 任務的名額
+    """
+    key = normalize_target(name)
+    with _limiters_lock:
+        limiter = _priority_limiters.get(key)
+        if limiter is None:
+            limiter = PriorityLimiter(key, limit, reserved)
+            _priority_limiters[key] = limiter
+        else:
+            limiter.configure(limit, reserved)
+        return limiter
+
+
+class RateLimiter:
+    """
+    公平分配的權杖桶速率限制器
+
+    權杖以 rate 個/秒補充，最多累積 burst 個。等待權杖的請求依任務 (owner) 分組，
+    權杖依任務輪流發放：每個任務一次取得一個權杖後排到最後，同一任務內的請求則依先後順序。
+    因此不論任務已排了多少請求，新任務最多只需等待其他每個任務各取得一個權杖。
+    有等級較高 (例如 interactive) 的任務在等待時，權杖先發給這些任務。
+    """
+
+    def __init__(self, name: str, rate: float, burst: int = 1):
+        """
+        Args:
+            name (str): 限制器名稱 (用於監控指標)
+            rate (float): 每秒補充的權杖數
+            burst (int): 權杖桶容量 (閒置後可連續送出的請求數)
+        """
+        if rate <= 0:
+            raise ValueError(f"速率限制必須大於 0: {rate}")
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._cond = threading.Condition()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        # 每個優先等級的輪流順序：owner -> 該任務等待中的請求 (依先後順序)
+        self._waiting: Dict[str, "OrderedDict[Hashable, Deque[object]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+
+    def configure(self, rate: float, burst: int):
+        """更新速率與權杖桶容量 (共用限制器以最近一次取得時的設定為準)"""
+        if rate <= 0:
+            raise ValueError(f"速率限制必須大於 0: {rate}")
+        with self._cond:
+            self._refill()
+            self.rate = rate
+            self.burst = max(1, burst)
+            self._tokens = min(self._tokens, self.burst)
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, owner: Hashable = None, priority: str = PRIORITY_BATCH) -> float:
+        """
+        等待並取得一個權杖
+
+        Args:
+            owner (Hashable): 請求所屬的任務，權杖在任務之間輪流分配
+            priority (str): 任務的優先等級
+
+        Returns:
+            float: 等待的秒數
+        """
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            waiting = self._waiting[validate_priority(priority)]
+            waiting.setdefault(owner, deque()).append(ticket)
+            while True:
+                # 等級最高且有等待者的輪流順序
+                front = next(level for level in self._waiting.values() if level)
+                front_owner, queue = next(iter(front.items()))
+                is_next = front is waiting and front_owner == owner and queue[0] is ticket
+                if is_next:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        queue.popleft()
+                        # 取得權杖的任務排到最後，若仍有等待中的請求則保留位置
+                        del waiting[owner]
+                        if queue:
+                            waiting[owner] = queue
+                        self._cond.notify_all()
+                        break
+                    self._cond.wait((1 - self._tokens) / self.rate)
+                else:
+                    self._cond.wait()
+        waited = time.monotonic() - start
+        telemetry.RATE_LIMIT_WAIT_SECONDS.labels(target=self.name).observe(waited)
+        return waited
+
+    @property
+    def waiting(self) -> int:
+        """等待中的請求數"""
+        with self._cond:
+            return sum(len(queue) for level in self._waiting.values() for queue in level.values())
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(base_url: str, rate: float, burst: int = 1) -> RateLimiter:
+    """
+    取得 (必要時建立) 指定 AnythingLLM 位址的速率限制器，同一個程序內的所有任務共用
+
+    每個位址只有一個限制器；已存在時以這次的參數更新 (見 RateLimiter.configure)。
+
+    Args:
+        base_url (str): AnythingLLM 位址
+        rate (float): 每秒最多送出的請求數
+        burst (int): 閒置後可連續送出的請求數
+    """
+    key = normalize_target(base_url)
+    with _limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(key, rate, burst)
+            _rate_limiters[key] = limiter
+        else:
+            limiter.configure(rate, burst)
+        return limiter
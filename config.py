@@ -8,7 +8,7 @@ import os
 import yaml
 from dotenv import load_dotenv
 from dataclasses import dataclass, field
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 # --- Nested Dataclasses for Config Structure ---
 
@@ -16,6 +16,18 @@ from typing import Dict, Optional
 class ApiConfig:
     api_key: Optional[str] = None
     base_url: str = "http://localhost:3001"
+    streaming: bool = False  # 使用 stream-chat 端點，逐段接收回答並記錄首個 token 延遲
+    max_concurrency: int = 1  # 每個工作區同時進行的聊天請求數
+    adaptive_concurrency: bool = False  # 依延遲與錯誤率自動調整並行數 (AIMD)，上限為 adaptive_max_concurrency
+    adaptive_max_concurrency: int = 16  # 自適應並行控制的並行數上限
+    adaptive_latency_tolerance: float = 2.0  # 平均延遲超過基準延遲的幾倍時降低並行數
+    rate_limit: float = 0.0  # 每秒最多送出的 AnythingLLM 請求數 (同一位址的所有任務共用，0 表示不限制)
+    rate_burst: int = 5  # 閒置後可連續送出的請求數
+    priority: str = "batch"  # 任務的優先等級：interactive / batch / background (並行名額與速率限制的權杖先分配給等級較高的任務)
+    shared_concurrency: int = 0  # 未啟用自適應並行控制時，同一位址所有任務合計的聊天並行上限，0 表示不限制
+    interactive_reserved: int = 1  # 並行上限之外另外保留給 interactive 任務的聊天名額 (自適應並行控制或 shared_concurrency 啟用時)
+    workspace_cache_ttl: float = 300.0  # 工作區列表 (名稱、slug 與設定) 的快取秒數，0 表示不快取
+    auth_cache_ttl: float = 60.0  # API 金鑰驗證成功結果的快取秒數，0 表示不快取
 
 @dataclass
 class WorkspaceConfig:
@@ -32,12 +44,35 @@ class WorkspaceConfig:
 class AnalyzerConfig:
     model: str = "paraphrase-multilingual-MiniLM-L12-v2"
     similarity_threshold: float = 0.7
+    metrics: List[str] = field(default_factory=lambda: ['bert_score', 'cosine_similarity'])  # 啟用的相似度指標 (見 metrics.py)
+    metric_plugins: List[str] = field(default_factory=list)  # 匯入時註冊自訂指標的模組
+    pass_metric: str = "cosine_similarity"  # 以此指標 >= similarity_threshold 判定合格
+    backend: str = "fp32"  # 評分模型的推論後端：fp32 / int8 (動態量化) / bf16 / onnx (ONNX Runtime)
+    batch_token_budget: int = 16384  # 每個評分批次含填充的 token 上限 (依長度分桶組成批次)
+    long_text: bool = False  # 長文模式：超過模型最大長度的回答與標準答案切成重疊視窗評分，而非截斷
+    long_text_overlap: float = 0.25  # 長文模式相鄰視窗重疊的比例
+    cascade: bool = False  # 分層評分：先以字元指標判定明確合格/不合格的列，只有其餘的列交給模型評分
+    cascade_pass: float = 0.95  # 字元 ROUGE-L 達此值直接判定合格
+    cascade_fail: float = 0.05  # 字元 n-gram F1 不超過此值直接判定不合格
+    scoring_concurrency: int = 0  # 所有任務合計同時進行的評分批次數 (批次依任務的優先等級排隊)，0 表示不限制
+    scoring_reserved: int = 0  # 評分批次上限之外另外保留給 interactive 任務的名額
+
+@dataclass
+class NormalizerConfig:
+    strip_think: bool = True             # 移除 <think>...</think> 區塊 (含未關閉的標籤)
+    normalize_whitespace: bool = False   # 去除行尾空白、合併連續空白與多餘空行
+    strip_markdown: bool = False         # 移除 Markdown 標記
+    strip_citations: bool = False        # 移除 [1]、【1†source】等引用標註
 
 @dataclass
 class FileConfig:
     default_excel: str = "qa_data.xlsx"
     default_upload_dir: str = "documents"
     output_dir: str = "output"
+    chunk_size: int = 1000  # 每次讀取、送出與評分的問答對數 (CSV / JSONL / Parquet 以此大小串流讀寫)
+    task_retention: float = 3600.0  # Web 任務結束後，任務狀態 (SSE 佇列、單筆結果) 保留的秒數
+    artifact_retention: float = 604800.0  # Web 任務結束後，上傳檔案與輸出目錄保留的秒數 (預設 7 天)，0 表示不依時間刪除
+    disk_quota_mb: int = 10240  # 已結束任務的上傳檔案與輸出目錄總大小上限 (MB)，超過時從最舊的任務開始刪除，0 表示不限制
 
 # --- Main Config Class ---
 
@@ -49,6 +84,7 @@ class Config:
     api: ApiConfig = field(default_factory=ApiConfig)
     workspace: WorkspaceConfig = field(default_factory=WorkspaceConfig)
     analyzer: AnalyzerConfig = field(default_factory=AnalyzerConfig)
+    normalizer: NormalizerConfig = field(default_factory=NormalizerConfig)
     file: FileConfig = field(default_factory=FileConfig)
     supported_mime_types: Dict[str, str] = field(default_factory=dict)
 
@@ -82,6 +118,7 @@ class Config:
             'api': {**yaml_config.get('api', {}), **cls._load_api_from_env()},
             'workspace': {**yaml_config.get('workspace', {})},
             'analyzer': {**yaml_config.get('analyzer', {})},
+            'normalizer': {**yaml_config.get('normalizer', {})},
             'file': {**yaml_config.get('file', {})},
             'supported_mime_types': {**yaml_config.get('supported_mime_types', {})}
         }
@@ -90,6 +127,7 @@ class Config:
             api=ApiConfig(**config_data['api']),
             workspace=WorkspaceConfig(**config_data['workspace']),
             analyzer=AnalyzerConfig(**config_data['analyzer']),
+            normalizer=NormalizerConfig(**config_data['normalizer']),
             file=FileConfig(**config_data['file']),
             supported_mime_types=config_data['supported_mime_types']
         )
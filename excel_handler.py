@@ -1,5 +1,5 @@
 import pandas as pd
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
 import openpyxl
 import os
 from logger import Logger # Assuming Logger is in a file named logger.py
@@ -11,6 +11,7 @@ class ExcelHandler:
         """
         self.file_path = file_path
         self.logger = logger
+        self._qa_pairs_cache: Optional[Dict[str, List[Tuple[str, str, int]]]] = None
         
         # 檢查檔案是否存在
         if not os.path.exists(file_path):
@@ -95,10 +96,13 @@ class ExcelHandler:
             self.logger.error(f"[ERROR] 處理工作表 '{sheet_name}' 時發生錯誤: {e}", exc_info=True)
             return []
     
-    def get_all_qa_pairs(self) -> Dict[str, List[Tuple[str, str]]]:
+    def get_all_qa_pairs(self) -> Dict[str, List[Tuple[str, str, int]]]:
         """
         Get Q&A pairs from all sheets in the Excel file.
+        The file is parsed once; later calls return the cached pairs.
         """
+        if self._qa_pairs_cache is not None:
+            return self._qa_pairs_cache
         # We need to use pandas to get all sheets initially.
         try:
             excel_file = pd.ExcelFile(self.file_path)
@@ -107,11 +111,48 @@ class ExcelHandler:
             result = {}
             for sheet_name in sheet_names:
                 result[sheet_name] = self.get_qa_pairs(sheet_name)
+            self._qa_pairs_cache = result
             return result
         except Exception as e:
             self.logger.error(f"[ERROR] 從 Excel 檔案讀取所有工作表時發生錯誤: {e}", exc_info=True)
             return {}
 
+    def count_qa_pairs(self) -> Dict[str, int]:
+        """
+        Count the valid Q&A pairs of every sheet, keyed by sheet name.
+        """
+        return {sheet_name: len(pairs) for sheet_name, pairs in self.get_all_qa_pairs().items()}
+
+    def iter_qa_chunks(self, chunk_size: int) -> Iterator[List[Tuple[str, str, str, int]]]:
+        """
+        Yield the Q&A pairs of all sheets in Excel order, chunk_size rows at a time.
+
+        Yields:
+            List[Tuple[str, str, str, int]]: (sheet_name, question, answer, original_row_index) rows
+        """
+        chunk = []
+        for sheet_name, qa_pairs in self.get_all_qa_pairs().items():
+            for question, answer, original_row_index in qa_pairs:
+                chunk.append((sheet_name, question, answer, original_row_index))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def write_results(self, rows: List[Tuple[str, str, str, int]],
+                      results: List[Optional[Tuple[str, dict]]], score_keys: List[str]) -> None:
+        """
+        Write the LLM responses and similarity scores of a chunk from iter_qa_chunks. Does not save immediately.
+        results[i] is (llm_response, similarity_scores) for rows[i], or None when no response was obtained.
+        score_keys is unused here; the score columns follow the order of each similarity_scores dict.
+        """
+        for (sheet_name, _, _, original_row_index), result in zip(rows, results):
+            if result:
+                llm_response, similarity_scores = result
+                self.write_llm_response(sheet_name, original_row_index, llm_response)
+                self.write_similarity_scores(sheet_name, original_row_index, similarity_scores)
+
     def write_llm_response(self, sheet_name: str, row_index: int, llm_response: str) -> None:
         """
         Write LLM response to the third column. Does not save immediately.
@@ -140,6 +181,26 @@ class ExcelHandler:
         except Exception as e:
             self.logger.error(f"[ERROR] 寫入相似度分數時發生錯誤: {e}", exc_info=True)
 
+    def write_score_headers(self, score_headers: List[str]) -> None:
+        """
+        Write headers for the LLM response and score columns on every sheet with Q&A pairs.
+        When the first row is itself a Q&A pair, a header row is inserted above it,
+        so call this after all responses and scores have been written.
+        """
+        try:
+            for sheet_name, qa_pairs in self.get_all_qa_pairs().items():
+                if not qa_pairs:
+                    continue
+                sheet = self.workbook[sheet_name]
+                if qa_pairs[0][2] == 0:
+                    sheet.insert_rows(1)
+                    sheet.cell(row=1, column=1, value='問題')
+                    sheet.cell(row=1, column=2, value='標準答案')
+                for col, header in enumerate(['LLM 回答', *score_headers], 3):
+                    sheet.cell(row=1, column=col, value=header)
+        except Exception as e:
+            self.logger.error(f"[ERROR] 寫入欄位標題時發生錯誤: {e}", exc_info=True)
+
     def save_workbook(self, output_path: str):
         """
         Saves the workbook to a new file path.
@@ -160,6 +221,29 @@ class ExcelHandler:
             total += len(pairs)
         return total
 
+def scan_workbook(file_path: str) -> Dict[str, int]:
+    """
+    Count the Q&A pairs of every sheet without loading the workbook into memory.
+    Uses openpyxl's read-only mode, so large workbooks can be validated before a job is queued.
+
+    Raises:
+        ValueError: The file is not a valid Excel workbook
+    """
+    try:
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"檔案格式錯誤: {os.path.basename(file_path)}。請確認檔案是有效的 Excel 檔案。錯誤詳情: {e}")
+    try:
+        counts = {}
+        for sheet in workbook.worksheets:
+            counts[sheet.title] = sum(
+                1 for row in sheet.iter_rows(max_col=2, values_only=True)
+                if len(row) >= 2 and all(cell is not None and str(cell).strip() for cell in row[:2])
+            )
+        return counts
+    finally:
+        workbook.close()
+
 def demo():
     """
     Demo function to show how to use ExcelHandler
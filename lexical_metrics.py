@@ -0,0 +1,133 @@
+"""
+字元層級的詞彙相似度指標
+提供不需要載入模型的低成本相似度：字元 n-gram 重疊 F1 與字元 ROUGE-L。
+以字元而非詞為單位，中文不需要斷詞即可使用。
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# 每個字元的 Unicode 碼位最多 21 位元，n <= 3 時 n-gram 可編碼為單一 int64
+_CODE_BITS = 21
+MAX_NGRAM = 3
+
+
+def _lexical_form(text: str) -> str:
+    """比較前移除所有空白並轉為小寫"""
+    return ''.join(text.lower().split())
+
+
+def _char_codes(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+
+
+def _ngram_ids(text: str, n: int) -> np.ndarray:
+    """將文字的所有字元 n-gram 編碼為 int64 (文字短於 n 時整段視為一個 n-gram)"""
+    codes = _char_codes(text)
+    n = min(n, codes.size)
+    if n == 0:
+        return codes
+    count = codes.size - n + 1
+    ids = codes[:count].copy()
+    for k in range(1, n):
+        ids |= codes[k:k + count] << (_CODE_BITS * k)
+    return ids
+
+
+def _ngram_table(texts: Sequence[str], n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    所有文字的 n-gram 出現次數表
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (不重複的 (列, n-gram) 鍵, 出現次數, 每列的 n-gram 總數)
+    """
+    ids = [_ngram_ids(text, n) for text in texts]
+    totals = np.array([row.size for row in ids], dtype=np.int64)
+    rows = np.repeat(np.arange(len(texts), dtype=np.int64), totals)
+    if not totals.sum():
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64), totals
+    grams = np.concatenate(ids)
+    keys, counts = np.unique(np.column_stack([rows, grams]), axis=0, return_counts=True)
+    return keys, counts, totals
+
+
+def char_ngram_f1(responses: Sequence[str], references: Sequence[str], n: int = 2) -> np.ndarray:
+    """
+    字元 n-gram 重疊的 F1 (以出現次數計算，重複的 n-gram 取兩邊次數的較小值)
+
+    所有列的 n-gram 合併成一張表一次計算，不需要逐列比對。
+
+    Args:
+        responses (Sequence[str]): LLM 回答
+        references (Sequence[str]): 對應的標準答案
+        n (int): n-gram 長度 (1 ~ MAX_NGRAM)
+
+    Returns:
+        np.ndarray: 每列的 F1，兩邊皆為空字串時為 1.0
+    """
+    if not 1 <= n <= MAX_NGRAM:
+        raise ValueError(f"n-gram 長度必須介於 1 與 {MAX_NGRAM} 之間: {n}")
+    rows = len(responses)
+    response_keys, response_counts, response_totals = _ngram_table([_lexical_form(t) for t in responses], n)
+    reference_keys, reference_counts, reference_totals = _ngram_table([_lexical_form(t) for t in references], n)
+
+    # 兩張表各自不重複，合併排序後相鄰且相同的鍵即為兩邊共有的 n-gram
+    keys = np.concatenate([response_keys, reference_keys])
+    counts = np.concatenate([response_counts, reference_counts])
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    keys, counts = keys[order], counts[order]
+    shared = np.flatnonzero(np.all(keys[1:] == keys[:-1], axis=1))
+    overlap = np.bincount(keys[shared, 0], weights=np.minimum(counts[shared], counts[shared + 1]),
+                          minlength=rows)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f1 = np.where(overlap > 0, 2 * overlap / (response_totals + reference_totals), 0.0)
+    return np.where((response_totals == 0) & (reference_totals == 0), 1.0, f1)
+
+
+def _lcs_length(a: str, b: str) -> int:
+    """
+    最長共同子序列長度 (bit-parallel 演算法)
+
+    以 a 的每個字元位置作為一個位元，掃描 b 的每個字元時以整數運算同時更新所有位置，
+    時間複雜度為 O(len(b) * len(a) / 字組長度)。
+    """
+    if not a or not b:
+        return 0
+    masks = {}
+    for i, ch in enumerate(a):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for ch in b:
+        u = v & masks.get(ch, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count('1')
+
+
+def char_rouge_l(responses: Sequence[str], references: Sequence[str]) -> np.ndarray:
+    """
+    字元層級的 ROUGE-L F1
+
+    Args:
+        responses (Sequence[str]): LLM 回答
+        references (Sequence[str]): 對應的標準答案
+
+    Returns:
+        np.ndarray: 每列的 F1，兩邊皆為空字串時為 1.0
+    """
+    responses = [_lexical_form(t) for t in responses]
+    references = [_lexical_form(t) for t in references]
+    lcs = np.array([_lcs_length(a, b) for a, b in zip(responses, references)], dtype=np.float64)
+    totals = np.array([len(a) + len(b) for a, b in zip(responses, references)], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f1 = np.where(lcs > 0, 2 * lcs / totals, 0.0)
+    return np.where(totals == 0, 1.0, f1)
+
+
+def lexical_similarity(responses: Sequence[str], references: Sequence[str], n: int = 2) -> List[dict]:
+    """回傳每列的 {'char_ngram_f1', 'rouge_l'}"""
+    ngram = char_ngram_f1(responses, references, n)
+    rouge = char_rouge_l(responses, references)
+    return [{'char_ngram_f1': float(g), 'rouge_l': float(r)} for g, r in zip(ngram, rouge)]
@@ -0,0 +1,151 @@
+"""
+QA 驗證函式庫 API
+讓其他 Python 程式 (例如測試框架) 直接驗證問答對並逐筆取得結果，不需要建立 Excel 或解析輸出檔案：
+
+    from library import verify_pairs
+
+    for result in verify_pairs(load_pairs(), workspace='my-workspace'):
+        assert result.get('passed'), result
+
+結果依完成順序產生，index 為輸入順序。輸入只在有空閒的聊天名額時才讀取，
+呼叫端停止讀取結果時也不會再送出新的問題，因此可以固定的記憶體處理任意長度的輸入。
+非同步程式可使用 averify_pairs，輸入可為一般或非同步的可迭代物件。
+"""
+
+import asyncio
+import threading
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from config import Config
+from logger import Logger, get_logger
+from main import QAVerificationSystem
+
+Pair = Union[Tuple[str, str], Dict[str, Any]]
+
+
+def as_pair(item: Pair) -> Tuple[str, str]:
+    """
+    將輸入轉為 (問題, 標準答案)
+
+    接受 (問題, 標準答案) 或包含 question 與 answer (或 standard_answer) 的 dict；
+    無法辨識的輸入視為空白的問答對，驗證時會回報錯誤。
+    """
+    if isinstance(item, dict):
+        return (str(item.get('question') or '').strip(),
+                str(item.get('answer') or item.get('standard_answer') or '').strip())
+    if isinstance(item, (tuple, list)) and len(item) == 2:
+        return str(item[0] or '').strip(), str(item[1] or '').strip()
+    return '', ''
+
+
+def _prepare(workspace: str, config: Optional[Config], logger: Optional[Logger],
+             system: Optional[QAVerificationSystem], create_workspace: bool) -> Tuple[QAVerificationSystem, str]:
+    """建立 (或沿用) 驗證系統，驗證 API 金鑰並取得工作區 slug"""
+    if system is None:
+        system = QAVerificationSystem(config or Config.load(), logger or get_logger())
+    if not system.validate_api_key():
+        raise RuntimeError("API 金鑰無效")
+    workspace_slug = system.get_workspace_slug(workspace)
+    if not workspace_slug and create_workspace:
+        workspace_slug = system.create_workspace(workspace)
+    if not workspace_slug:
+        raise RuntimeError(f"無法獲取或創建工作區: {workspace}")
+    return system, workspace_slug
+
+
+def verify_pairs(pairs: Iterable[Pair], workspace: str, config: Optional[Config] = None,
+                 logger: Optional[Logger] = None, system: Optional[QAVerificationSystem] = None,
+                 score_batch_size: int = 32, create_workspace: bool = True) -> Iterator[Dict]:
+    """
+    驗證問答對並依完成順序逐筆產生結果
+
+    Args:
+        pairs (Iterable[Pair]): (問題, 標準答案) 或 {question, answer} 的可迭代物件，只在需要時才讀取下一筆
+        workspace (str): 工作區名稱或 slug
+        config (Optional[Config]): 系統配置，未提供時載入 config.yaml
+        logger (Optional[Logger]): 日誌記錄器
+        system (Optional[QAVerificationSystem]): 沿用既有的驗證系統 (提供時忽略 config 與 logger)
+        score_batch_size (int): 一次評分的最大筆數
+        create_workspace (bool): 工作區不存在時是否建立
+
+    Yields:
+        Dict: 與 QAVerificationSystem.verify_stream 相同的結果 (index、question、standard_answer，
+        成功時另有 llm_response、similarity_scores、passed 與 chat_stats，失敗時為 error)
+
+    Raises:
+        RuntimeError: API 金鑰無效或無法取得工作區 (在讀取第一筆結果時拋出)
+    """
+    system, workspace_slug = _prepare(workspace, config, logger, system, create_workspace)
+    yield from system.verify_stream(workspace_slug, (as_pair(item) for item in pairs), score_batch_size)
+
+
+def _iter_async(pairs: AsyncIterable[Pair], loop: asyncio.AbstractEventLoop) -> Iterator[Pair]:
+    """在工作執行緒中逐筆讀取事件迴圈上的非同步輸入"""
+    iterator = pairs.__aiter__()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(iterator.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+async def averify_pairs(pairs: Union[Iterable[Pair], AsyncIterable[Pair]], workspace: str,
+                        config: Optional[Config] = None, logger: Optional[Logger] = None,
+                        system: Optional[QAVerificationSystem] = None, score_batch_size: int = 32,
+                        create_workspace: bool = True, max_buffered: Optional[int] = None) -> AsyncIterator[Dict]:
+    """
+    verify_pairs 的非同步版本
+
+    驗證在工作執行緒中進行，不會阻塞事件迴圈。尚未被讀取的結果最多暫存 max_buffered 筆
+    (預設為 score_batch_size)，暫存已滿時驗證暫停，直到呼叫端讀取結果。
+
+    Args:
+        pairs (Union[Iterable[Pair], AsyncIterable[Pair]]): 問答對，可為一般或非同步的可迭代物件
+        max_buffered (Optional[int]): 尚未被讀取的結果上限
+        其餘參數同 verify_pairs
+
+    Yields:
+        Dict: 與 verify_pairs 相同的結果
+    """
+    loop = asyncio.get_running_loop()
+    system, workspace_slug = await loop.run_in_executor(
+        None, _prepare, workspace, config, logger, system, create_workspace)
+    source = _iter_async(pairs, loop) if hasattr(pairs, '__aiter__') else iter(pairs)
+    results: asyncio.Queue = asyncio.Queue(maxsize=max_buffered or score_batch_size)
+    stop = threading.Event()
+
+    def put(message: Tuple[str, Any]):
+        asyncio.run_coroutine_threadsafe(results.put(message), loop).result()
+
+    def worker():
+        stream = system.verify_stream(workspace_slug, (as_pair(item) for item in source), score_batch_size)
+        try:
+            for result in stream:
+                if stop.is_set():
+                    return
+                put(('result', result))
+        except BaseException as e:
+            if not stop.is_set():
+                put(('error', e))
+            return
+        finally:
+            stream.close()
+        if not stop.is_set():
+            put(('done', None))
+
+    task = loop.run_in_executor(None, worker)
+    try:
+        while True:
+            kind, value = await results.get()
+            if kind == 'done':
+                break
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        # 呼叫端提前停止時，清空暫存讓工作執行緒結束 (尚未送出的問題會被取消)
+        stop.set()
+        while not task.done():
+            while not results.empty():
+                results.get_nowait()
+            await asyncio.wait({task}, timeout=0.05)
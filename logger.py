@@ -35,6 +35,10 @@ class JsonFormatter(logging.Formatter):
             log_object['progress'] = record.progress
         if hasattr(record, 'status'):
             log_object['status'] = record.status
+        if hasattr(record, 'detail'):
+            log_object['detail'] = record.detail
+        if hasattr(record, 'partial'):
+            log_object['partial'] = record.partial
             
         return json.dumps(log_object, ensure_ascii=False)
 
@@ -101,6 +105,16 @@ class Logger:
     def debug(self, message: str, **kwargs):
         self._log(logging.DEBUG, message, **kwargs)
 
+    def close(self):
+        """
+        關閉所有 handler (釋放檔案描述符) 並從 logging 模組中移除此 logger，用於已結束的任務。
+        """
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+        logging.Logger.manager.loggerDict.pop(self.logger.name, None)
+        _loggers.pop(self.logger.name, None)
+
 def get_logger(name: str = "qa_verification", log_level: str = "INFO", log_dir: str = "logs", session_log_file: Optional[str] = None, log_queue: Optional[queue.Queue] = None, force_new: bool = False) -> Logger:
     """
     獲取 Logger 的實例。
@@ -5,20 +5,35 @@ QA 驗證系統主程式
 """
 
 import os
+import csv
+import json
 import requests
 import uuid
 import argparse
 import glob
-import re
-from typing import List, Dict, Optional
+import time
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
 
 from excel_handler import ExcelHandler
+from tabular_handler import QAFileHandler, open_qa_file
 from config import Config
 from logger import get_logger, Logger
-from similarity_analyzer import SimilarityAnalyzer
+from similarity_analyzer import SimilarityAnalyzer, get_shared_analyzer
+from profiler import profile_run, worker_thread_prefix
+from text_normalizer import ResponseNormalizer
+from batch_scheduler import BatchStats, LengthBucketScheduler
+from concurrency import (AdaptiveLimiter, PriorityLimiter, RateLimiter, get_chat_limiter, get_priority_limiter,
+                         get_rate_limiter, validate_priority)
+from task_control import TaskCancelled, TaskControl, get_control
+import metrics
+import telemetry
+import workspace_cache
+from workspace_cache import WorkspaceDirectory
 
 class QAVerificationSystem:
     """
@@ -26,37 +41,170 @@ class QAVerificationSystem:
     負責處理問答對的驗證、文件上傳和相似度分析等功能
     """
     
-    def __init__(self, config: Config, logger: Logger):
+    def __init__(self, config: Config, logger: Logger, similarity_analyzer: Optional[SimilarityAnalyzer] = None,
+                 session: Optional[requests.Session] = None, task_id: Optional[str] = None,
+                 control: Optional[TaskControl] = None):
         """
         初始化 QA 驗證系統
         
         Args:
             config (Config): 系統配置物件
             logger (Logger): 日誌記錄器實例
+            similarity_analyzer (Optional[SimilarityAnalyzer]): 要使用的分析器，
+                未提供時使用依模型名稱與推論後端共用的分析器 (模型只載入一次)
+            session (Optional[requests.Session]): 要共用的 HTTP 連線，未提供時建立新的 Session，
+                同一個系統的所有請求都會重複使用連線 (keep-alive)
+            task_id (Optional[str]): 速率限制在任務之間輪流分配權杖時使用的任務識別，
+                未提供時使用 logger 名稱 (Web 任務的 logger 以任務 ID 命名)
+            control (Optional[TaskControl]): 任務的取消與暫停控制器，未提供時使用以 task_id 註冊的控制器 (可能沒有)
         """
         self.config = config
         self.logger = logger
-        self.similarity_analyzer = SimilarityAnalyzer(self.config.analyzer.model)
+        self.similarity_analyzer = similarity_analyzer or get_shared_analyzer(
+            self.config.analyzer.model, self.config.analyzer.backend
+        )
+        self.session = session or requests.Session()
+        # 任務的優先等級：並行名額、速率限制的權杖與評分批次名額先分配給等級較高的任務
+        self.priority = validate_priority(self.config.api.priority)
+        # 自適應並行控制器依 AnythingLLM 位址共用，同一個伺服器的所有任務一起調整並行數
+        self.chat_limiter: Optional[AdaptiveLimiter] = None
+        # 未啟用自適應並行控制時，同一位址所有任務合計的固定並行上限 (api.shared_concurrency)
+        self.dispatch_limiter: Optional[PriorityLimiter] = None
+        if self.config.api.adaptive_concurrency:
+            self.chat_limiter = get_chat_limiter(self.config.api.base_url, self.config.api.adaptive_max_concurrency,
+                                                 self.config.api.adaptive_latency_tolerance,
+                                                 self.config.api.interactive_reserved)
+        elif self.config.api.shared_concurrency > 0:
+            self.dispatch_limiter = get_priority_limiter(self.config.api.base_url, self.config.api.shared_concurrency,
+                                                         self.config.api.interactive_reserved)
+        # 評分批次名額在整個程序內共用 (所有任務共用同一個評分模型)，未設定 analyzer.scoring_concurrency 時不限制
+        self.scoring_limiter: Optional[PriorityLimiter] = None
+        if self.config.analyzer.scoring_concurrency > 0:
+            self.scoring_limiter = get_priority_limiter('scoring', self.config.analyzer.scoring_concurrency,
+                                                        self.config.analyzer.scoring_reserved)
+        # 速率限制器依 AnythingLLM 位址在整個程序內共用
+        self.task_id = task_id or logger.logger.name
+        self.control = control or get_control(self.task_id)
+        self.rate_limiter: Optional[RateLimiter] = None
+        if self.config.api.rate_limit > 0:
+            self.rate_limiter = get_rate_limiter(self.config.api.base_url, self.config.api.rate_limit,
+                                                 self.config.api.rate_burst)
+        # 啟用的相似度指標 (模型在指標第一次計算時才載入)
+        metrics.load_plugins(self.config.analyzer.metric_plugins)
+        self.metrics = metrics.resolve_metrics(self.config.analyzer.metrics)
+        if self.config.analyzer.pass_metric not in self.metric_names:
+            raise ValueError(f"合格判定指標 '{self.config.analyzer.pass_metric}' 未在 analyzer.metrics 中啟用")
+        self.similarity_analyzer.load_models(self.metric_names)
+        # 長文模式下長文會切成多個視窗評分，排程成本不以模型最大長度截斷
+        self.scheduler = LengthBucketScheduler(token_budget=self.config.analyzer.batch_token_budget,
+                                               max_length=None if self.config.analyzer.long_text else 512)
+        # 本次執行 (process_qa_pairs / verify_stream) 所有評分批次的累計統計 (批次數、填充效率)
+        self.scoring_stats = BatchStats()
+        self.normalizer = ResponseNormalizer.from_config(self.config.normalizer)
+        # 每一列的聊天統計 (延遲、TTFT、每秒 token 數)，由 process_qa_pairs 填入
+        self.chat_stats: List[Dict] = []
+    
+    @property
+    def metric_names(self) -> List[str]:
+        return [spec.name for spec in self.metrics]
+    
+    @property
+    def chat_workers(self) -> int:
+        """每個工作區的聊天執行緒數 (自適應並行控制時由控制器限制實際同時進行的請求數)"""
+        if self.chat_limiter is not None:
+            return self.chat_limiter.max_limit
+        return max(1, self.config.api.max_concurrency)
+    
+    def _rate_limit(self):
+        """送出 AnythingLLM 請求前等待速率限制的權杖 (未設定 api.rate_limit 時立即返回)"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self.task_id, self.priority)
+    
+    def _chat_slot(self):
+        """聊天請求的並行名額 (未啟用自適應並行控制且未設定 api.shared_concurrency 時不限制)"""
+        if self.chat_limiter is not None:
+            return self.chat_limiter.slot(self.priority)
+        if self.dispatch_limiter is not None:
+            return self.dispatch_limiter.slot(self.priority)
+        return nullcontext()
+    
+    def _scoring_slot(self):
+        """評分批次的名額 (未設定 analyzer.scoring_concurrency 時不限制)"""
+        return self.scoring_limiter.slot(self.priority) if self.scoring_limiter is not None else nullcontext()
+    
+    def checkpoint(self):
+        """
+        送出請求或評分前的檢查點：任務暫停時在此等待
+
+        Raises:
+            TaskCancelled: 任務已被取消
+        """
+        if self.control is not None:
+            self.control.checkpoint()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.control is not None and self.control.cancelled
+    
+    def concurrency_detail(self) -> Dict[str, int]:
+        """目前的並行上限與進行中的請求數，附加在進度事件的 detail"""
+        limiter = self.chat_limiter or self.dispatch_limiter
+        if limiter is None:
+            return {'concurrency_limit': self.chat_workers}
+        return {'concurrency_limit': limiter.limit, 'in_flight': limiter.in_flight}
+    
+    @property
+    def _cache_key(self) -> workspace_cache.CacheKey:
+        return workspace_cache.cache_key(self.config.api.base_url, self.config.api.api_key)
     
     def validate_api_key(self):
         """
-        驗證 API 金鑰是否有效
+        驗證 API 金鑰是否有效 (成功結果快取 api.auth_cache_ttl 秒)
         """
-        try:
-            response = requests.get(
+        def load() -> bool:
+            self._rate_limit()
+            response = self.session.get(
                 f'{self.config.api.base_url}/api/v1/auth',
                 headers=self.config.get_headers()
             )
             response.raise_for_status()
+            telemetry.API_REQUESTS.labels(endpoint='auth', status='success').inc()
+            return True
+        
+        try:
+            workspace_cache.API_KEYS.get_or_load(self._cache_key, load, self.config.api.auth_cache_ttl)
             self.logger.info("[SUCCESS] API 金鑰驗證成功")
             return True
         except requests.exceptions.RequestException as e:
+            telemetry.API_REQUESTS.labels(endpoint='auth', status='error').inc()
             self.logger.error(f"[ERROR] API 金鑰驗證失敗: {e}")
             return False
         except Exception as e:
+            telemetry.API_REQUESTS.labels(endpoint='auth', status='error').inc()
             self.logger.error(f"[ERROR] API 金鑰驗證時發生錯誤: {e}", exc_info=True)
             return False
 
+    def get_workspaces(self, refresh: bool = False) -> WorkspaceDirectory:
+        """
+        取得工作區列表 (快取 api.workspace_cache_ttl 秒，同一位址與金鑰的所有任務共用)
+        
+        Args:
+            refresh (bool): 是否略過快取重新下載
+        """
+        def load() -> WorkspaceDirectory:
+            self._rate_limit()
+            response = self.session.get(
+                f'{self.config.api.base_url}/api/v1/workspaces',
+                headers=self.config.get_headers()
+            )
+            response.raise_for_status()
+            telemetry.API_REQUESTS.labels(endpoint='workspaces', status='success').inc()
+            workspaces = response.json()
+            return WorkspaceDirectory(workspaces.get('workspaces', []) if isinstance(workspaces, dict) else workspaces)
+        
+        return workspace_cache.WORKSPACES.get_or_load(self._cache_key, load, self.config.api.workspace_cache_ttl,
+                                                      refresh=refresh)
+    
     def get_workspace_slug(self, workspace_identifier: str) -> Optional[str]:
         """
         獲取工作區的 slug
@@ -69,27 +217,20 @@ class QAVerificationSystem:
         """
         try:
             self.logger.info(f"[INFO] 搜尋工作區: {workspace_identifier}")
-            response = requests.get(
-                f'{self.config.api.base_url}/api/v1/workspaces',
-                headers=self.config.get_headers()
-            )
-            response.raise_for_status()
-            workspaces = response.json()
-            
-            workspace_list = workspaces.get('workspaces', []) if isinstance(workspaces, dict) else workspaces
-            for workspace in workspace_list:
-                if isinstance(workspace, dict):
-                    # 同時檢查 name 和 slug
-                    if (workspace.get('name') == workspace_identifier or 
-                        workspace.get('slug') == workspace_identifier):
-                        found_slug = workspace.get('slug')
-                        found_name = workspace.get('name')
-                        self.logger.info(f"[SUCCESS] 找到工作區: {found_name} (slug: {found_slug})")
-                        return found_slug
+            # 同時檢查 name 和 slug；快取中找不到時重新下載一次，以免漏掉快取後才在其他地方建立的工作區
+            workspace = self.get_workspaces().find(workspace_identifier)
+            if workspace is None and self.config.api.workspace_cache_ttl > 0:
+                workspace = self.get_workspaces(refresh=True).find(workspace_identifier)
+            if workspace:
+                found_slug = workspace.get('slug')
+                found_name = workspace.get('name')
+                self.logger.info(f"[SUCCESS] 找到工作區: {found_name} (slug: {found_slug})")
+                return found_slug
             
             self.logger.warning(f"[WARNING] 工作區 '{workspace_identifier}' 不存在")
             return None
         except Exception as e:
+            telemetry.API_REQUESTS.labels(endpoint='workspaces', status='error').inc()
             self.logger.error(f"[ERROR] 獲取工作區時發生錯誤: {e}", exc_info=True)
             return None
         
@@ -120,7 +261,8 @@ class QAVerificationSystem:
                 "topN": ws_config.top_n
             }
             
-            response = requests.post(
+            self._rate_limit()
+            response = self.session.post(
                 f'{self.config.api.base_url}/api/v1/workspace/new',
                 headers=self.config.get_headers(),
                 json=payload,
@@ -128,19 +270,23 @@ class QAVerificationSystem:
             )
             
             response.raise_for_status()
+            telemetry.API_REQUESTS.labels(endpoint='workspace_new', status='success').inc()
             
             result = response.json().get('workspace')
             if not result or 'slug' not in result:
                 self.logger.error("[ERROR] API 回應中未包含工作區 slug")
                 return None
                 
+            workspace_cache.WORKSPACES.invalidate(self._cache_key)
             self.logger.info(f"[SUCCESS] 成功創建工作區: {workspace_name}")
             return result.get('slug')
             
         except requests.exceptions.Timeout:
+            telemetry.API_REQUESTS.labels(endpoint='workspace_new', status='error').inc()
             self.logger.error("[ERROR] 創建工作區失敗，請求超時")
             return None
         except requests.exceptions.RequestException as e:
+            telemetry.API_REQUESTS.labels(endpoint='workspace_new', status='error').inc()
             self.logger.error(f"[ERROR] 創建工作區失敗，網路錯誤: {e}")
             return None
         except Exception as e:
@@ -158,6 +304,7 @@ class QAVerificationSystem:
         Returns:
             Optional[Dict]: API 回應的 JSON 資料，如果發生錯誤則返回 None
         """
+        start_time = time.perf_counter()
         try:
             session_id = str(uuid.uuid4())
             payload = {
@@ -167,95 +314,471 @@ class QAVerificationSystem:
                 "reset": False
             }
             
-            response = requests.post(
-                f'{self.config.api.base_url}/api/v1/workspace/{workspace_slug}/chat',
-                headers=self.config.get_headers(),
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
+            self._rate_limit()
+            with self._chat_slot():
+                response = self.session.post(
+                    f'{self.config.api.base_url}/api/v1/workspace/{workspace_slug}/chat',
+                    headers=self.config.get_headers(),
+                    json=payload
+                )
+                response.raise_for_status()
+                result = response.json()
+            telemetry.CHAT_REQUESTS.labels(status='success').inc()
+            return result
         except Exception as e:
+            telemetry.CHAT_REQUESTS.labels(status='error').inc()
             self.logger.error(f"[ERROR] 聊天操作時發生錯誤: {e}", exc_info=True)
             return None
+        finally:
+            telemetry.CHAT_LATENCY_SECONDS.observe(time.perf_counter() - start_time)
+    
+    def send_chat_message_stream(self, workspace_slug: str, message: str,
+                                 on_chunk: Optional[Callable[[str], None]] = None) -> Optional[Dict]:
+        """
+        透過串流聊天端點發送訊息，逐段接收回答並即時進行正規化 (移除 <think> 區塊等)
+        
+        Args:
+            workspace_slug (str): 工作區的 slug
+            message (str): 要發送的訊息內容
+            on_chunk (Optional[Callable[[str], None]]): 每收到一段已清理的文字時呼叫
+            
+        Returns:
+            Optional[Dict]: 包含 textResponse (原始回答)、cleanedResponse (已清理回答)
+            以及 ttft、tokens、tokens_per_second、duration、dropped_bytes 統計，發生錯誤時返回 None
+        """
+        start_time = time.perf_counter()
+        first_token_time = None
+        tokens = 0
+        raw_parts = []
+        normalizer_stream = self.normalizer.stream()
+        try:
+            payload = {
+                "message": message,
+                "mode": self.config.workspace.chat_mode,
+                "sessionId": str(uuid.uuid4()),
+                "reset": False
+            }
+            
+            self._rate_limit()
+            with self._chat_slot(), self.session.post(
+                f'{self.config.api.base_url}/api/v1/workspace/{workspace_slug}/stream-chat',
+                headers=self.config.get_headers(),
+                json=payload,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                # SSE 未必標示字元集，明確指定以免中文被錯誤解碼
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    event = json.loads(line[5:].strip())
+                    if event.get('type') == 'abort' or event.get('error'):
+                        raise RuntimeError(event.get('error') or '串流被伺服器中止')
+                    
+                    chunk = event.get('textResponse') or ''
+                    if chunk:
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                        tokens += 1
+                        raw_parts.append(chunk)
+                        cleaned = normalizer_stream.feed(chunk)
+                        if cleaned and on_chunk:
+                            on_chunk(cleaned)
+                    if event.get('close'):
+                        break
+            
+            tail = normalizer_stream.flush()
+            if tail and on_chunk:
+                on_chunk(tail)
+            normalized = normalizer_stream.result()
+            telemetry.NORMALIZER_DROPPED_BYTES.inc(normalized.dropped_bytes)
+            
+            end_time = time.perf_counter()
+            ttft = first_token_time - start_time if first_token_time is not None else None
+            generation_time = end_time - first_token_time if first_token_time is not None else 0.0
+            tokens_per_second = tokens / generation_time if generation_time > 0 else None
+            
+            telemetry.CHAT_REQUESTS.labels(status='success').inc()
+            if ttft is not None:
+                telemetry.CHAT_TTFT_SECONDS.observe(ttft)
+            if tokens_per_second is not None:
+                telemetry.CHAT_TOKENS_PER_SECOND.observe(tokens_per_second)
+            
+            return {
+                'textResponse': ''.join(raw_parts),
+                'cleanedResponse': normalized.text,
+                'ttft': ttft,
+                'tokens': tokens,
+                'tokens_per_second': tokens_per_second,
+                'duration': end_time - start_time,
+                'dropped_bytes': normalized.dropped_bytes
+            }
+        except Exception as e:
+            telemetry.CHAT_REQUESTS.labels(status='error').inc()
+            self.logger.error(f"[ERROR] 串流聊天操作時發生錯誤: {e}", exc_info=True)
+            return None
+        finally:
+            telemetry.CHAT_LATENCY_SECONDS.observe(time.perf_counter() - start_time)
+    
+    def get_llm_answer(self, workspace_slug: str, question: str,
+                       on_partial: Optional[Callable[[str], None]] = None) -> Optional[Tuple[str, Dict]]:
+        """
+        取得已正規化的 LLM 回答，依 config.api.streaming 選擇串流或一般聊天端點
+        
+        Args:
+            workspace_slug (str): 工作區的 slug
+            question (str): 問題內容
+            on_partial (Optional[Callable[[str], None]]): 串流模式下每段已清理文字的回呼
+            
+        Returns:
+            Optional[Tuple[str, Dict]]: (已清理的回答, 聊天統計)，無法取得回答時返回 None
+            
+        Raises:
+            TaskCancelled: 任務已被取消 (尚未送出請求)
+        """
+        self.checkpoint()
+        if self.config.api.streaming:
+            result = self.send_chat_message_stream(workspace_slug, question, on_chunk=on_partial)
+            if result is None:
+                return None
+            stats = {key: result[key] for key in ('duration', 'ttft', 'tokens', 'tokens_per_second', 'dropped_bytes')}
+            return result['cleanedResponse'], stats
+        
+        start_time = time.perf_counter()
+        response = self.send_chat_message(workspace_slug, question)
+        if response and 'textResponse' in response:
+            normalized = self.normalizer.normalize(response['textResponse'])
+            telemetry.NORMALIZER_DROPPED_BYTES.inc(normalized.dropped_bytes)
+            return normalized.text, {'duration': time.perf_counter() - start_time, 'dropped_bytes': normalized.dropped_bytes}
+        return None
     
-    def process_qa_pairs(self, workspace_slug: str, excel_handler: ExcelHandler, web_mode: bool = False) -> List[Dict[str, float]]:
+    def score_pairs(self, responses: List[str], references: List[str]) -> List[Dict[str, float]]:
+        """
+        計算啟用指標 (analyzer.metrics) 的分數，結果順序與輸入相同
+        
+        開啟分層評分 (analyzer.cascade) 時，先以字元 n-gram F1 與字元 ROUGE-L 判定明顯合格或不合格的列，
+        只有其餘的列計算需要模型的指標；每列另外記錄字元指標與判定層級 (scoring_tier)。
+        由字元指標判定的列，需要模型的指標分數為 None，合格與否見 metrics.is_passed。
+        
+        Args:
+            responses (List[str]): LLM 回答
+            references (List[str]): 對應的標準答案
+            
+        Returns:
+            List[Dict[str, float]]: 每組的相似度分數
+        """
+        if not responses:
+            return []
+        analyzer_config = self.config.analyzer
+        if not analyzer_config.cascade:
+            return self._score_metrics(responses, references, self.metrics)
+        
+        lexical = self.similarity_analyzer.calculate_similarity_batch(responses, references,
+                                                                      metrics=metrics.CASCADE_METRICS)
+        # 判定界線不跨越合格閾值，讓合格判定 (metrics.is_passed) 與字元指標的判定結果一致
+        threshold = analyzer_config.similarity_threshold
+        pass_above = max(analyzer_config.cascade_pass, threshold)
+        decided = set()
+        for index, lexical_scores in enumerate(lexical):
+            if (lexical_scores['rouge_l'] >= pass_above
+                    or (lexical_scores['char_ngram_f1'] <= analyzer_config.cascade_fail
+                        and max(lexical_scores.values()) < threshold)):
+                decided.add(index)
+        
+        columns = metrics.output_columns(self.metric_names, cascade=True)
+        remaining = [spec for spec in self.metrics if spec.name not in metrics.CASCADE_METRICS]
+        model_rows = [index for index in range(len(responses)) if index not in decided]
+        model_scores = iter(self._score_metrics([responses[i] for i in model_rows],
+                                                [references[i] for i in model_rows], remaining))
+        scores = []
+        for index, lexical_scores in enumerate(lexical):
+            if index in decided:
+                row_scores = {spec.name: None for spec in remaining}
+                tier = 'lexical'
+            else:
+                row_scores = next(model_scores)
+                tier = 'model'
+            row_scores.update(lexical_scores)
+            row_scores['scoring_tier'] = tier
+            scores.append({column: row_scores[column] for column in columns})
+        telemetry.SCORING_TIERS.labels(tier='lexical').inc(len(decided))
+        telemetry.SCORING_TIERS.labels(tier='model').inc(len(model_rows))
+        if len(responses) > 1:
+            self.logger.info(f"[INFO] 分層評分: {len(decided)} 個問答對由字元指標判定，{len(model_rows)} 個交給模型評分")
+        return scores
+    
+    def _score_metrics(self, responses: List[str], references: List[str],
+                       specs: List['metrics.MetricSpec']) -> List[Dict[str, float]]:
+        """
+        計算指定指標的分數：不需要模型的指標一次計算所有列，需要模型的指標依長度分桶批次評分
+        """
+        if not responses:
+            return []
+        analyzer = self.similarity_analyzer
+        model_metrics = [spec.name for spec in specs if spec.model]
+        free_metrics = [spec.name for spec in specs if not spec.model]
+        
+        free_scores = (analyzer.calculate_similarity_batch(responses, references, metrics=free_metrics)
+                       if free_metrics else [{} for _ in responses])
+        model_scores = [{} for _ in responses]
+        if model_metrics:
+            long_text = self.config.analyzer.long_text
+            overlap = self.config.analyzer.long_text_overlap
+            
+            def score_fn(batch_responses: List[str], batch_references: List[str]) -> List[Dict[str, float]]:
+                # 每個批次前檢查暫停與取消，再依優先等級等待評分名額
+                self.checkpoint()
+                with self._scoring_slot():
+                    if long_text:
+                        return analyzer.calculate_similarity_batch(batch_responses, batch_references,
+                                                                   metrics=model_metrics, long_text_overlap=overlap)
+                    return analyzer.calculate_similarity_batch(batch_responses, batch_references,
+                                                               batch_size=len(batch_responses), metrics=model_metrics)
+            model_scores, stats = self.scheduler.run(responses, references, score_fn)
+            self.scoring_stats.merge(stats)
+            if stats.pairs > 1:
+                self.logger.info(f"[INFO] 評分 {stats.pairs} 個問答對，共 {stats.batches} 個批次，"
+                                 f"填充效率 {stats.padding_efficiency:.1%}")
+        
+        return [{spec.name: {**free, **model}[spec.name] for spec in specs}
+                for free, model in zip(free_scores, model_scores)]
+    
+    def process_qa_pairs(self, workspace_slug: str, excel_handler: QAFileHandler, web_mode: bool = False,
+                         progress_range: Tuple[float, float] = (30, 85)) -> List[Dict[str, float]]:
         """
         處理問答對並計算相似度分數
         
+        依 file.chunk_size 逐區塊讀取問答對：每個區塊先取得所有問題的 LLM 回答
+        (依 api.max_concurrency 或自適應並行控制同時發送)，再以長度分桶批次評分，最後依輸入順序寫回。
+        CSV / JSONL / Parquet 問答集以串流方式讀寫，不會一次載入整個檔案。
+        任務被取消時不再送出新的問題，等待已送出的請求完成後寫出已取得的回答與分數並返回 (部分結果)。
+        
         Args:
             workspace_slug (str): 工作區的 slug
-            excel_handler (ExcelHandler): Excel 檔案處理器實例
+            excel_handler (QAFileHandler): 問答集處理器 (ExcelHandler 或 tabular_handler 的串流處理器)
             web_mode (bool): 是否為 Web 模式，用於控制進度條的顯示
+            progress_range (Tuple[float, float]): 此階段在整體進度中所佔的範圍
             
         Returns:
-            List[Dict[str, float]]: 所有問答對的相似度分數列表
+            List[Dict[str, float]]: 所有成功取得回答的問答對的相似度分數列表 (依輸入順序)
         """
-        all_similarity_scores = []
-        all_qa_pairs = excel_handler.get_all_qa_pairs()
+        self.chat_stats = []
+        self.scoring_stats = BatchStats()
+        progress_start, progress_end = progress_range
+        sheet_totals = excel_handler.count_qa_pairs()
         
-        total_qa_pairs = sum(len(qa_pairs) for qa_pairs in all_qa_pairs.values())
+        total_qa_pairs = sum(sheet_totals.values())
         self.logger.info(f"[INFO] 開始處理 {total_qa_pairs} 個問答對")
 
-        # 計算進度用的變數
+        sheet_names = list(sheet_totals)
+        sheet_done = dict.fromkeys(sheet_names, 0)
+        total_sheets = len(sheet_names)
+        score_keys = metrics.output_columns(self.metric_names, cascade=self.config.analyzer.cascade)
+        chunk_size = max(1, self.config.file.chunk_size)
+        all_similarity_scores = []
         processed_count = 0
-        total_sheets = len(all_qa_pairs)
-        current_sheet_index = 0
+        cancelled = False
+
+        # 在 Web 模式下禁用 tqdm 的視覺輸出，避免污染日誌
+        with tqdm(total=total_qa_pairs, desc="處理中", unit="對", disable=web_mode) as pbar, \
+                ThreadPoolExecutor(max_workers=self.chat_workers,
+                                   thread_name_prefix=worker_thread_prefix(self.task_id)) as executor:
+            # 每個區塊：(工作表, 問題, 標準答案, 原始列索引)，所有工作表的問題一起送出
+            for rows in excel_handler.iter_qa_chunks(chunk_size):
+                if self.cancelled:
+                    cancelled = True
+                    break
+                answers: List[Optional[Tuple[str, Dict]]] = [None] * len(rows)
+                skipped = set()  # 因取消而未送出的列
+                futures = {
+                    executor.submit(self.get_llm_answer, workspace_slug, question): index
+                    for index, (_, question, _, _) in enumerate(rows)
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    sheet_name, question, excel_answer, original_row_index = rows[index]
+                    try:
+                        answers[index] = future.result()
+                    except TaskCancelled:
+                        cancelled = True
+                        skipped.add(index)
+                        continue
+                    except Exception as e:
+                        self.logger.error(f"[ERROR] {sheet_name} 第 {original_row_index + 1} 列發生錯誤: {e}", exc_info=True)
+                    processed_count += 1
+                    sheet_done[sheet_name] += 1
+                    pbar.update(1)
 
-        for sheet_name, qa_pairs in all_qa_pairs.items():
-            current_sheet_index += 1
-            self.logger.info(f"[INFO] 處理工作表: {sheet_name} ({current_sheet_index}/{total_sheets})")
-            
-            # 在 Web 模式下禁用 tqdm 的視覺輸出，避免污染日誌
-            with tqdm(total=len(qa_pairs), desc=f"處理中: {sheet_name}", unit="對", disable=web_mode) as pbar:
-                for row_index, (question, excel_answer, original_row_index) in enumerate(qa_pairs):
                     if web_mode:
                         # 計算詳細進度
-                        processed_count += 1
+                        sheet_total = sheet_totals[sheet_name]
                         overall_progress = (processed_count / total_qa_pairs) * 100
-                        sheet_progress = ((row_index + 1) / len(qa_pairs)) * 100
+                        sheet_progress = (sheet_done[sheet_name] / sheet_total) * 100
+                        concurrency_detail = self.concurrency_detail()
                         
-                        # 發送詳細的進度資訊 (30-85% 範圍)
+                        # 發送詳細的進度資訊 (預設為 30-85% 範圍)
                         progress_data = {
-                            "progress": 30 + (overall_progress * 0.55),  # 30-85% 範圍
-                            "status": f"處理中: {sheet_name} - 第 {row_index + 1}/{len(qa_pairs)} 筆 ({sheet_progress:.1f}%)",
+                            "progress": progress_start + overall_progress / 100 * (progress_end - progress_start),
+                            "status": f"處理中: {sheet_name} - 第 {sheet_done[sheet_name]}/{sheet_total} 筆 ({sheet_progress:.1f}%)"
+                                      f" - 並行數 {concurrency_detail['concurrency_limit']}",
                             "detail": {
                                 "current_sheet": sheet_name,
-                                "current_sheet_index": current_sheet_index,
+                                "current_sheet_index": sheet_names.index(sheet_name) + 1,
                                 "total_sheets": total_sheets,
-                                "current_item": row_index + 1,
-                                "total_items_in_sheet": len(qa_pairs),
+                                "current_item": sheet_done[sheet_name],
+                                "total_items_in_sheet": sheet_total,
                                 "processed_items": processed_count,
                                 "total_items": total_qa_pairs,
                                 "sheet_progress": sheet_progress,
-                                "overall_progress": overall_progress
+                                "overall_progress": overall_progress,
+                                **concurrency_detail
                             }
                         }
-                        self.logger.info(f"[PROGRESS] 正在處理: {sheet_name} - 第 {row_index + 1}/{len(qa_pairs)} 筆", **progress_data)
-                    
-                    response = self.send_chat_message(workspace_slug, question)
-                    if response and 'textResponse' in response:
-                        llm_response = response['textResponse']
-                        # 清理<think></think>之間的文字
-                        llm_response = re.sub(r'<think>.*?</think>', '', llm_response, flags=re.DOTALL).strip()
-                        similarity_scores = self.similarity_analyzer.calculate_similarity(
-                            llm_response, excel_answer
-                        )
-                        all_similarity_scores.append(similarity_scores)
-                        
-                        excel_handler.write_llm_response(sheet_name, original_row_index, llm_response)
-                        excel_handler.write_similarity_scores(sheet_name, original_row_index, similarity_scores)
-                        pbar.update(1)
-                    else:
+                        self.logger.info(f"[PROGRESS] 已完成: {sheet_name} - 第 {sheet_done[sheet_name]}/{sheet_total} 筆", **progress_data)
+
+                # 已取得回答的列在區塊中的位置，依輸入順序
+                answered: List[int] = []
+                for index, ((sheet_name, question, _, original_row_index), answer) in enumerate(zip(rows, answers)):
+                    if answer:
+                        self.chat_stats.append({'sheet': sheet_name, 'row': original_row_index + 1, **answer[1]})
+                        answered.append(index)
+                    elif index not in skipped:
                         self.logger.warning(f"[WARNING] 問題 '{question[:20]}...' 無法獲取 LLM 回答")
-                        pbar.update(1)
+                        telemetry.ROWS_PROCESSED.labels(result='failed').inc()
+                
+                # 依長度分桶批次評分，並依原順序寫回
+                results: List[Optional[Tuple[str, Dict[str, float]]]] = [None] * len(rows)
+                if answered:
+                    self.logger.info(f"[INFO] 計算 {len(answered)} 個問答對的相似度...",
+                                     progress=progress_start + processed_count / total_qa_pairs * (progress_end - progress_start),
+                                     status=f"計算相似度: {len(answered)} 個問答對")
+                    try:
+                        chunk_scores = self.score_pairs([answers[i][0] for i in answered], [rows[i][2] for i in answered])
+                    except TaskCancelled:
+                        # 評分途中取消：仍寫出已取得的回答 (不含分數)
+                        cancelled = True
+                        chunk_scores = [{} for _ in answered]
+                    for index, similarity_scores in zip(answered, chunk_scores):
+                        results[index] = (answers[index][0], similarity_scores)
+                    scored = [similarity_scores for similarity_scores in chunk_scores if similarity_scores]
+                    all_similarity_scores.extend(scored)
+                    telemetry.ROWS_PROCESSED.labels(result='scored').inc(len(scored))
+                excel_handler.write_results(rows, results, score_keys)
+                if cancelled:
+                    break
+
+        if all_similarity_scores:
+            excel_handler.write_score_headers(metrics.score_headers(all_similarity_scores[0].keys()))
+        if self.chat_limiter is not None:
+            self.logger.info(f"[INFO] 自適應並行控制目前的並行上限: {self.chat_limiter.limit}")
         
-        self.logger.info(f"[SUCCESS] 問答對處理完成")
+        if cancelled:
+            self.logger.warning(f"[WARNING] 任務已取消，共處理 {processed_count}/{total_qa_pairs} 個問答對，將儲存部分結果")
+        else:
+            self.logger.info(f"[SUCCESS] 問答對處理完成")
+        dropped_bytes = sum(stats.get('dropped_bytes', 0) for stats in self.chat_stats)
+        if dropped_bytes:
+            self.logger.info(f"[INFO] 回答正規化共移除 {dropped_bytes} bytes (think 區塊、Markdown、引用等)")
+        if self.scoring_stats.batches:
+            self.logger.info(f"[INFO] 評分批次統計: {self.scoring_stats.pairs} 個問答對，共 {self.scoring_stats.batches} 個批次，"
+                             f"填充效率 {self.scoring_stats.padding_efficiency:.1%}")
 
         return all_similarity_scores
     
+    def verify_stream(self, workspace_slug: str, pairs: Iterable[Tuple[str, str]],
+                      score_batch_size: int = 32) -> Iterator[Dict]:
+        """
+        逐筆驗證問答對，依完成順序產生結果
+        
+        與 process_qa_pairs 相同，問題以 api.max_concurrency 或自適應並行控制同時發送，回答以 score_pairs 批次評分；
+        不同的是 pairs 只在有空閒名額時才讀取 (最多預先送出兩倍執行緒數的問題)，
+        已取得的回答累積到 score_batch_size 筆，或暫時沒有其他回答完成時立即評分並產生結果，
+        因此可處理任意長度的輸入而不需要一次載入。
+        
+        Args:
+            workspace_slug (str): 工作區的 slug
+            pairs (Iterable[Tuple[str, str]]): (問題, 標準答案)
+            score_batch_size (int): 一次評分的最大筆數
+            
+        Yields:
+            Dict: 包含 index (輸入順序)、question、standard_answer，成功時另有 llm_response、
+            similarity_scores、passed 與 chat_stats，失敗時為 error
+        """
+        pass_metric = self.config.analyzer.pass_metric
+        threshold = self.config.analyzer.similarity_threshold
+        self.scoring_stats = BatchStats()
+        window = self.chat_workers * 2
+        source = enumerate(pairs)
+        exhausted = False
+        pending: Dict = {}  # future -> (index, 問題, 標準答案)
+        answered: List[Tuple[int, str, str, str, Dict]] = []
+        
+        def score_answered() -> Iterator[Dict]:
+            all_scores = self.score_pairs([row[3] for row in answered], [row[2] for row in answered])
+            telemetry.ROWS_PROCESSED.labels(result='scored').inc(len(answered))
+            for (index, question, reference, llm_response, chat_stats), scores in zip(answered, all_scores):
+                yield {
+                    'index': index,
+                    'question': question,
+                    'standard_answer': reference,
+                    'llm_response': llm_response,
+                    'similarity_scores': scores,
+                    'passed': metrics.is_passed(scores, pass_metric, threshold),
+                    'chat_stats': chat_stats,
+                }
+            answered.clear()
+        
+        with ThreadPoolExecutor(max_workers=self.chat_workers,
+                                thread_name_prefix=worker_thread_prefix(self.task_id)) as executor:
+            try:
+                while True:
+                    while not exhausted and len(pending) < window:
+                        try:
+                            index, (question, reference) = next(source)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        if not question or not reference:
+                            telemetry.ROWS_PROCESSED.labels(result='failed').inc()
+                            yield {'index': index, 'question': question, 'standard_answer': reference,
+                                   'error': '缺少問題或標準答案'}
+                            continue
+                        pending[executor.submit(self.get_llm_answer, workspace_slug, question)] = (index, question, reference)
+                
+                    if answered and (len(answered) >= score_batch_size or not any(future.done() for future in pending)):
+                        yield from score_answered()
+                        continue
+                    if not pending:
+                        if exhausted:
+                            break
+                        continue
+                
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, question, reference = pending.pop(future)
+                        try:
+                            answer = future.result()
+                        except Exception as e:
+                            self.logger.error(f"[ERROR] 第 {index + 1} 筆發生錯誤: {e}", exc_info=True)
+                            answer = None
+                        if answer:
+                            answered.append((index, question, reference, *answer))
+                        else:
+                            telemetry.ROWS_PROCESSED.labels(result='failed').inc()
+                            yield {'index': index, 'question': question, 'standard_answer': reference,
+                                   'error': '無法獲取 LLM 回答'}
+            finally:
+                # 呼叫端提前停止讀取結果時，取消尚未開始的請求
+                for future in pending:
+                    future.cancel()
+    
     def upload_documents(self, workspace_slug: str, directory: str) -> bool:
         """
         上傳指定目錄中的所有支援文件到 AnythingLLM
+        
+        Raises:
+            TaskCancelled: 任務已被取消 (已上傳的檔案保留在工作區中)
         """
         try:
             self.logger.info(f"[INFO] 開始從目錄: '{directory}' 上傳文件")
@@ -276,17 +799,21 @@ class QAVerificationSystem:
 
             with tqdm(total=len(file_paths), desc="上傳檔案", unit="個") as pbar:
                 for i, file_path in enumerate(file_paths):
+                    self.checkpoint()
                     try:
+                        self._rate_limit()
                         with open(file_path, 'rb') as f:
                             files = {'file': (os.path.basename(file_path), f)}
-                            response = requests.post(
+                            response = self.session.post(
                                 f'{self.config.api.base_url}/api/v1/workspace/{workspace_slug}/upload',
                                 headers={'Authorization': self.config.get_headers()['Authorization']},
                                 files=files
                             )
                             response.raise_for_status()
+                            telemetry.API_REQUESTS.labels(endpoint='upload', status='success').inc()
                             self.logger.info(f"[SUCCESS] 成功上傳檔案: {os.path.basename(file_path)}")
                     except Exception as e:
+                        telemetry.API_REQUESTS.labels(endpoint='upload', status='error').inc()
                         self.logger.error(f"[ERROR] 上傳檔案失敗: {os.path.basename(file_path)} - {e}")
                     finally:
                         pbar.update(1)
@@ -300,96 +827,211 @@ class QAVerificationSystem:
                                            status=f"上傳檔案: {os.path.basename(file_path)} ({upload_progress:.1f}%)")
             
             return True
+        except TaskCancelled:
+            raise
         except Exception as e:
             self.logger.error(f"[ERROR] 上傳文件時發生嚴重錯誤: {e}", exc_info=True)
             return False
 
-def run_verification(config: Config, logger: Logger, args: argparse.Namespace, web_mode: bool = False):
+class PartialResponseForwarder:
+    """
+    將串流中的部分回答節流後透過日誌轉送 (Web 模式下即為 SSE 串流)
     """
-    執行完整的 QA 驗證流程
     
-    Args:
-        config (Config): 系統配置物件
-        logger (Logger): 日誌記錄器實例
-        args (argparse.Namespace): 命令列參數
-        web_mode (bool): 是否為 Web 模式，影響日誌和進度條顯示
+    def __init__(self, logger: Logger, interval: float = 0.2):
+        self.logger = logger
+        self.interval = interval
+        self.received_chars = 0
+        self._buffer: List[str] = []
+        self._last_emit = 0.0
+    
+    def __call__(self, text: str):
+        self._buffer.append(text)
+        self.received_chars += len(text)
+        if time.perf_counter() - self._last_emit >= self.interval:
+            self.flush()
+    
+    def flush(self):
+        if not self._buffer:
+            return
+        partial = ''.join(self._buffer)
+        self._buffer.clear()
+        self._last_emit = time.perf_counter()
+        self.logger.info(f"[STREAM] 已接收 {self.received_chars} 字", partial=partial)
+
+def write_chat_timings(chat_stats: List[Dict], output_dir: str) -> Optional[str]:
     """
-    # 進度分配：
-    # 0-10%: 初始化
-    # 10-20%: API驗證和工作區準備
-    # 20-30%: 文件上傳（如果有）
-    # 30-85%: 問答對處理（主要階段）
-    # 85-95%: 生成分析圖表
-    # 95-100%: 儲存結果
+    將每一列的串流聊天統計寫成 CSV
     
-    logger.info("[START] QA 驗證系統啟動", progress=0, status="系統初始化中...")
-    logger.info(f"[INFO] 工作區: {args.workspace}", progress=5, status="載入配置...")
+    Returns:
+        Optional[str]: 輸出檔案路徑，沒有串流統計時返回 None
+    """
+    if not any(stats.get('ttft') is not None for stats in chat_stats):
+        return None
+    output_path = os.path.join(output_dir, 'chat_timings.csv')
+    fields = ['sheet', 'row', 'duration', 'ttft', 'tokens', 'tokens_per_second', 'dropped_bytes']
+    with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(chat_stats)
+    return output_path
 
-    system = QAVerificationSystem(config, logger)
+def prepare_workspace(system: QAVerificationSystem, args: argparse.Namespace) -> Optional[str]:
+    """
+    驗證 API 金鑰、取得 (或建立) 工作區並上傳參考文件 (進度 10-30%)
+    
+    Args:
+        system (QAVerificationSystem): 驗證系統實例
+        args (argparse.Namespace): 命令列參數 (使用 workspace 與 directory)
+        
+    Returns:
+        Optional[str]: 工作區的 slug，無法繼續時返回 None
+    """
+    logger = system.logger
     
     # 1. 驗證 API 金鑰
     logger.info("[INFO] 驗證 API 金鑰...", progress=10, status="驗證 API 金鑰...")
-    if not system.validate_api_key():
+    with telemetry.STAGE_SECONDS.labels(stage='validate_api_key').time():
+        api_key_valid = system.validate_api_key()
+    if not api_key_valid:
         logger.error("[ERROR] API 金鑰無效，終止程序。")
-        return
+        return None
 
     # 2. 獲取或創建工作區
     logger.info("[INFO] 搜尋工作區...", progress=12, status="搜尋工作區...")
-    workspace_slug = system.get_workspace_slug(args.workspace)
-    if not workspace_slug:
-        logger.info("[INFO] 創建新工作區...", progress=14, status="創建新工作區...")
-        workspace_slug = system.create_workspace(args.workspace)
+    with telemetry.STAGE_SECONDS.labels(stage='workspace').time():
+        workspace_slug = system.get_workspace_slug(args.workspace)
+        if not workspace_slug:
+            logger.info("[INFO] 創建新工作區...", progress=14, status="創建新工作區...")
+            workspace_slug = system.create_workspace(args.workspace)
     
     if not workspace_slug:
         logger.error("[ERROR] 無法獲取或創建工作區，終止程序。")
-        return
+        return None
         
     logger.info(f"[SUCCESS] 工作區 '{args.workspace}' (slug: {workspace_slug}) 已就緒", progress=20, status="工作區準備完成")
     
     # 3. 處理文件上傳 (如果提供了目錄)
     if args.directory and os.path.isdir(args.directory):
         logger.info("[INFO] 開始上傳參考文件...", progress=20, status="上傳參考文件...")
-        if not system.upload_documents(workspace_slug, args.directory):
+        with telemetry.STAGE_SECONDS.labels(stage='upload').time():
+            upload_ok = system.upload_documents(workspace_slug, args.directory)
+        if not upload_ok:
             logger.warning("[WARNING] 文件上傳過程中出現問題，但仍會繼續處理問答對。")
         logger.info("[SUCCESS] 文件上傳完成", progress=30, status="文件上傳完成")
     else:
         logger.info("[INFO] 未提供參考文件目錄或目錄無效，跳過文件上傳步驟。", progress=30, status="跳過文件上傳")
 
-    # 4. 處理 Excel 中的問答對
-    logger.info("[INFO] 開始處理問答對...", progress=30, status="開始處理問答對...")
-    excel_handler = ExcelHandler(args.excel, logger)
-    all_similarity_scores = system.process_qa_pairs(workspace_slug, excel_handler, web_mode=web_mode)
+    return workspace_slug
+
+def verify_workbook(system: QAVerificationSystem, workspace_slug: str, excel_path: str, output_dir: str,
+                    web_mode: bool = False, progress_range: Tuple[float, float] = (30, 100)) -> Tuple[int, List[Dict[str, float]]]:
+    """
+    驗證單一問答集檔案：處理問答對、生成分析圖表，並將結果檔 (與輸入相同的格式) 儲存至 output_dir
     
-    logger.info(f"[SUCCESS] 成功處理 {excel_handler.get_total_qa_pairs()} 個問答對", progress=85, status="問答對處理完成")
+    Args:
+        system (QAVerificationSystem): 已驗證 API 金鑰的驗證系統 (可在多個檔案間共用)
+        workspace_slug (str): 工作區的 slug
+        excel_path (str): 問答集檔案路徑 (Excel、CSV、JSONL 或 Parquet)
+        output_dir (str): 輸出目錄
+        web_mode (bool): 是否為 Web 模式
+        progress_range (Tuple[float, float]): 此檔案在整體進度中所佔的範圍
+        
+    Returns:
+        Tuple[int, List[Dict[str, float]]]: (問答對總數, 成功取得回答的相似度分數列表)
+        
+    Raises:
+        TaskCancelled: 開始處理此檔案前任務已被取消 (處理途中取消時仍儲存部分結果並正常返回)
+    """
+    logger = system.logger
+    # 依單檔流程的比例分配進度：問答對處理 30-85%、生成圖表 85-95%、儲存結果 95-100%
+    start, end = progress_range
+    qa_end = start + (end - start) * 55 / 70
+    charts_end = start + (end - start) * 65 / 70
+    # 前端以「完成」狀態判斷任務結束，多檔模式下只有最後一個檔案使用
+    done_status = "完成" if end >= 100 else f"已儲存: {os.path.basename(excel_path)}"
+
+    system.checkpoint()
+    logger.info("[INFO] 開始處理問答對...", progress=start, status="開始處理問答對...")
+    with telemetry.STAGE_SECONDS.labels(stage='load_excel').time():
+        excel_handler = open_qa_file(excel_path, logger)
+    with telemetry.STAGE_SECONDS.labels(stage='process_qa_pairs').time():
+        all_similarity_scores = system.process_qa_pairs(workspace_slug, excel_handler, web_mode=web_mode,
+                                                        progress_range=(start, qa_end))
     
-    # 5. 生成總結圖表
-    logger.info("[INFO] 生成分析圖表...", progress=85, status="生成分析圖表...")
-    output_dir = args.output
+    logger.info(f"[SUCCESS] 成功處理 {excel_handler.get_total_qa_pairs()} 個問答對", progress=qa_end, status="問答對處理完成")
+    
+    # 生成總結圖表
+    logger.info("[INFO] 生成分析圖表...", progress=qa_end, status="生成分析圖表...")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         
     try:
         if all_similarity_scores:
-            system.similarity_analyzer.generate_charts(
-                all_similarity_scores, 
-                output_dir
-            )
-            logger.info(f"[SUCCESS] 分析報告已生成於 '{output_dir}' 目錄。", progress=95, status="分析圖表生成完成")
+            with telemetry.STAGE_SECONDS.labels(stage='charts').time():
+                system.similarity_analyzer.generate_charts(
+                    all_similarity_scores, 
+                    output_dir,
+                    scoring_stats=system.scoring_stats.as_dict()
+                )
+            logger.info(f"[SUCCESS] 分析報告已生成於 '{output_dir}' 目錄。", progress=charts_end, status="分析圖表生成完成")
         else:
-            logger.warning("[WARNING] 沒有任何問答對被處理，無法生成報告。", progress=95, status="跳過圖表生成")
+            logger.warning("[WARNING] 沒有任何問答對被處理，無法生成報告。", progress=charts_end, status="跳過圖表生成")
             
     except Exception as e:
         logger.error(f"[ERROR] 生成圖表時發生錯誤: {e}", exc_info=True)
     
-    # 6. 儲存包含結果的 Excel 檔案
-    logger.info("[INFO] 儲存結果檔案...", progress=95, status="儲存結果檔案...")
-    output_excel_path = os.path.join(output_dir, os.path.basename(args.excel))
     try:
-        excel_handler.save_workbook(output_excel_path)
-        logger.info(f"[SUCCESS] 更新後的 Excel 檔案已儲存至: {output_excel_path}", progress=100, status="完成")
+        timings_path = write_chat_timings(system.chat_stats, output_dir)
+        if timings_path:
+            logger.info(f"[SUCCESS] 串流聊天統計已儲存至: {timings_path}")
+    except Exception as e:
+        logger.error(f"[ERROR] 儲存串流聊天統計時發生錯誤: {e}", exc_info=True)
+    
+    # 儲存包含結果的 Excel 檔案 (CSV / JSONL / Parquet 輸出為相同格式)
+    logger.info("[INFO] 儲存結果檔案...", progress=charts_end, status="儲存結果檔案...")
+    output_excel_path = os.path.join(output_dir, os.path.basename(excel_path))
+    try:
+        with telemetry.STAGE_SECONDS.labels(stage='save_excel').time():
+            excel_handler.save_workbook(output_excel_path)
+        logger.info(f"[SUCCESS] 更新後的結果檔案已儲存至: {output_excel_path}", progress=end, status=done_status)
     except Exception as e:
         logger.error(f"[ERROR] 儲存 Excel 檔案時發生錯誤: {e}", exc_info=True)
 
+    return excel_handler.get_total_qa_pairs(), all_similarity_scores
+
+def run_verification(config: Config, logger: Logger, args: argparse.Namespace, web_mode: bool = False):
+    """
+    執行完整的 QA 驗證流程
+    
+    Args:
+        config (Config): 系統配置物件
+        logger (Logger): 日誌記錄器實例
+        args (argparse.Namespace): 命令列參數
+        web_mode (bool): 是否為 Web 模式，影響日誌和進度條顯示
+    """
+    # 進度分配：
+    # 0-10%: 初始化
+    # 10-20%: API驗證和工作區準備
+    # 20-30%: 文件上傳（如果有）
+    # 30-85%: 問答對處理（主要階段）
+    # 85-95%: 生成分析圖表
+    # 95-100%: 儲存結果
+    
+    logger.info("[START] QA 驗證系統啟動", progress=0, status="系統初始化中...")
+    logger.info(f"[INFO] 工作區: {args.workspace}", progress=5, status="載入配置...")
+
+    with telemetry.STAGE_SECONDS.labels(stage='init').time():
+        system = QAVerificationSystem(config, logger)
+    
+    # 1-3. 驗證 API 金鑰、準備工作區並上傳參考文件
+    workspace_slug = prepare_workspace(system, args)
+    if not workspace_slug:
+        return
+
+    # 4-6. 處理 Excel 中的問答對、生成分析圖表並儲存結果
+    verify_workbook(system, workspace_slug, args.excel, args.output, web_mode=web_mode)
+
     logger.info("[COMPLETE] QA 驗證流程全部完成！")
 
 def run_single_verification(config: Config, logger: Logger, args: argparse.Namespace, question: str, standard_answer: str, web_mode: bool = False):
@@ -429,17 +1071,18 @@ def run_single_verification(config: Config, logger: Logger, args: argparse.Names
     try:
         logger.info("正在發送問題到 LLM...", progress=50, status="獲取 LLM 回答...")
         
-        response = system.send_chat_message(workspace_slug, question)
-        if response and 'textResponse' in response:
-            llm_response = response['textResponse']
-            # 清理<think></think>之間的文字
-            cleaned_llm_response = re.sub(r'<think>.*?</think>', '', llm_response, flags=re.DOTALL).strip()
+        forwarder = PartialResponseForwarder(logger) if web_mode else None
+        answer = system.get_llm_answer(workspace_slug, question, on_partial=forwarder)
+        if forwarder:
+            forwarder.flush()
+        if answer:
+            cleaned_llm_response, chat_stats = answer
+            if chat_stats.get('ttft') is not None:
+                logger.info(f"首個 token 延遲: {chat_stats['ttft']:.2f} 秒，生成速度: {chat_stats['tokens_per_second'] or 0:.1f} tokens/s")
             
             logger.info("正在計算相似度分數...", progress=70, status="計算相似度...")
             
-            similarity_scores = system.similarity_analyzer.calculate_similarity(
-                cleaned_llm_response, standard_answer
-            )
+            similarity_scores = system.score_pairs([cleaned_llm_response], [standard_answer])[0]
             
             logger.info(f"✅ 相似度分析完成", progress=80, status="生成報告...")
             
@@ -486,8 +1129,9 @@ def parse_arguments(config: Config):
     
     # 必要參數
     parser.add_argument("-w", "--workspace", type=str, required=True, help="AnythingLLM 工作區名稱")
-    parser.add_argument("-e", "--excel", type=str, default=config.file.default_excel,
-                        help=f"包含問答對的 Excel 檔案路徑 (預設: {config.file.default_excel})")
+    parser.add_argument("-e", "--excel", type=str, nargs='+', default=[config.file.default_excel],
+                        help=f"包含問答對的 Excel、CSV、JSONL 或 Parquet 檔案路徑，可指定多個檔案、zip 壓縮檔或目錄以批次驗證 "
+                             f"(預設: {config.file.default_excel})")
     
     # 可選參數 (用於覆寫 config.yaml)
     parser.add_argument("-d", "--directory", type=str, default=config.file.default_upload_dir,
@@ -497,8 +1141,30 @@ def parse_arguments(config: Config):
     parser.add_argument("-m", "--model", type=str, help=f"覆寫 LLM 模型名稱 (預設: {config.workspace.model})")
     parser.add_argument("-s", "--similarityThreshold", type=float, 
                         help=f"覆寫相似度閾值 (預設: {config.analyzer.similarity_threshold})")
+    parser.add_argument("--sweep-workspaces", type=str, nargs='+',
+                        help="多工作區比較模式：與 -w 一起比較的其他工作區名稱")
+    parser.add_argument("--sweep-variants", type=str,
+                        help="多工作區比較模式：WorkspaceConfig 變體的 YAML 檔 (每個變體建立 <工作區>-<名稱>)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="分片驗證：將問答對依雜湊分成 N 個分片，由多個工作行程或主機同時驗證後合併 (預設: 1，不分片)")
+    parser.add_argument("--shard-mode", type=str, choices=['local', 'files'], default='local',
+                        help="local: 啟動 N 個本機工作行程；files: 只寫出分片工作檔，等待其他主機以 shards.py 處理 (預設: local)")
+    parser.add_argument("--shard-dir", type=str,
+                        help="分片工作檔與日誌的共用目錄 (預設: <輸出目錄>/shards)")
+    parser.add_argument("--profile", action="store_true",
+                        help="啟用效能剖析，將火焰圖堆疊檔與記憶體配置報告寫入輸出目錄")
     
     args = parser.parse_args()
+    
+    # 保留所有輸入，args.excel 維持單一路徑以相容單檔流程
+    args.excel_files = args.excel
+    args.excel = args.excel[0]
+    if (args.sweep_workspaces or args.sweep_variants) and len(args.excel_files) > 1:
+        parser.error("多工作區比較模式只支援單一 Excel 檔案")
+    if args.shards < 1:
+        parser.error("--shards 必須大於 0")
+    if args.shards > 1 and (len(args.excel_files) > 1 or args.sweep_workspaces or args.sweep_variants):
+        parser.error("分片驗證只支援單一 Excel 檔案，且不能與多工作區比較模式同時使用")
 
     # 如果命令列提供了值，就更新 config 物件
     if args.model:
@@ -522,8 +1188,25 @@ def main():
         # 3. 解析參數 (並可選地覆寫組態)
         args = parse_arguments(config)
         
-        # 4. 執行主系統
-        run_verification(config, logger, args, web_mode=False)
+        # 4. 執行主系統 (指定比較目標時改為多工作區比較模式，指定分片數時改為分片驗證，多個檔案時改為批次驗證)
+        with profile_run(args.output, logger) if args.profile else nullcontext():
+            if args.sweep_workspaces or args.sweep_variants:
+                from sweep import build_sweep_targets, load_sweep_variants, run_sweep
+                variants = load_sweep_variants(args.sweep_variants) if args.sweep_variants else None
+                workspaces = [args.workspace] + args.sweep_workspaces if args.sweep_workspaces else None
+                targets = build_sweep_targets(args.workspace, workspaces, variants)
+                run_sweep(config, logger, args, targets, web_mode=False)
+            elif args.shards > 1:
+                from shards import run_sharded_verification
+                run_sharded_verification(config, logger, args, web_mode=False)
+            elif len(args.excel_files) > 1 or os.path.isdir(args.excel) or args.excel.lower().endswith('.zip'):
+                # 多個檔案、zip 或目錄：在同一個任務中批次驗證
+                from batch_files import expand_excel_inputs, run_batch_verification
+                with tempfile.TemporaryDirectory(prefix='qa_batch_') as extract_dir:
+                    excel_paths = expand_excel_inputs(args.excel_files, extract_dir)
+                    run_batch_verification(config, logger, args, excel_paths, web_mode=False)
+            else:
+                run_verification(config, logger, args, web_mode=False)
         
     except Exception as e:
         # 使用 print 因為 logger 可能尚未初始化成功
@@ -0,0 +1,189 @@
+"""
+相似度指標註冊表
+每個指標宣告輸出欄位、Excel 欄位標題、計算方式、是否支援批次計算以及需要的模型。
+config.yaml 的 analyzer.metrics 決定啟用哪些指標；評分模型只在啟用的指標第一次計算時才匯入與載入。
+
+自訂指標可寫成獨立模組，在模組中呼叫 register_metric，並列在 analyzer.metric_plugins：
+
+    from metrics import MetricSpec, register_metric
+
+    register_metric(MetricSpec(
+        name='length_ratio', header='長度比', label='Length Ratio',
+        compute=lambda analyzer, responses, references, batch_size: [
+            min(len(r), len(f)) / max(len(r), len(f), 1) for r, f in zip(responses, references)
+        ],
+    ))
+"""
+
+import importlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import lexical_metrics
+
+# compute(analyzer, responses, references, batch_size) -> 每列的分數
+BatchCompute = Callable[[Any, List[str], List[str], Optional[int]], Sequence[float]]
+# compute(analyzer, response, reference) -> 分數 (batched=False 的指標)
+RowCompute = Callable[[Any, str, str], float]
+# windowed(analyzer, responses, references, batch_size, overlap) -> 每列的分數 (長文模式)
+WindowedCompute = Callable[[Any, List[str], List[str], Optional[int], float], Sequence[float]]
+
+# 需要模型的指標以 SimilarityAnalyzer 的模型名稱宣告
+MODEL_SENTENCE_TRANSFORMER = 'sentence_transformer'
+MODEL_BERT_SCORE = 'bert_score'
+
+DEFAULT_METRICS = ('bert_score', 'cosine_similarity')
+
+# 分層評分 (analyzer.cascade) 使用的字元指標
+CASCADE_METRICS = ('char_ngram_f1', 'rouge_l')
+
+# 非指標的輸出欄位
+EXTRA_HEADERS = {
+    'scoring_tier': '評分層級',
+}
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """相似度指標的定義"""
+    name: str                          # 分數 dict 的鍵
+    header: str                        # 輸出 Excel 的欄位標題
+    label: str                         # 圖表使用的英文名稱
+    compute: Callable                  # batched 時為 BatchCompute，否則為 RowCompute
+    batched: bool = True               # 是否一次計算多列 (需要模型的指標會依長度分桶排程)
+    model: Optional[str] = None        # 需要的模型，None 表示不需要模型
+    windowed: Optional[WindowedCompute] = None  # 長文模式的計算方式 (模型有最大長度限制時提供)
+    description: str = ''              # 分數區間說明，寫入統計摘要
+
+    def score(self, analyzer: Any, responses: List[str], references: List[str],
+              batch_size: Optional[int] = None, long_text_overlap: Optional[float] = None) -> List[float]:
+        """計算每列的分數 (long_text_overlap 不為 None 時使用長文模式)"""
+        if long_text_overlap is not None and self.windowed is not None:
+            scores = self.windowed(analyzer, responses, references, batch_size, long_text_overlap)
+        elif self.batched:
+            scores = self.compute(analyzer, responses, references, batch_size)
+        else:
+            scores = [self.compute(analyzer, response, reference) for response, reference in zip(responses, references)]
+        return [float(score) for score in scores]
+
+
+METRICS: Dict[str, MetricSpec] = {}
+
+
+def register_metric(spec: MetricSpec) -> MetricSpec:
+    """註冊指標 (同名指標會被覆寫)"""
+    METRICS[spec.name] = spec
+    return spec
+
+
+def get_metric(name: str) -> MetricSpec:
+    try:
+        return METRICS[name]
+    except KeyError:
+        raise ValueError(f"未註冊的相似度指標: {name} (可用: {', '.join(METRICS)})")
+
+
+def resolve_metrics(names: Iterable[str]) -> List[MetricSpec]:
+    """依名稱取得指標定義 (保留順序並去除重複)"""
+    specs = [get_metric(name) for name in dict.fromkeys(names)]
+    if not specs:
+        raise ValueError("至少需要啟用一個相似度指標")
+    return specs
+
+
+def load_plugins(modules: Iterable[str]) -> None:
+    """匯入自訂指標模組 (模組在匯入時呼叫 register_metric)"""
+    for module in modules:
+        importlib.import_module(module)
+
+
+def output_columns(metric_names: Iterable[str], cascade: bool = False) -> List[str]:
+    """評分結果的欄位順序：啟用的指標，分層評分時再加上字元指標與判定層級"""
+    columns = list(dict.fromkeys(metric_names))
+    if cascade:
+        columns.extend(name for name in CASCADE_METRICS if name not in columns)
+        columns.append('scoring_tier')
+    return columns
+
+
+def score_headers(keys: Iterable[str]) -> List[str]:
+    """分數欄位對應的 Excel 標題"""
+    return [METRICS[key].header if key in METRICS else EXTRA_HEADERS.get(key, key) for key in keys]
+
+
+def metric_keys(scores: Sequence[Dict[str, Any]]) -> List[str]:
+    """分數中屬於已註冊指標的欄位 (依第一筆分數的順序)"""
+    return [key for key in scores[0] if key in METRICS] if scores else []
+
+
+def metric_values(scores: Iterable[Dict[str, Any]], key: str) -> List[float]:
+    """指標在各列的分數，略過沒有分數的列 (分層評分由字元指標判定的列沒有模型指標的分數)"""
+    return [row[key] for row in scores if row.get(key) is not None]
+
+
+def is_passed(scores: Dict[str, Any], pass_metric: str, threshold: float) -> bool:
+    """
+    是否合格 (pass_metric >= threshold)
+
+    分層評分由字元指標判定的列 (scoring_tier 為 lexical) 沒有模型指標的分數，依字元指標的判定結果：
+    判定合格的列 ROUGE-L 不低於閾值，判定不合格的列所有字元指標都低於閾值。
+    """
+    value = scores.get(pass_metric)
+    if value is None and scores.get('scoring_tier') == 'lexical':
+        value = scores['rouge_l']
+    return value is not None and value >= threshold
+
+
+# --- 內建指標 ---
+
+register_metric(MetricSpec(
+    name='bert_score',
+    header='BERT Score',
+    label='BERT Score',
+    compute=lambda analyzer, responses, references, batch_size: analyzer.bert_score(responses, references, batch_size),
+    model=MODEL_BERT_SCORE,
+    windowed=lambda analyzer, responses, references, batch_size, overlap: analyzer.bert_score_windowed(
+        responses, references, batch_size, overlap),
+    description=(
+        "0.9-1.0: 極高的語意相似度，幾乎完全相同\n"
+        "0.8-0.9: 很高的語意相似度，表達方式不同但核心意思相同\n"
+        "0.7-0.8: 較高的語意相似度，主要意思相同但有些細節差異\n"
+        "0.6-0.7: 中等語意相似度，有部分共同點但差異較大\n"
+        "0.5-0.6: 較低的語意相似度，只有少量相關內容\n"
+        "0-0.5: 很低的語意相似度，幾乎不相關\n"
+    ),
+))
+
+register_metric(MetricSpec(
+    name='cosine_similarity',
+    header='餘弦相似度',
+    label='Cosine Similarity',
+    compute=lambda analyzer, responses, references, batch_size: analyzer.cosine_similarity(
+        responses, references, batch_size),
+    model=MODEL_SENTENCE_TRANSFORMER,
+    windowed=lambda analyzer, responses, references, batch_size, overlap: analyzer.cosine_similarity_windowed(
+        responses, references, batch_size, overlap),
+    description=(
+        "0.9-1.0: 幾乎完全相同的向量方向\n"
+        "0.7-0.9: 非常相似的向量方向\n"
+        "0.5-0.7: 中等相似度\n"
+        "0.3-0.5: 較低相似度\n"
+        "0-0.3: 幾乎不相關\n"
+    ),
+))
+
+register_metric(MetricSpec(
+    name='char_ngram_f1',
+    header='字元 n-gram F1',
+    label='Char N-gram F1',
+    compute=lambda analyzer, responses, references, batch_size: lexical_metrics.char_ngram_f1(responses, references),
+    description="回答與標準答案共有的字元雙字組 (bigram) 比例，1.0 表示字元組成相同\n",
+))
+
+register_metric(MetricSpec(
+    name='rouge_l',
+    header='字元 ROUGE-L',
+    label='Char ROUGE-L',
+    compute=lambda analyzer, responses, references, batch_size: lexical_metrics.char_rouge_l(responses, references),
+    description="以字元計算的最長共同子序列 F1，1.0 表示文字相同\n",
+))
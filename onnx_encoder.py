@@ -0,0 +1,57 @@
+"""
+BERTScore 的 ONNX Runtime 後端
+此模組需要 torch，只在評分模型以 onnx 後端載入時由 similarity_analyzer 匯入，
+只使用詞彙指標的驗證流程不會載入 torch。
+"""
+
+import os
+import torch
+
+
+class LastHiddenState(torch.nn.Module):
+    """只輸出最後一層隱藏狀態的包裝，用於匯出 ONNX"""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids, attention_mask=attention_mask)[0]
+
+
+class OnnxEncoder(torch.nn.Module):
+    """
+    以 ONNX Runtime 執行的 BERT 編碼器，介面與 BERTScore 呼叫的 transformers 模型相容
+
+    BERTScore 會先將模型截斷到指定層數，因此最後一層的輸出即為評分使用的隱藏狀態。
+    """
+
+    def __init__(self, onnx_path: str):
+        super().__init__()
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+
+    def forward(self, input_ids, attention_mask=None, output_hidden_states=False):
+        if output_hidden_states:
+            raise NotImplementedError("ONNX 後端不支援 all_layers 模式")
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        hidden = self.session.run(None, {
+            'input_ids': input_ids.cpu().numpy(),
+            'attention_mask': attention_mask.cpu().numpy(),
+        })[0]
+        return (torch.from_numpy(hidden),)
+
+
+def export_onnx_encoder(model: torch.nn.Module, onnx_path: str):
+    """將 transformers 編碼器匯出為 ONNX (先寫入暫存檔再取代，避免留下不完整的檔案)"""
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    dummy = torch.ones(1, 8, dtype=torch.long)
+    tmp_path = f"{onnx_path}.tmp"
+    torch.onnx.export(
+        LastHiddenState(model).eval(), (dummy, dummy), tmp_path,
+        input_names=['input_ids', 'attention_mask'], output_names=['last_hidden_state'],
+        dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in ('input_ids', 'attention_mask', 'last_hidden_state')},
+        opset_version=14,
+    )
+    os.replace(tmp_path, onnx_path)
@@ -0,0 +1,257 @@
+"""
+驗證流程效能剖析模組
+此模組以取樣方式記錄任務執行緒 (進入剖析區塊的執行緒與任務的工作執行緒) 的呼叫堆疊，並以 tracemalloc 追蹤記憶體配置，
+在驗證結束後將火焰圖相容的堆疊檔 (collapsed stack) 與記憶體配置報告寫入任務輸出目錄。
+tracemalloc 是整個程序共用的：多個任務同時剖析時以參考計數決定何時停止，記憶體報告會註明包含其他任務的配置。
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional
+
+from logger import Logger
+
+PROFILE_FOLDED_FILENAME = 'profile.folded'
+PROFILE_SUMMARY_FILENAME = 'profile_summary.txt'
+ALLOCATIONS_FILENAME = 'profile_allocations.txt'
+
+
+def worker_thread_prefix(task_id: str) -> str:
+    """任務工作執行緒 (ThreadPoolExecutor) 的名稱前綴，剖析時只取樣名稱以此開頭的執行緒"""
+    return f"{task_id}-worker"
+
+
+class _TracingSession:
+    """一次剖析期間的 tracemalloc 使用狀態"""
+
+    def __init__(self):
+        self.overlapped = False  # 期間是否有其他任務同時剖析 (峰值與配置包含其他任務)
+
+
+_tracing_lock = threading.Lock()
+_tracing_sessions: List[_TracingSession] = []
+_tracing_owned = False  # tracemalloc 是否由本模組啟動 (其他程式先啟動時不由本模組停止)
+
+
+def _start_tracing() -> _TracingSession:
+    """開始使用 tracemalloc (第一個使用者負責啟動)"""
+    global _tracing_owned
+    session = _TracingSession()
+    with _tracing_lock:
+        if not _tracing_sessions and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_owned = True
+        if _tracing_sessions:
+            session.overlapped = True
+            for other in _tracing_sessions:
+                other.overlapped = True
+        _tracing_sessions.append(session)
+    return session
+
+
+def _stop_tracing(session: _TracingSession):
+    """
+    擷取結束時的快照與峰值，並停止使用 tracemalloc (最後一個使用者負責停止)
+
+    Returns:
+        Tuple[tracemalloc.Snapshot, int]: 結束時的快照與峰值記憶體
+    """
+    global _tracing_owned
+    with _tracing_lock:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing_sessions.remove(session)
+        if not _tracing_sessions and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+    return snapshot, peak
+
+
+class SamplingProfiler:
+    """
+    定期擷取執行緒呼叫堆疊的取樣式剖析器
+
+    取樣結果以 Brendan Gregg 的 collapsed stack 格式輸出
+    (`thread;frame;frame;... count`)，可直接交給 flamegraph.pl 或 speedscope 繪製火焰圖。
+    """
+
+    # 記憶體較上次快照成長超過此比例時重新擷取峰值快照
+    PEAK_SNAPSHOT_GROWTH = 1.1
+
+    def __init__(self, interval: float = 0.005, track_memory: bool = False,
+                 thread_ident: Optional[int] = None, thread_prefix: Optional[str] = None):
+        """
+        Args:
+            interval (float): 取樣間隔 (秒)
+            track_memory (bool): 是否在記憶體創新高時擷取 tracemalloc 快照
+            thread_ident (Optional[int]): 只取樣此執行緒與名稱以 thread_prefix 開頭的執行緒，
+                兩者皆未提供時取樣所有執行緒
+            thread_prefix (Optional[str]): 要取樣的工作執行緒名稱前綴
+        """
+        self.interval = interval
+        self.track_memory = track_memory
+        self.thread_ident = thread_ident
+        self.thread_prefix = thread_prefix
+        self.peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak_snapshot_size = 0
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_time = 0.0
+        self.duration = 0.0
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _is_sampled(self, ident: int, name: Optional[str]) -> bool:
+        if self.thread_ident is None and self.thread_prefix is None:
+            return True
+        return ident == self.thread_ident or bool(
+            self.thread_prefix and name and name.startswith(self.thread_prefix))
+
+    def _sample(self):
+        own_ident = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or not self._is_sampled(ident, names.get(ident)):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.samples[';'.join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def _capture_peak(self):
+        current = tracemalloc.get_traced_memory()[0]
+        if current > max(self._peak_snapshot_size * self.PEAK_SNAPSHOT_GROWTH, 1024 * 1024):
+            self.peak_snapshot = tracemalloc.take_snapshot()
+            self._peak_snapshot_size = current
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+            if self.track_memory and tracemalloc.is_tracing():
+                self._capture_peak()
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._start_time
+
+    def write_folded(self, path: str):
+        """寫出 collapsed stack 格式的取樣結果"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def write_summary(self, path: str, top: int = 40):
+        """依 self/total 取樣數寫出最耗時的函式"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(';')[1:]  # 去除執行緒名稱
+            if not frames:
+                continue
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+
+        total_samples = sum(self.samples.values()) or 1
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("效能剖析摘要\n")
+            f.write("=" * 50 + "\n\n")
+            f.write(f"執行時間: {self.duration:.2f} 秒\n")
+            f.write(f"取樣間隔: {self.interval * 1000:.1f} ms，共 {self.sample_count} 次取樣\n\n")
+
+            f.write("依自身時間排序 (self):\n")
+            f.write("-" * 30 + "\n")
+            for frame, count in self_counts.most_common(top):
+                f.write(f"{count / total_samples * 100:6.2f}%  {count:8d}  {frame}\n")
+
+            f.write("\n依累計時間排序 (total):\n")
+            f.write("-" * 30 + "\n")
+            for frame, count in total_counts.most_common(top):
+                f.write(f"{count / total_samples * 100:6.2f}%  {count:8d}  {frame}\n")
+
+
+def _write_top_stats(f, title: str, snapshot: tracemalloc.Snapshot, top: int):
+    stats = snapshot.statistics('lineno')
+    total = sum(stat.size for stat in stats)
+    f.write(f"{title} (合計 {total / 1024 / 1024:.2f} MiB)，前 {top} 名配置位置:\n")
+    f.write("-" * 30 + "\n")
+    for index, stat in enumerate(stats[:top], 1):
+        frame = stat.traceback[0]
+        f.write(f"#{index}: {frame.filename}:{frame.lineno} - {stat.size / 1024:.1f} KiB ({stat.count} 個區塊)\n")
+    f.write("\n")
+
+
+def write_allocation_report(end_snapshot: tracemalloc.Snapshot, peak: int, path: str,
+                            peak_snapshot: Optional[tracemalloc.Snapshot] = None, top: int = 30,
+                            shared: bool = False):
+    """
+    寫出依程式碼行彙總的記憶體配置報告 (峰值時與結束時)
+
+    shared 為 True 時註明期間有其他任務同時剖析 (tracemalloc 為整個程序共用，峰值與配置包含其他任務)
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("記憶體配置報告\n")
+        f.write("=" * 50 + "\n\n")
+        f.write(f"峰值記憶體: {peak / 1024 / 1024:.2f} MiB\n")
+        if shared:
+            f.write("注意: 剖析期間有其他任務同時進行剖析，峰值與配置包含整個程序 (含其他任務) 的記憶體\n")
+        f.write("\n")
+        if peak_snapshot is not None:
+            _write_top_stats(f, "接近峰值時的配置", peak_snapshot, top)
+        _write_top_stats(f, "結束時仍配置的記憶體", end_snapshot, top)
+
+
+@contextmanager
+def profile_run(output_dir: str, logger: Logger, interval: float = 0.005, task_id: Optional[str] = None):
+    """
+    在區塊執行期間進行取樣剖析與記憶體追蹤，結束後將報告寫入 output_dir
+
+    只取樣進入區塊的執行緒與任務的工作執行緒 (名稱以 worker_thread_prefix(task_id) 開頭)，
+    同時進行的其他任務不會出現在火焰圖中。
+
+    Args:
+        output_dir (str): 報告輸出目錄 (通常為任務的輸出目錄)
+        logger (Logger): 日誌記錄器實例
+        interval (float): 取樣間隔 (秒)
+        task_id (Optional[str]): 任務識別，未提供時使用 logger 名稱 (與 QAVerificationSystem 相同)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    task_id = task_id or logger.logger.name
+    session = _start_tracing()
+    profiler = SamplingProfiler(interval, track_memory=True, thread_ident=threading.get_ident(),
+                                thread_prefix=worker_thread_prefix(task_id))
+    profiler.start()
+    logger.info(f"[INFO] 已啟用效能剖析 (取樣間隔 {interval * 1000:.1f} ms)")
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        snapshot, peak = _stop_tracing(session)
+        try:
+            profiler.write_folded(os.path.join(output_dir, PROFILE_FOLDED_FILENAME))
+            profiler.write_summary(os.path.join(output_dir, PROFILE_SUMMARY_FILENAME))
+            write_allocation_report(snapshot, peak, os.path.join(output_dir, ALLOCATIONS_FILENAME),
+                                    peak_snapshot=profiler.peak_snapshot, shared=session.overlapped)
+            logger.info(f"[SUCCESS] 效能剖析報告已儲存至 '{output_dir}' 目錄。")
+        except Exception as e:
+            logger.error(f"[ERROR] 儲存效能剖析報告時發生錯誤: {e}", exc_info=True)
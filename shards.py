@@ -0,0 +1,445 @@
+"""
+分片執行模組
+超大型問答集的評分可分散到多個工作行程或多台主機：協調者依穩定的列雜湊將 ExcelHandler.get_all_qa_pairs 的所有列
+分成 N 個分片並寫成共用目錄中的工作檔；工作者領取分片、驗證後逐列寫入日誌 (journal)，
+最後由協調者合併所有日誌，寫回同一份 Excel 並產生報告。
+
+共用目錄的檔案協定 (本機工作行程與遠端主機相同)：
+    manifest.json            工作區 slug 與評分設定 (所有工作者使用相同的指標與閾值)
+    shard-000.jobs.jsonl     分片中的問答對 {sheet, row, question, answer}
+    shard-000.claim          領取者 (以 O_EXCL 建立；超過 claim_timeout 沒有進度時可被其他工作者接手)
+    shard-000.journal.jsonl  已完成的列 (逐列附加寫入，接手的工作者會略過已完成的列)
+    shard-000.done           分片完成標記
+
+遠端主機使用指向同一個 AnythingLLM 的 config.yaml，掛載共用目錄後執行：
+    python shards.py <共用目錄>
+"""
+
+import argparse
+import csv
+import dataclasses
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import AnalyzerConfig, Config
+from excel_handler import ExcelHandler
+from logger import Logger, get_logger
+import metrics
+import telemetry
+
+MANIFEST = 'manifest.json'
+SUMMARY_CSV = 'shard_summary.csv'
+
+# 領取的分片超過此秒數沒有任何進度時，視為工作者已中斷
+DEFAULT_CLAIM_TIMEOUT = 600.0
+
+_POLL_SECONDS = 2.0
+
+# 各分片驗證所佔的進度範圍，其餘用於合併結果與產生報告
+_SHARDS_PROGRESS_RANGE = (30, 85)
+
+
+def shard_of(sheet_name: str, question: str, shards: int) -> int:
+    """依工作表名稱與問題內容的雜湊決定分片 (與列的位置無關，插入或刪除其他列不影響分配)"""
+    digest = hashlib.blake2b(f'{sheet_name}\x1f{question}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+def _shard_path(shard_dir: str, shard: int, suffix: str) -> str:
+    return os.path.join(shard_dir, f'shard-{shard:03d}.{suffix}')
+
+
+def load_manifest(shard_dir: str) -> Dict:
+    with open(os.path.join(shard_dir, MANIFEST), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_shard_jobs(all_qa_pairs: Dict[str, List[Tuple[str, str, int]]], shards: int, shard_dir: str,
+                     manifest: Dict) -> List[int]:
+    """
+    將所有問答對依雜湊分成分片工作檔並寫入 manifest
+
+    工作檔的內容只取決於問答集本身：以相同的問答集與分片數重新執行時，既有的日誌仍然有效 (已完成的列不會重新驗證)；
+    問答集或分片數改變時，清除目錄中先前的日誌與完成標記。
+
+    Returns:
+        List[int]: 每個分片的列數
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    fingerprint = hashlib.blake2b(str(shards).encode('utf-8'), digest_size=16)
+    for sheet_name, qa_pairs in all_qa_pairs.items():
+        for question, answer, row_index in qa_pairs:
+            fingerprint.update(json.dumps([sheet_name, row_index, question, answer], ensure_ascii=False).encode('utf-8'))
+    fingerprint = fingerprint.hexdigest()
+    try:
+        previous = load_manifest(shard_dir).get('fingerprint')
+    except (OSError, ValueError):
+        previous = None
+    if previous != fingerprint:
+        for name in os.listdir(shard_dir):
+            if name.startswith('shard-') and name.endswith(('.journal.jsonl', '.done', '.claim')):
+                os.remove(os.path.join(shard_dir, name))
+
+    counts = [0] * shards
+    files = [open(_shard_path(shard_dir, shard, 'jobs.jsonl'), 'w', encoding='utf-8') for shard in range(shards)]
+    try:
+        for sheet_name, qa_pairs in all_qa_pairs.items():
+            for question, answer, row_index in qa_pairs:
+                shard = shard_of(sheet_name, question, shards)
+                files[shard].write(json.dumps({'sheet': sheet_name, 'row': row_index, 'question': question,
+                                               'answer': answer}, ensure_ascii=False) + '\n')
+                counts[shard] += 1
+    finally:
+        for f in files:
+            f.close()
+    with open(os.path.join(shard_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({**manifest, 'shards': shards, 'rows': counts, 'fingerprint': fingerprint}, f,
+                  ensure_ascii=False, indent=2)
+    return counts
+
+
+def _is_stale(shard_dir: str, shard: int, claim_timeout: float) -> bool:
+    """領取後超過 claim_timeout 沒有寫入任何結果 (領取檔與日誌都沒有更新)"""
+    last_activity = 0.0
+    for suffix in ('claim', 'journal.jsonl'):
+        try:
+            last_activity = max(last_activity, os.path.getmtime(_shard_path(shard_dir, shard, suffix)))
+        except OSError:
+            pass
+    return time.time() - last_activity > claim_timeout
+
+
+def claim_shard(shard_dir: str, worker_id: str, claim_timeout: float = DEFAULT_CLAIM_TIMEOUT) -> Optional[int]:
+    """
+    領取一個尚未完成的分片
+
+    Returns:
+        Optional[int]: 分片編號，沒有可領取的分片時返回 None
+    """
+    for shard in range(load_manifest(shard_dir)['shards']):
+        done_path = _shard_path(shard_dir, shard, 'done')
+        claim_path = _shard_path(shard_dir, shard, 'claim')
+        if os.path.exists(done_path):
+            continue
+        try:
+            fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _is_stale(shard_dir, shard, claim_timeout):
+                continue
+            # 原領取者已中斷，接手此分片
+            try:
+                os.remove(claim_path)
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except (FileNotFoundError, FileExistsError):
+                continue
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(worker_id)
+        if os.path.exists(done_path):
+            # 在檢查與領取之間被其他工作者完成
+            os.remove(claim_path)
+            continue
+        return shard
+    return None
+
+
+def _read_journal(path: str) -> Iterator[Dict]:
+    """讀取日誌中的所有完整記錄 (略過中斷時寫到一半的最後一行)"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def run_shard(system, workspace_slug: str, shard_dir: str, shard: int, worker_id: str,
+              score_batch_size: int = 32) -> Tuple[int, int]:
+    """
+    驗證一個分片，逐列將結果附加寫入日誌，完成後寫入完成標記
+
+    Args:
+        system (QAVerificationSystem): 驗證系統
+        workspace_slug (str): 工作區的 slug
+        shard_dir (str): 共用目錄
+        shard (int): 分片編號
+        worker_id (str): 工作者識別 (寫入完成標記)
+        score_batch_size (int): 一次評分的最大筆數
+
+    Returns:
+        Tuple[int, int]: (此次評分成功的列數, 失敗的列數)
+    """
+    journal_path = _shard_path(shard_dir, shard, 'journal.jsonl')
+    claim_path = _shard_path(shard_dir, shard, 'claim')
+    completed = {(record['sheet'], record['row']) for record in _read_journal(journal_path)}
+    # verify_stream 的 index 為 pairs 的讀取順序，對應回 (工作表, 列)
+    rows: Dict[int, Tuple[str, int]] = {}
+
+    def pairs() -> Iterator[Tuple[str, str]]:
+        with open(_shard_path(shard_dir, shard, 'jobs.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                job = json.loads(line)
+                if (job['sheet'], job['row']) in completed:
+                    continue
+                rows[len(rows)] = (job['sheet'], job['row'])
+                yield job['question'], job['answer']
+
+    scored = failed = 0
+    # 前一個工作者中斷時最後一行可能不完整，從新的一行開始寫入
+    partial_line = False
+    if os.path.exists(journal_path) and os.path.getsize(journal_path) > 0:
+        with open(journal_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            partial_line = f.read(1) != b'\n'
+    with open(journal_path, 'a', encoding='utf-8') as journal:
+        if partial_line:
+            journal.write('\n')
+        for result in system.verify_stream(workspace_slug, pairs(), score_batch_size):
+            sheet_name, row_index = rows[result['index']]
+            record = {'sheet': sheet_name, 'row': row_index, 'question': result['question']}
+            for key in ('llm_response', 'similarity_scores', 'chat_stats', 'error'):
+                if key in result:
+                    record[key] = result[key]
+            journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+            journal.flush()
+            if 'error' in result:
+                failed += 1
+            else:
+                scored += 1
+            os.utime(claim_path)
+
+    with open(_shard_path(shard_dir, shard, 'done'), 'w', encoding='utf-8') as f:
+        f.write(worker_id)
+    os.remove(claim_path)
+    return scored, failed
+
+
+def run_worker(config: Config, logger: Logger, shard_dir: str, worker_id: Optional[str] = None,
+               claim_timeout: float = DEFAULT_CLAIM_TIMEOUT) -> int:
+    """
+    工作者主迴圈：持續領取並驗證分片，直到沒有可領取的分片
+
+    評分設定 (指標、閾值、模型等) 以 manifest 為準，確保所有工作者的分數可以合併比較。
+
+    Returns:
+        int: 完成的分片數
+    """
+    from main import QAVerificationSystem
+
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    manifest = load_manifest(shard_dir)
+    config.analyzer = AnalyzerConfig(**manifest['analyzer'])
+    system = QAVerificationSystem(config, logger)
+    finished = 0
+    while True:
+        shard = claim_shard(shard_dir, worker_id, claim_timeout)
+        if shard is None:
+            break
+        logger.info(f"[INFO] 工作者 {worker_id} 領取分片 {shard} ({manifest['rows'][shard]} 列)")
+        start_time = time.perf_counter()
+        scored, failed = run_shard(system, manifest['workspace_slug'], shard_dir, shard, worker_id)
+        logger.info(f"[SUCCESS] 分片 {shard} 完成：評分 {scored} 列、失敗 {failed} 列，"
+                    f"耗時 {time.perf_counter() - start_time:.1f} 秒")
+        finished += 1
+    logger.info(f"[INFO] 工作者 {worker_id} 結束，共完成 {finished} 個分片")
+    return finished
+
+
+def _local_worker(config: Config, shard_dir: str, worker_id: str, threads: int):
+    """本機工作行程的進入點 (以 spawn 啟動)"""
+    # 在匯入 PyTorch 前限制每個行程的推論執行緒數，避免多個行程爭用同一批 CPU 核心
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(variable, str(threads))
+    run_worker(config, get_logger(f"ShardWorker-{worker_id}"), shard_dir, worker_id)
+
+
+class _JournalProgress:
+    """以日誌的行數計算已完成的列數 (每次只讀取新增的部分)"""
+
+    def __init__(self, shard_dir: str, shards: int):
+        self.paths = [_shard_path(shard_dir, shard, 'journal.jsonl') for shard in range(shards)]
+        self.offsets = [0] * shards
+        self.completed = 0
+
+    def poll(self) -> int:
+        for shard, path in enumerate(self.paths):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                f.seek(self.offsets[shard])
+                data = f.read()
+            self.offsets[shard] += len(data)
+            self.completed += data.count(b'\n')
+        return self.completed
+
+
+def merge_journals(shard_dir: str, shards: int) -> Tuple[Dict[Tuple[str, int], Dict], List[Dict]]:
+    """
+    讀取所有分片的日誌
+
+    Returns:
+        Tuple[Dict[Tuple[str, int], Dict], List[Dict]]: ((工作表, 列) -> 記錄, 每個分片的統計)
+    """
+    manifest = load_manifest(shard_dir)
+    records: Dict[Tuple[str, int], Dict] = {}
+    summary = []
+    for shard in range(shards):
+        scored = failed = 0
+        for record in _read_journal(_shard_path(shard_dir, shard, 'journal.jsonl')):
+            records[(record['sheet'], record['row'])] = record
+            if 'error' in record:
+                failed += 1
+            else:
+                scored += 1
+        done_path = _shard_path(shard_dir, shard, 'done')
+        worker = ''
+        if os.path.exists(done_path):
+            with open(done_path, 'r', encoding='utf-8') as f:
+                worker = f.read().strip()
+        summary.append({'shard': shard, 'rows': manifest['rows'][shard], 'scored': scored, 'failed': failed,
+                        'done': os.path.exists(done_path), 'worker': worker})
+    return records, summary
+
+
+def run_sharded_verification(config: Config, logger: Logger, args: argparse.Namespace, web_mode: bool = False):
+    """
+    分片驗證單一 Excel 檔案：分片、分派給工作者、合併結果並產生報告
+
+    Args:
+        config (Config): 系統配置物件
+        logger (Logger): 日誌記錄器實例
+        args (argparse.Namespace): 命令列參數 (使用 workspace、excel、directory、output、
+            shards、shard_mode 與 shard_dir)
+        web_mode (bool): 是否為 Web 模式
+    """
+    from main import QAVerificationSystem, prepare_workspace, write_chat_timings
+
+    shards = args.shards
+    shard_dir = args.shard_dir or os.path.join(args.output, 'shards')
+    logger.info(f"[START] 分片驗證啟動，共 {shards} 個分片 ({args.shard_mode})", progress=0, status="系統初始化中...")
+    with telemetry.STAGE_SECONDS.labels(stage='init').time():
+        system = QAVerificationSystem(config, logger)
+
+    # 1-3. 驗證 API 金鑰、準備工作區並上傳參考文件 (只由協調者執行一次)
+    workspace_slug = prepare_workspace(system, args)
+    if not workspace_slug:
+        return
+
+    # 4. 分片
+    with telemetry.STAGE_SECONDS.labels(stage='load_excel').time():
+        excel_handler = ExcelHandler(args.excel, logger)
+        all_qa_pairs = excel_handler.get_all_qa_pairs()
+    total = sum(len(qa_pairs) for qa_pairs in all_qa_pairs.values())
+    counts = write_shard_jobs(all_qa_pairs, shards, shard_dir, {
+        'workspace_slug': workspace_slug,
+        'excel': os.path.basename(args.excel),
+        'analyzer': dataclasses.asdict(config.analyzer),
+    })
+    logger.info(f"[INFO] {total} 個問答對已分成 {shards} 個分片 (每片 {min(counts)}-{max(counts)} 列)，"
+                f"工作檔位於 {shard_dir}")
+
+    # 5. 分派給工作者
+    processes = []
+    if args.shard_mode == 'local':
+        # 本機模式下共用目錄只屬於此次執行，先前中斷留下的領取檔直接移除
+        for shard in range(shards):
+            claim_path = _shard_path(shard_dir, shard, 'claim')
+            if os.path.exists(claim_path):
+                os.remove(claim_path)
+        context = multiprocessing.get_context('spawn')
+        threads = max(1, (os.cpu_count() or 1) // shards)
+        for i in range(shards):
+            process = context.Process(target=_local_worker,
+                                      args=(config, shard_dir, f'{socket.gethostname()}-local-{i}', threads))
+            process.start()
+            processes.append(process)
+        logger.info(f"[INFO] 已啟動 {shards} 個本機工作行程 (每個行程 {threads} 個推論執行緒)")
+    else:
+        logger.info(f"[INFO] 等待遠端工作者完成分片，請在其他主機執行: python shards.py {os.path.abspath(shard_dir)}")
+
+    progress = _JournalProgress(shard_dir, shards)
+    start, end = _SHARDS_PROGRESS_RANGE
+    with telemetry.STAGE_SECONDS.labels(stage='shards').time():
+        while True:
+            done = sum(os.path.exists(_shard_path(shard_dir, shard, 'done')) for shard in range(shards))
+            completed = progress.poll()
+            if web_mode or done == shards:
+                logger.info(f"[PROGRESS] 已完成 {completed}/{total} 列 ({done}/{shards} 個分片)",
+                            progress=start + (completed / total if total else 1) * (end - start),
+                            status=f"分片驗證中: {completed}/{total} 列，{done}/{shards} 個分片")
+            if done == shards:
+                break
+            if processes and not any(process.is_alive() for process in processes):
+                logger.error(f"[ERROR] 所有本機工作行程皆已結束，但只有 {done}/{shards} 個分片完成")
+                break
+            time.sleep(_POLL_SECONDS)
+    for process in processes:
+        process.join()
+
+    # 6. 合併日誌，依 Excel 順序寫回
+    logger.info("[INFO] 合併分片結果...", progress=end, status="合併分片結果...")
+    records, summary = merge_journals(shard_dir, shards)
+    all_similarity_scores = []
+    chat_stats = []
+    for sheet_name, qa_pairs in all_qa_pairs.items():
+        for question, _, row_index in qa_pairs:
+            record = records.get((sheet_name, row_index))
+            # 問題不同表示日誌來自修改前的問答集，不寫回
+            if not record or record['question'] != question or 'similarity_scores' not in record:
+                continue
+            excel_handler.write_llm_response(sheet_name, row_index, record['llm_response'])
+            excel_handler.write_similarity_scores(sheet_name, row_index, record['similarity_scores'])
+            all_similarity_scores.append(record['similarity_scores'])
+            chat_stats.append({'sheet': sheet_name, 'row': row_index + 1, **record.get('chat_stats', {})})
+    if all_similarity_scores:
+        excel_handler.write_score_headers(metrics.score_headers(all_similarity_scores[0].keys()))
+    logger.info(f"[SUCCESS] 合併完成：{len(all_similarity_scores)}/{total} 列已評分")
+
+    # 7. 產生報告並儲存結果
+    output_dir = args.output
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        if all_similarity_scores:
+            with telemetry.STAGE_SECONDS.labels(stage='charts').time():
+                system.similarity_analyzer.generate_charts(all_similarity_scores, output_dir)
+            logger.info(f"[SUCCESS] 分析報告已生成於 '{output_dir}' 目錄。", progress=95, status="分析圖表生成完成")
+        else:
+            logger.warning("[WARNING] 沒有任何問答對被處理，無法生成報告。", progress=95, status="跳過圖表生成")
+    except Exception as e:
+        logger.error(f"[ERROR] 生成圖表時發生錯誤: {e}", exc_info=True)
+
+    try:
+        write_chat_timings(chat_stats, output_dir)
+        with open(os.path.join(output_dir, SUMMARY_CSV), 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(summary[0].keys()))
+            writer.writeheader()
+            writer.writerows(summary)
+    except Exception as e:
+        logger.error(f"[ERROR] 儲存分片摘要時發生錯誤: {e}", exc_info=True)
+
+    output_excel_path = os.path.join(output_dir, os.path.basename(args.excel))
+    with telemetry.STAGE_SECONDS.labels(stage='save_excel').time():
+        excel_handler.save_workbook(output_excel_path)
+    logger.info(f"[SUCCESS] 更新後的 Excel 檔案已儲存至: {output_excel_path}", progress=100, status="完成")
+    logger.info("[COMPLETE] 分片驗證流程全部完成！")
+
+
+def main():
+    """遠端工作者的命令列進入點"""
+    parser = argparse.ArgumentParser(description="QA 驗證系統分片工作者")
+    parser.add_argument("shard_dir", type=str, help="協調者建立的共用分片目錄")
+    parser.add_argument("--worker-id", type=str, help="工作者識別 (預設: <主機名稱>-<PID>)")
+    parser.add_argument("--claim-timeout", type=float, default=DEFAULT_CLAIM_TIMEOUT,
+                        help=f"接手其他工作者中斷的分片前等待的秒數 (預設: {DEFAULT_CLAIM_TIMEOUT:.0f})")
+    args = parser.parse_args()
+    run_worker(Config.load(), get_logger("ShardWorker"), args.shard_dir, args.worker_id, args.claim_timeout)
+
+
+if __name__ == "__main__":
+    main()
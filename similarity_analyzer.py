@@ -1,94 +1,431 @@
 import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
-from typing import List, Dict
-from sentence_transformers import SentenceTransformer, util
-from bert_score import score
+from typing import Any, List, Dict, Optional, Sequence, Tuple
+from batch_scheduler import token_spans
+from metrics import DEFAULT_METRICS, METRICS, MODEL_BERT_SCORE, MODEL_SENTENCE_TRANSFORMER, metric_keys, metric_values, resolve_metrics
 from logger import Logger
+import telemetry
+
+# 評分模型可選用的推論後端 (int8、bf16 與 onnx 皆在 CPU 上執行)
+BACKENDS = ('fp32', 'int8', 'bf16', 'onnx')
+
+# 匯出的 ONNX 模型存放目錄
+ONNX_CACHE_DIR = os.path.join('model_cache', 'onnx')
+
+# 依模型名稱與推論後端共用已載入的分析器，避免每次驗證都重新載入模型
+_shared_analyzers: Dict[tuple, 'SimilarityAnalyzer'] = {}
+_shared_analyzers_lock = threading.Lock()
+
+def get_shared_analyzer(model_name: str, backend: str = 'fp32') -> 'SimilarityAnalyzer':
+    """取得 (必要時建立) 指定模型與推論後端的共用 SimilarityAnalyzer"""
+    with _shared_analyzers_lock:
+        analyzer = _shared_analyzers.get((model_name, backend))
+        if analyzer is None:
+            analyzer = SimilarityAnalyzer(model_name, backend)
+            _shared_analyzers[(model_name, backend)] = analyzer
+        return analyzer
+
+def cpu_supports_bf16() -> bool:
+    """CPU 是否支援 bfloat16 運算 (AVX512-BF16 或 AMX)"""
+    try:
+        import torch
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+def _onnxruntime_available() -> bool:
+    try:
+        import onnxruntime  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _tokenize_spans(tokenizer, texts: List[str]) -> List[List[Tuple[int, int]]]:
+    """以模型的 tokenizer 取得每個 token 在原文中的位置；非 fast tokenizer 時改用近似切分"""
+    if getattr(tokenizer, 'is_fast', False):
+        offsets = tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+        return [[(start, end) for start, end in row if end > start] for row in offsets]
+    return [token_spans(text) for text in texts]
+
+def _split_windows(text: str, spans: List[Tuple[int, int]], window: int, stride: int) -> List[str]:
+    """依 token 位置將文字切成長度 window、間隔 stride 的重疊視窗 (未超過 window 時維持原文)"""
+    if len(spans) <= window:
+        return [text]
+    starts = list(range(0, len(spans) - window + 1, stride))
+    if starts[-1] + window < len(spans):
+        starts.append(len(spans) - window)
+    return [text[spans[start][0]:spans[start + window - 1][1]] for start in starts]
+
+def _masked_mean(values: 'torch.Tensor') -> 'torch.Tensor':
+    """沿最後一維對有限值取平均 (-inf 為填充位置)"""
+    import torch
+    valid = torch.isfinite(values)
+    return values.where(valid, torch.zeros_like(values)).sum(dim=-1) / valid.sum(dim=-1)
+
+class _WindowPairs:
+    """
+    長文模式下每一列的 (回答視窗 x 標準答案視窗) 配對
+
+    所有列的視窗攤平成一個列表，配對以索引張量表示，讓所有配對一次評分，
+    再以張量運算彙總回每一列，不需要逐視窗的 Python 迴圈。
+    """
+
+    def __init__(self, response_windows: List[List[str]], reference_windows: List[List[str]]):
+        import torch
+        self.response_windows = [window for windows in response_windows for window in windows]
+        self.reference_windows = [window for windows in reference_windows for window in windows]
+        response_counts = torch.tensor([len(windows) for windows in response_windows])
+        reference_counts = torch.tensor([len(windows) for windows in reference_windows])
+        pair_counts = response_counts * reference_counts
+
+        # 每個配對所屬的列，以及在該列 (回答視窗數 x 標準答案視窗數) 矩陣中的位置
+        self.rows = torch.repeat_interleave(torch.arange(len(response_windows)), pair_counts)
+        position = torch.arange(int(pair_counts.sum())) - (torch.cumsum(pair_counts, 0) - pair_counts)[self.rows]
+        self.response_pos = position // reference_counts[self.rows]
+        self.reference_pos = position % reference_counts[self.rows]
+        # 每個配對在攤平視窗列表中的索引
+        self.response_index = (torch.cumsum(response_counts, 0) - response_counts)[self.rows] + self.response_pos
+        self.reference_index = (torch.cumsum(reference_counts, 0) - reference_counts)[self.rows] + self.reference_pos
+        self.shape = (len(response_windows), int(response_counts.max()), int(reference_counts.max()))
+
+    def pair_texts(self) -> Tuple[List[str], List[str]]:
+        """每個配對的 (回答視窗, 標準答案視窗) 文字"""
+        return ([self.response_windows[i] for i in self.response_index.tolist()],
+                [self.reference_windows[i] for i in self.reference_index.tolist()])
+
+    def aggregate(self, pair_scores: 'torch.Tensor') -> 'torch.Tensor':
+        """
+        將配對分數彙總為每列一個分數
+
+        回答的每個視窗取最相符的標準答案視窗 (max) 後平均 (mean)，標準答案方向亦同，
+        兩個方向再取平均。只有一個視窗的列即為原本的整段分數。
+        """
+        device = pair_scores.device
+        matrix = pair_scores.new_full(self.shape, float('-inf'))
+        matrix[self.rows.to(device), self.response_pos.to(device), self.reference_pos.to(device)] = pair_scores
+        return (_masked_mean(matrix.amax(dim=2)) + _masked_mean(matrix.amax(dim=1))) / 2
 
 class SimilarityAnalyzer:
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+    # 參考答案向量快取的上限筆數
+    REFERENCE_CACHE_SIZE = 10000
+
+    def __init__(self, model_name: str, backend: str = 'fp32'):
+        """
+        Args:
+            model_name (str): SentenceTransformer 模型名稱
+            backend (str): 推論後端，見 BACKENDS；CPU 不支援或缺少套件時退回 fp32
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"不支援的推論後端: {backend} (可用: {', '.join(BACKENDS)})")
         self.logger = Logger("similarity_analyzer")
+        self.model_name = model_name
+        self.backend = self._resolve_backend(backend)
+        # 評分模型在需要它的指標第一次計算時才載入，之後重複使用
+        # (BERTScore 只載入一次，bert_score.score() 每次呼叫都會重新載入模型)
+        self._models: Dict[str, Any] = {}
+        self._model_lock = threading.Lock()
+        self._reference_cache: 'OrderedDict[str, torch.Tensor]' = OrderedDict()
+        self._reference_cache_lock = threading.Lock()
         # 確保 similarity_charts 目錄存在
         os.makedirs('similarity_charts', exist_ok=True)
     
+    def _resolve_backend(self, backend: str) -> str:
+        if backend == 'bf16' and not cpu_supports_bf16():
+            self.logger.warning("[WARNING] CPU 不支援 bfloat16，評分模型改用 fp32")
+            return 'fp32'
+        if backend == 'onnx' and not _onnxruntime_available():
+            self.logger.warning("[WARNING] 未安裝 onnxruntime，評分模型改用 fp32")
+            return 'fp32'
+        return backend
+    
+    @property
+    def model(self) -> 'SentenceTransformer':
+        """SentenceTransformer 模型 (第一次使用時載入)"""
+        return self._get_model(MODEL_SENTENCE_TRANSFORMER)
+    
+    @property
+    def bert_scorer(self) -> 'BERTScorer':
+        """BERTScore 評分器 (第一次使用時載入)"""
+        return self._get_model(MODEL_BERT_SCORE)
+    
+    def _get_model(self, name: str) -> Any:
+        """取得評分模型，第一次使用時才匯入 torch 並載入 (只用詞彙指標時不會載入 torch)"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._model_lock:
+            if name not in self._models:
+                loaders = {
+                    MODEL_SENTENCE_TRANSFORMER: (self.model_name, lambda: self._load_sentence_model(self.model_name)),
+                    MODEL_BERT_SCORE: ('bert_score', self._load_bert_scorer),
+                }
+                if name not in loaders:
+                    raise ValueError(f"未知的評分模型: {name}")
+                label, loader = loaders[name]
+                with telemetry.MODEL_LOAD_SECONDS.labels(model=label).time():
+                    self._models[name] = loader()
+            return self._models[name]
+    
+    def load_models(self, metrics: Sequence[str] = DEFAULT_METRICS) -> None:
+        """預先載入指定指標需要的模型"""
+        for spec in resolve_metrics(metrics):
+            if spec.model:
+                self._get_model(spec.model)
+    
+    def _load_sentence_model(self, model_name: str) -> 'SentenceTransformer':
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if self.backend == 'onnx':
+            return SentenceTransformer(model_name, device='cpu', backend='onnx')
+        if self.backend == 'fp32':
+            return SentenceTransformer(model_name)
+        model = SentenceTransformer(model_name, device='cpu')
+        if self.backend == 'int8':
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+    
+    def _load_bert_scorer(self) -> 'BERTScorer':
+        import torch
+        from bert_score import BERTScorer
+        scorer = BERTScorer(lang='zh', rescale_with_baseline=True, device=None if self.backend == 'fp32' else 'cpu')
+        if self.backend == 'int8':
+            scorer._model = torch.ao.quantization.quantize_dynamic(scorer._model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif self.backend == 'onnx':
+            from onnx_encoder import OnnxEncoder, export_onnx_encoder
+            onnx_path = os.path.join(ONNX_CACHE_DIR, f"{scorer.model_type.replace('/', '_')}-L{scorer.num_layers}.onnx")
+            if not os.path.exists(onnx_path):
+                self.logger.info(f"[INFO] 匯出 BERTScore 模型至 {onnx_path}")
+                export_onnx_encoder(scorer._model, onnx_path)
+            scorer._model = OnnxEncoder(onnx_path)
+        return scorer
+    
+    def _inference_context(self):
+        """bf16 後端以自動混合精度執行推論，其餘後端不需額外設定"""
+        if self.backend == 'bf16':
+            import torch
+            return torch.autocast(device_type='cpu', dtype=torch.bfloat16)
+        return nullcontext()
+    
+    def _encode(self, texts: List[str], batch_size: int = 32) -> 'torch.Tensor':
+        with self._inference_context():
+            return self.model.encode(texts, batch_size=batch_size, convert_to_tensor=True).float()
+    
+    def _encode_references(self, references: List[str]) -> 'torch.Tensor':
+        """編碼標準答案，同一段文字只會被編碼一次 (跨工作區、跨批次共用)"""
+        found = {}
+        with self._reference_cache_lock:
+            for text in references:
+                if text in self._reference_cache:
+                    self._reference_cache.move_to_end(text)
+                    found[text] = self._reference_cache[text]
+        missing = [text for text in dict.fromkeys(references) if text not in found]
+        if missing:
+            embeddings = self._encode(missing)
+            with self._reference_cache_lock:
+                for text, embedding in zip(missing, embeddings):
+                    found[text] = embedding
+                    self._reference_cache[text] = embedding
+                while len(self._reference_cache) > self.REFERENCE_CACHE_SIZE:
+                    self._reference_cache.popitem(last=False)
+        import torch
+        return torch.stack([found[text] for text in references])
+    
+    def precompute_references(self, references: List[str]) -> None:
+        """預先編碼標準答案並放入快取，供之後多次評分共用"""
+        if references:
+            self._encode_references(list(dict.fromkeys(references)))
+    
     def calculate_similarity(self, text1: str, text2: str) -> Dict[str, float]:
         """計算兩個文本之間的語意相似度"""
-        try:
-            # BERTScore
-            P, R, F1 = score([text1], [text2], lang='zh', rescale_with_baseline=True)
-            bert_score = F1.mean().item()
-            
-            # Sentence Transformers
-            embeddings1 = self.model.encode(text1, convert_to_tensor=True)
-            embeddings2 = self.model.encode(text2, convert_to_tensor=True)
-            cosine_score = util.pytorch_cos_sim(embeddings1, embeddings2).item()
+        return self.calculate_similarity_batch([text1], [text2])[0]
+    
+    def calculate_similarity_batch(self, responses: List[str], references: List[str],
+                                   batch_size: Optional[int] = None, metrics: Sequence[str] = DEFAULT_METRICS,
+                                   long_text_overlap: Optional[float] = None) -> List[Dict[str, float]]:
+        """
+        批次計算多組 (LLM 回答, 標準答案) 的相似度指標
+        
+        Args:
+            responses (List[str]): LLM 回答
+            references (List[str]): 對應的標準答案
+            batch_size (Optional[int]): 模型單次推論的筆數，未指定時使用各模型的預設值；
+                由 LengthBucketScheduler 呼叫時會傳入整個批次的大小，讓一個排程批次只需一次推論
+            metrics (Sequence[str]): 要計算的指標名稱 (見 metrics.METRICS)
+            long_text_overlap (Optional[float]): 指定時使用長文模式，超過模型最大長度的文字
+                切成此重疊比例的視窗評分 (見 bert_score_windowed)
             
-            return {
-                'bert_score': bert_score,
-                'cosine_similarity': cosine_score
-            }
+        Returns:
+            List[Dict[str, float]]: 與輸入順序相同的分數，鍵的順序與 metrics 相同
+        """
+        if not responses:
+            return []
+        specs = resolve_metrics(metrics)
+        try:
+            columns = []
+            for spec in specs:
+                with telemetry.SCORING_SECONDS.labels(metric=spec.name).time():
+                    columns.append(spec.score(self, list(responses), list(references), batch_size, long_text_overlap))
+            return [dict(zip((spec.name for spec in specs), row)) for row in zip(*columns)]
         except Exception as e:
+            telemetry.SCORING_ERRORS.inc()
             self.logger.error(f"計算相似度時發生錯誤: {str(e)}", exc_info=e)
-            return {'bert_score': 0.0, 'cosine_similarity': 0.0}
+            return [{spec.name: 0.0 for spec in specs} for _ in responses]
+    
+    def bert_score(self, responses: List[str], references: List[str], batch_size: Optional[int] = None) -> List[float]:
+        """BERTScore F1"""
+        scorer = self.bert_scorer
+        with self._inference_context():
+            _, _, F1 = scorer.score(responses, references, batch_size=batch_size or scorer.batch_size)
+        return F1.float().tolist()
+    
+    def cosine_similarity(self, responses: List[str], references: List[str], batch_size: Optional[int] = None) -> List[float]:
+        """SentenceTransformer 向量的餘弦相似度"""
+        import torch
+        response_embeddings = self._encode(responses, batch_size=batch_size or 32)
+        reference_embeddings = self._encode_references(references)
+        return torch.nn.functional.cosine_similarity(
+            response_embeddings, reference_embeddings.to(response_embeddings.device), dim=1
+        ).tolist()
+    
+    def _windows(self, tokenizer, texts: List[str], window: int, overlap: float) -> List[List[str]]:
+        overlap = min(max(overlap, 0.0), 0.9)
+        stride = max(1, int(window * (1 - overlap)))
+        return [_split_windows(text, spans, window, stride)
+                for text, spans in zip(texts, _tokenize_spans(tokenizer, texts))]
+    
+    def bert_score_windowed(self, responses: List[str], references: List[str], batch_size: Optional[int] = None,
+                            overlap: float = 0.25) -> List[float]:
+        """
+        長文模式的 BERTScore F1
+        
+        一般模式下模型會截斷超過最大序列長度的輸入。長文模式依模型的 tokenizer 將回答與標準答案
+        切成重疊視窗，所有列的所有視窗配對一次評分，再彙總為每列一個分數 (見 _WindowPairs.aggregate)。
+        未超過最大長度的列與 bert_score 的結果相同。bert_score 會先對不重複的句子編碼，
+        配對數多時不會重複推論同一個視窗。
+        
+        Args:
+            overlap (float): 相鄰視窗重疊的比例 (0 ~ 0.9)
+        """
+        scorer = self.bert_scorer
+        tokenizer = scorer._tokenizer
+        window = min(tokenizer.model_max_length, 512) - 2
+        pairs = _WindowPairs(self._windows(tokenizer, responses, window, overlap),
+                             self._windows(tokenizer, references, window, overlap))
+        candidates, targets = pairs.pair_texts()
+        with self._inference_context():
+            _, _, F1 = scorer.score(candidates, targets, batch_size=batch_size or scorer.batch_size)
+        return pairs.aggregate(F1.float()).tolist()
     
-    def generate_charts(self, similarity_data: List[Dict[str, float]], output_dir: str) -> None:
-        """生成相似度分析圖表"""
+    def cosine_similarity_windowed(self, responses: List[str], references: List[str],
+                                   batch_size: Optional[int] = None, overlap: float = 0.25) -> List[float]:
+        """長文模式的餘弦相似度：每個視窗只編碼一次，配對的相似度以索引取出向量計算 (見 bert_score_windowed)"""
+        import torch
+        model = self.model
+        window = model.max_seq_length - 2
+        pairs = _WindowPairs(self._windows(model.tokenizer, responses, window, overlap),
+                             self._windows(model.tokenizer, references, window, overlap))
+        response_embeddings = self._encode(pairs.response_windows, batch_size=batch_size or 32)
+        reference_embeddings = self._encode_references(pairs.reference_windows).to(response_embeddings.device)
+        return pairs.aggregate(torch.nn.functional.cosine_similarity(
+            response_embeddings[pairs.response_index.to(response_embeddings.device)],
+            reference_embeddings[pairs.reference_index.to(response_embeddings.device)], dim=1
+        )).tolist()
+    
+    def generate_charts(self, similarity_data: List[Dict[str, float]], output_dir: str,
+                        scoring_stats: Optional[Dict] = None) -> None:
+        """
+        生成相似度分析圖表 (涵蓋分數中所有已註冊的指標)
+        
+        scoring_stats 為本次執行的評分批次統計 (BatchStats.as_dict())，提供時一併寫入統計摘要
+        """
         try:
             os.makedirs(output_dir, exist_ok=True)
             
-            # 提取分數
-            bert_scores = [data['bert_score'] for data in similarity_data]
-            cosine_scores = [data['cosine_similarity'] for data in similarity_data]
+            # 提取分數 (略過沒有分數的列，例如分層評分由字元指標判定的列沒有模型指標的分數)
+            keys = [key for key in metric_keys(similarity_data) if metric_values(similarity_data, key)]
+            scores = {METRICS[key].label: metric_values(similarity_data, key) for key in keys}
+            if not scores:
+                return
             
             # 生成分佈圖
-            self._generate_distribution_plot(bert_scores, cosine_scores, output_dir)
+            self._generate_distribution_plot(scores, output_dir)
             
             # 生成箱型圖
-            self._generate_boxplot(bert_scores, cosine_scores, output_dir)
+            self._generate_boxplot(scores, output_dir)
             
-            # 生成散點圖
-            self._generate_scatter_plot(bert_scores, cosine_scores, output_dir)
+            # 生成散點圖 (前兩個指標都有分數的列)
+            if len(keys) >= 2:
+                paired = [data for data in similarity_data
+                          if data.get(keys[0]) is not None and data.get(keys[1]) is not None]
+                if paired:
+                    self._generate_scatter_plot({METRICS[key].label: [data[key] for data in paired]
+                                                 for key in keys[:2]}, output_dir)
             
             # 生成統計摘要
-            self._generate_summary_stats(bert_scores, cosine_scores, output_dir)
+            self._generate_summary_stats(similarity_data, output_dir, scoring_stats)
             
             self.logger.info(f"圖表已生成並保存到 {output_dir} 目錄")
         except Exception as e:
             self.logger.error(f"生成圖表時發生錯誤: {str(e)}", exc_info=e)
     
-    def _generate_distribution_plot(self, bert_scores: List[float], cosine_scores: List[float], output_dir: str):
-        plt.figure(figsize=(12, 6))
-        plt.subplot(1, 2, 1)
-        sns.histplot(bert_scores, kde=True, color='blue', label='BERT Score')
-        plt.title('BERT Score Distribution')
-        plt.xlabel('Score')
-        plt.ylabel('Frequency')
-        plt.axvline(x=0.7, color='r', linestyle='--', label='Good Threshold')
-        plt.axvline(x=0.5, color='y', linestyle='--', label='Poor Threshold')
-        plt.legend()
-        
-        plt.subplot(1, 2, 2)
-        sns.histplot(cosine_scores, kde=True, color='green', label='Cosine Similarity')
-        plt.title('Cosine Similarity Distribution')
-        plt.xlabel('Score')
-        plt.ylabel('Frequency')
-        plt.axvline(x=0.7, color='r', linestyle='--', label='Good Threshold')
-        plt.axvline(x=0.5, color='y', linestyle='--', label='Poor Threshold')
-        plt.legend()
+    def generate_comparison_chart(self, scores_by_target: Dict[str, List[Dict[str, float]]], output_dir: str) -> None:
+        """生成多個工作區 / 模型之間的相似度比較箱型圖"""
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            rows = []
+            for target, scores in scores_by_target.items():
+                for data in scores:
+                    for key in metric_keys([data]):
+                        if data[key] is None:
+                            continue
+                        rows.append({'Target': target, 'Metric': METRICS[key].label, 'Score': data[key]})
+            if not rows:
+                return
+            
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+            import pandas as pd
+            plt.figure(figsize=(max(10, 2 * len(scores_by_target)), 6))
+            sns.boxplot(data=pd.DataFrame(rows), x='Target', y='Score', hue='Metric')
+            plt.title('Similarity Scores by Target')
+            plt.ylabel('Score')
+            plt.xticks(rotation=30)
+            plt.axhline(y=0.7, color='r', linestyle='--')
+            plt.axhline(y=0.5, color='y', linestyle='--')
+            plt.tight_layout()
+            plt.savefig(os.path.join(output_dir, 'sweep_comparison.png'))
+            plt.close()
+        except Exception as e:
+            self.logger.error(f"生成比較圖表時發生錯誤: {str(e)}", exc_info=e)
+    
+    def _generate_distribution_plot(self, scores: Dict[str, List[float]], output_dir: str):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        colors = ['blue', 'green', 'purple', 'orange', 'brown', 'gray']
+        plt.figure(figsize=(6 * len(scores), 6))
+        for index, (label, values) in enumerate(scores.items()):
+            plt.subplot(1, len(scores), index + 1)
+            sns.histplot(values, kde=True, color=colors[index % len(colors)], label=label)
+            plt.title(f'{label} Distribution')
+            plt.xlabel('Score')
+            plt.ylabel('Frequency')
+            plt.axvline(x=0.7, color='r', linestyle='--', label='Good Threshold')
+            plt.axvline(x=0.5, color='y', linestyle='--', label='Poor Threshold')
+            plt.legend()
         plt.tight_layout()
         plt.savefig(os.path.join(output_dir, 'similarity_distributions.png'))
         plt.close()
     
-    def _generate_boxplot(self, bert_scores: List[float], cosine_scores: List[float], output_dir: str):
+    def _generate_boxplot(self, scores: Dict[str, List[float]], output_dir: str):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        import pandas as pd
         plt.figure(figsize=(10, 6))
-        data = pd.DataFrame({
-            'BERT Score': bert_scores,
-            'Cosine Similarity': cosine_scores
-        })
+        # 各指標有分數的列數可能不同
+        data = pd.DataFrame({label: pd.Series(values, dtype=float) for label, values in scores.items()})
         sns.boxplot(data=data)
         plt.title('Similarity Scores Distribution')
         plt.ylabel('Score')
@@ -100,12 +437,14 @@ class SimilarityAnalyzer:
         plt.savefig(os.path.join(output_dir, 'similarity_boxplot.png'))
         plt.close()
     
-    def _generate_scatter_plot(self, bert_scores: List[float], cosine_scores: List[float], output_dir: str):
+    def _generate_scatter_plot(self, scores: Dict[str, List[float]], output_dir: str):
+        import matplotlib.pyplot as plt
+        (x_label, x_values), (y_label, y_values) = list(scores.items())[:2]
         plt.figure(figsize=(10, 6))
-        plt.scatter(bert_scores, cosine_scores, alpha=0.5)
-        plt.title('BERT Score vs Cosine Similarity')
-        plt.xlabel('BERT Score')
-        plt.ylabel('Cosine Similarity')
+        plt.scatter(x_values, y_values, alpha=0.5)
+        plt.title(f'{x_label} vs {y_label}')
+        plt.xlabel(x_label)
+        plt.ylabel(y_label)
         plt.grid(True)
         plt.axhline(y=0.7, color='r', linestyle='--', label='Good Threshold')
         plt.axhline(y=0.5, color='y', linestyle='--', label='Poor Threshold')
@@ -116,23 +455,21 @@ class SimilarityAnalyzer:
         plt.savefig(os.path.join(output_dir, 'similarity_scatter.png'))
         plt.close()
     
-    def _generate_summary_stats(self, bert_scores: List[float], cosine_scores: List[float], output_dir: str):
-        summary_stats = {
-            'BERT Score': {
-                'Mean': np.mean(bert_scores),
-                'Median': np.median(bert_scores),
-                'Std': np.std(bert_scores),
-                'Min': np.min(bert_scores),
-                'Max': np.max(bert_scores)
-            },
-            'Cosine Similarity': {
-                'Mean': np.mean(cosine_scores),
-                'Median': np.median(cosine_scores),
-                'Std': np.std(cosine_scores),
-                'Min': np.min(cosine_scores),
-                'Max': np.max(cosine_scores)
+    def _generate_summary_stats(self, similarity_data: List[Dict[str, float]], output_dir: str,
+                                scoring_stats: Optional[Dict] = None):
+        specs = [METRICS[key] for key in metric_keys(similarity_data)]
+        summary_stats = {}
+        for spec in specs:
+            values = metric_values(similarity_data, spec.name)
+            if not values:
+                continue
+            summary_stats[spec.label] = {
+                'Mean': np.mean(values),
+                'Median': np.median(values),
+                'Std': np.std(values),
+                'Min': np.min(values),
+                'Max': np.max(values)
             }
-        }
         
         with open(os.path.join(output_dir, 'similarity_summary.txt'), 'w', encoding='utf-8') as f:
             f.write("相似度分析統計摘要\n")
@@ -140,20 +477,10 @@ class SimilarityAnalyzer:
             
             f.write("判斷標準說明：\n")
             f.write("-" * 30 + "\n")
-            f.write("BERT Score:\n")
-            f.write("0.9-1.0: 極高的語意相似度，幾乎完全相同\n")
-            f.write("0.8-0.9: 很高的語意相似度，表達方式不同但核心意思相同\n")
-            f.write("0.7-0.8: 較高的語意相似度，主要意思相同但有些細節差異\n")
-            f.write("0.6-0.7: 中等語意相似度，有部分共同點但差異較大\n")
-            f.write("0.5-0.6: 較低的語意相似度，只有少量相關內容\n")
-            f.write("0-0.5: 很低的語意相似度，幾乎不相關\n\n")
-            
-            f.write("Cosine Similarity:\n")
-            f.write("0.9-1.0: 幾乎完全相同的向量方向\n")
-            f.write("0.7-0.9: 非常相似的向量方向\n")
-            f.write("0.5-0.7: 中等相似度\n")
-            f.write("0.3-0.5: 較低相似度\n")
-            f.write("0-0.3: 幾乎不相關\n\n")
+            for spec in specs:
+                if spec.description:
+                    f.write(f"{spec.label}:\n")
+                    f.write(spec.description + "\n")
             
             f.write("統計數據：\n")
             f.write("-" * 30 + "\n")
@@ -162,4 +489,13 @@ class SimilarityAnalyzer:
                 f.write("-" * 30 + "\n")
                 for stat_name, value in stats.items():
                     f.write(f"{stat_name}: {value:.4f}\n")
-                f.write("\n") 
\ No newline at end of file
+                f.write("\n")
+            
+            if scoring_stats and scoring_stats.get('batches'):
+                f.write("評分批次統計：\n")
+                f.write("-" * 30 + "\n")
+                f.write(f"評分問答對: {scoring_stats['pairs']}\n")
+                f.write(f"批次數: {scoring_stats['batches']}\n")
+                f.write(f"實際 token 數: {scoring_stats['tokens']}\n")
+                f.write(f"填充後 token 數: {scoring_stats['padded_tokens']}\n")
+                f.write(f"填充效率: {scoring_stats['padding_efficiency']:.2%}\n")
@@ -86,7 +86,7 @@ const i18n = {
         'tip_2': '標準答案建議包含完整的解釋，這樣能獲得更好的相似度評估',
         'tip_3': '可以根據需要添加多個工作表，系統會處理所有工作表',
         'tip_4': '檔案大小建議不超過 50MB',
-        'tip_5': '支援的檔案格式：.xlsx, .xlsm, .xltx, .xltm',
+        'tip_5': '支援的檔案格式：.xlsx, .xlsm, .xltx, .xltm, .csv, .jsonl, .parquet',
         
         // 檔案驗證訊息
         'file_validation_success': '✅ 檔案格式正確',
@@ -207,7 +207,7 @@ const i18n = {
         'tip_2': 'Standard answers should include complete explanations for better similarity evaluation',
         'tip_3': 'You can add multiple worksheets as needed, the system will process all worksheets',
         'tip_4': 'File size should not exceed 50MB',
-        'tip_5': 'Supported file formats: .xlsx, .xlsm, .xltx, .xltm',
+        'tip_5': 'Supported file formats: .xlsx, .xlsm, .xltx, .xltm, .csv, .jsonl, .parquet',
         
         // 檔案驗證訊息
         'file_validation_success': '✅ File format is correct',
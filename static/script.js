@@ -13,6 +13,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const progressBarFill = document.getElementById('progress-bar-fill');
     const progressText = document.getElementById('progress-text');
     const logs = document.getElementById('logs');
+    const taskControls = document.getElementById('task-controls');
+    const pauseTaskBtn = document.getElementById('pause-task-btn');
+    const cancelTaskBtn = document.getElementById('cancel-task-btn');
     
     // 結果區塊元素
     const excelResultsSection = document.getElementById('excel-results-section');
@@ -65,6 +68,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const singleMode = document.getElementById('single-mode');
 
     let eventSource;
+    let currentTaskId = null;
+    let taskPaused = false;
 
     // --- Theme Functions ---
 
@@ -322,9 +327,13 @@ document.addEventListener('DOMContentLoaded', () => {
     const fileValidationMessage = document.getElementById('file-validation-message');
     
     excelFileInput.addEventListener('change', (e) => {
-        const file = e.target.files[0];
-        if (file) {
-            validateExcelFile(file);
+        const files = Array.from(e.target.files);
+        if (files.length) {
+            // 可一次選擇多個問答集或 zip 壓縮檔，於同一個任務中批次驗證
+            if (files.every(validateExcelFile) && files.length > 1) {
+                const totalSize = files.reduce((sum, file) => sum + file.size, 0);
+                fileValidationMessage.textContent = `✅ 已選擇 ${files.length} 個檔案 (${(totalSize / 1024).toFixed(2)}KB)`;
+            }
         } else {
             fileValidationMessage.textContent = '';
             fileValidationMessage.className = '';
@@ -332,7 +341,7 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     function validateExcelFile(file) {
-        const supportedExtensions = ['.xlsx', '.xlsm', '.xltx', '.xltm'];
+        const supportedExtensions = ['.xlsx', '.xlsm', '.xltx', '.xltm', '.csv', '.jsonl', '.ndjson', '.parquet', '.zip'];
         const fileExtension = '.' + file.name.split('.').pop().toLowerCase();
         
         // 檢查檔案副檔名
@@ -346,12 +355,12 @@ document.addEventListener('DOMContentLoaded', () => {
             return false;
         }
         
-        // 檢查檔案大小 (限制為 50MB)
-        const maxSize = 50 * 1024 * 1024; // 50MB
+        // 檢查檔案大小 (超過 CHUNKED_UPLOAD_THRESHOLD 的檔案以分段上傳，限制為 5GB)
+        const maxSize = 5 * 1024 * 1024 * 1024; // 5GB
         if (file.size > maxSize) {
             const errorMsg = window.i18n ? 
-                `${window.i18n.t('file_validation_error_size')}: ${(file.size / 1024 / 1024).toFixed(2)}MB. ${window.i18n.t('file_validation_max_size')}: 50MB` :
-                `❌ 檔案太大: ${(file.size / 1024 / 1024).toFixed(2)}MB。最大支援: 50MB`;
+                `${window.i18n.t('file_validation_error_size')}: ${(file.size / 1024 / 1024).toFixed(2)}MB. ${window.i18n.t('file_validation_max_size')}: 5GB` :
+                `❌ 檔案太大: ${(file.size / 1024 / 1024).toFixed(2)}MB。最大支援: 5GB`;
             fileValidationMessage.textContent = errorMsg;
             fileValidationMessage.className = 'error';
             excelFileInput.value = ''; // 清空選擇
@@ -499,6 +508,19 @@ document.addEventListener('DOMContentLoaded', () => {
         const endpoint = currentMode === 'excel' ? '/api/verify' : '/api/verify_single';
 
         try {
+            // 大型檔案先以分段上傳傳送，表單只帶 upload_id
+            if (currentMode === 'excel') {
+                const files = formData.getAll('excel_file').filter(file => file && file.name);
+                formData.delete('excel_file');
+                for (const file of files) {
+                    if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+                        formData.append('upload_id', await uploadInChunks(file));
+                    } else {
+                        formData.append('excel_file', file);
+                    }
+                }
+            }
+
             const response = await fetch(endpoint, {
                 method: 'POST',
                 body: formData
@@ -523,6 +545,69 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // 超過此大小的檔案以分段上傳 (/api/uploads) 傳送，連線中斷時從已接收的位置續傳
+    const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+    const CHUNKED_UPLOAD_MAX_RETRIES = 5;
+
+    async function uploadInChunks(file) {
+        const createResponse = await fetch('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        const upload = await createResponse.json();
+        if (!createResponse.ok) {
+            throw new Error(upload.error || '建立分段上傳失敗');
+        }
+
+        let offset = 0;
+        let retries = 0;
+        while (offset < file.size) {
+            const end = Math.min(offset + upload.chunk_size, file.size);
+            fileValidationMessage.textContent = `⏫ 上傳中: ${file.name} (${(offset / file.size * 100).toFixed(1)}%)`;
+            fileValidationMessage.className = '';
+            try {
+                const response = await fetch(`/api/uploads/${upload.upload_id}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`
+                    },
+                    body: file.slice(offset, end)
+                });
+                const data = await response.json();
+                if (response.status === 409) {
+                    // 伺服器已接收的位置與本地不同，從伺服器的位置繼續
+                    offset = data.received;
+                    continue;
+                }
+                if (!response.ok) {
+                    throw new Error(data.error || '上傳失敗');
+                }
+                offset = data.received;
+                retries = 0;
+            } catch (error) {
+                if (++retries > CHUNKED_UPLOAD_MAX_RETRIES) {
+                    throw error;
+                }
+                // 連線中斷時稍候再查詢伺服器已接收的位置後續傳
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                const statusResponse = await fetch(`/api/uploads/${upload.upload_id}`);
+                if (statusResponse.ok) {
+                    offset = (await statusResponse.json()).received;
+                }
+            }
+        }
+
+        const completeResponse = await fetch(`/api/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+        const completed = await completeResponse.json();
+        if (!completeResponse.ok) {
+            throw new Error(completed.error || '上傳失敗');
+        }
+        fileValidationMessage.textContent = `✅ 上傳完成: ${file.name} (${(file.size / 1024 / 1024).toFixed(2)}MB)`;
+        return upload.upload_id;
+    }
+
     function setButtonLoading(isLoading) {
         if (isLoading) {
             submitBtn.disabled = true;
@@ -547,14 +632,60 @@ document.addEventListener('DOMContentLoaded', () => {
         logs.innerHTML = '';
         progressBarFill.style.width = '0%';
         progressText.textContent = '正在初始化...';
+        hideTaskControls();
     }
 
+    // --- 執行中任務的暫停 / 繼續 / 取消 ---
+    function showTaskControls(taskId) {
+        currentTaskId = taskId;
+        taskPaused = false;
+        pauseTaskBtn.textContent = '⏸️ 暫停';
+        pauseTaskBtn.disabled = false;
+        cancelTaskBtn.disabled = false;
+        taskControls.classList.remove('hidden');
+    }
+
+    function hideTaskControls() {
+        currentTaskId = null;
+        taskControls.classList.add('hidden');
+    }
+
+    async function controlTask(action) {
+        if (!currentTaskId) return;
+        try {
+            const response = await fetch(`/api/tasks/${currentTaskId}/${action}`, { method: 'POST' });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || '操作失敗');
+            }
+            taskPaused = data.state === 'paused';
+            pauseTaskBtn.textContent = taskPaused ? '▶️ 繼續' : '⏸️ 暫停';
+            if (data.state === 'cancelled') {
+                pauseTaskBtn.disabled = true;
+                cancelTaskBtn.disabled = true;
+                progressText.textContent = '正在取消，等待進行中的請求完成...';
+            }
+        } catch (error) {
+            showError(`任務操作失敗: ${error.message}`);
+        }
+    }
+
+    pauseTaskBtn.addEventListener('click', () => controlTask(taskPaused ? 'resume' : 'pause'));
+    cancelTaskBtn.addEventListener('click', () => {
+        if (confirm('確定要取消此任務嗎？已完成的部分結果會保留。')) {
+            controlTask('cancel');
+        }
+    });
+
     function listenForUpdates(taskId) {
         if (eventSource) {
             eventSource.close();
         }
 
         eventSource = new EventSource(`/stream/${taskId}`);
+        showTaskControls(taskId);
+        // 目前正在累加串流回答的日誌區塊 (每個任務各自建立，不以固定 id 查找)
+        let partialEntry = null;
 
         eventSource.onmessage = function(event) {
             const data = JSON.parse(event.data);
@@ -579,12 +710,23 @@ document.addEventListener('DOMContentLoaded', () => {
                 progressText.textContent = '任務完成！正在準備結果...';
                 progressBarFill.style.width = '100%';
                 eventSource.close();
+                hideTaskControls();
+                setButtonLoading(false);
+                fetchResults(taskId);
+                return;
+            }
+
+            if (data.status === 'cancelled') {
+                progressText.textContent = '任務已取消，正在載入部分結果...';
+                eventSource.close();
+                hideTaskControls();
                 setButtonLoading(false);
                 fetchResults(taskId);
                 return;
             }
 
             if (data.status === 'error') {
+                hideTaskControls();
                 progressText.textContent = '任務執行失敗';
                 showError(`任務執行失敗: ${data.message || '未知錯誤'}`);
                 eventSource.close();
@@ -592,6 +734,21 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
 
+            // 處理串流中的部分回答 (單筆驗證)，累加到同一個日誌區塊
+            if (data.partial !== undefined) {
+                if (!partialEntry) {
+                    partialEntry = document.createElement('div');
+                    partialEntry.className = 'partial-response';
+                    partialEntry.style.whiteSpace = 'pre-wrap';
+                    logs.appendChild(partialEntry);
+                }
+                partialEntry.textContent += data.partial;
+                logs.scrollTop = logs.scrollHeight;
+                return;
+            }
+            // 其他訊息代表串流回答已結束，之後的部分回答另起新的區塊
+            partialEntry = null;
+
             // 處理日誌消息
             if (data.log) {
                 const logEntry = document.createElement('div');
@@ -616,6 +773,10 @@ document.addEventListener('DOMContentLoaded', () => {
                     } else if (detail.current_sheet) {
                         statusText = `${detail.current_sheet} - 第 ${detail.current_item}/${detail.total_items_in_sheet} 筆 (${detail.sheet_progress.toFixed(1)}%)`;
                     }
+                    // 聊天請求的並行上限 (自適應並行控制時會隨延遲與錯誤率變化)
+                    if (detail.current_sheet && detail.concurrency_limit !== undefined) {
+                        statusText += ` - 並行數 ${detail.concurrency_limit}`;
+                    }
                     
                     progressText.textContent = statusText;
                 } else {
@@ -649,6 +810,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 progressText.textContent = '任務完成！正在準備結果...';
                 progressBarFill.style.width = '100%';
                 eventSource.close();
+                hideTaskControls();
                 setButtonLoading(false);
                 fetchResults(taskId);
             }
@@ -705,7 +867,10 @@ document.addEventListener('DOMContentLoaded', () => {
         const resultCard = document.createElement('div');
         resultCard.className = 'single-result-card';
         
-        const similarityScore = result.similarity_scores?.cosine_similarity || 0;
+        const scores = result.similarity_scores || {};
+        const scoreHeaders = result.score_headers || {};
+        // 分層評分由字元指標判定時沒有模型指標的分數，改以字元 ROUGE-L 顯示
+        const similarityScore = scores[result.pass_metric || 'cosine_similarity'] ?? scores.rouge_l ?? 0;
         const similarityPercentage = Math.round(similarityScore * 100);
         
         // 根據相似度分數決定顏色和狀態
@@ -756,14 +921,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 <div class="result-section">
                     <h4>📈 詳細分數</h4>
                     <div class="scores-grid">
+                        ${Object.entries(scores).map(([key, value]) => `
                         <div class="score-item">
-                            <span class="score-name">BERT Score</span>
-                            <span class="score-value">${(result.similarity_scores?.bert_score || 0).toFixed(4)}</span>
-                        </div>
-                        <div class="score-item">
-                            <span class="score-name">餘弦相似度</span>
-                            <span class="score-value">${(result.similarity_scores?.cosine_similarity || 0).toFixed(4)}</span>
-                        </div>
+                            <span class="score-name">${scoreHeaders[key] || key}</span>
+                            <span class="score-value">${typeof value === 'number' ? value.toFixed(4) : (value ?? '—')}</span>
+                        </div>`).join('')}
                     </div>
                 </div>
             </div>
@@ -787,6 +949,18 @@ document.addEventListener('DOMContentLoaded', () => {
         if (files.length === 0) {
             excelResultsContainer.innerHTML = '<p>沒有生成任何結果檔案。</p>';
         } else {
+            // 所有結果檔案打包為一個 zip 下載
+            if (files.length > 1) {
+                const bundleCard = document.createElement('div');
+                bundleCard.className = 'result-card';
+                bundleCard.innerHTML = `
+                    <div class="file-name">全部結果 (zip)</div>
+                    <div class="actions">
+                        <a href="/api/results/${taskId}/bundle" download class="btn btn-primary">下載全部</a>
+                    </div>
+                `;
+                excelResultsContainer.appendChild(bundleCard);
+            }
             files.forEach(fileName => {
                 const card = document.createElement('div');
                 card.className = 'result-card';
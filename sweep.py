@@ -0,0 +1,331 @@
+"""
+多工作區 / 多模型比較模組
+此模組以同一份問答 Excel 同時驗證多個工作區或 WorkspaceConfig 變體：
+Excel 只解析一次、評分模型與標準答案向量共用，問題會同時發送到所有目標，
+最後產生一份比較報告 (比較工作簿、統計摘要與比較圖表)。
+"""
+
+import argparse
+import copy
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+from openpyxl import Workbook
+from openpyxl.styles import Font, PatternFill, Alignment
+
+from config import Config, WorkspaceConfig
+from excel_handler import ExcelHandler
+from logger import Logger
+from main import QAVerificationSystem
+import metrics
+from profiler import worker_thread_prefix
+from similarity_analyzer import get_shared_analyzer
+from task_control import TaskCancelled
+import telemetry
+
+COMPARISON_WORKBOOK = 'sweep_comparison.xlsx'
+SUMMARY_CSV = 'sweep_summary.csv'
+SUMMARY_TXT = 'sweep_summary.txt'
+
+
+@dataclass
+class SweepTarget:
+    """
+    比較模式中的一個目標
+
+    Attributes:
+        name (str): 報告中顯示的名稱
+        workspace (str): 工作區名稱或 slug，不存在時會以 overrides 建立
+        overrides (Dict[str, Any]): 覆寫 WorkspaceConfig 的欄位 (例如 model、temp)
+    """
+    name: str
+    workspace: str
+    overrides: Dict[str, Any] = field(default_factory=dict)
+
+
+def load_sweep_variants(path: str) -> List[Dict[str, Any]]:
+    """
+    從 YAML 檔案載入 WorkspaceConfig 變體
+
+    檔案可以是變體清單，或包含 `variants` 清單的字典，每個變體例如：
+        - name: llama3
+          model: llama3.1:8b-instruct-fp16
+        - name: qwen
+          model: qwen2.5:7b
+          temp: 0.2
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or []
+    if isinstance(data, dict):
+        data = data.get('variants', [])
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise ValueError(f"變體設定檔格式錯誤: {path}")
+    return data
+
+
+def build_sweep_targets(base_workspace: str, workspaces: Optional[List[str]] = None,
+                        variants: Optional[List[Dict[str, Any]]] = None) -> List[SweepTarget]:
+    """
+    建立比較目標清單
+
+    Args:
+        base_workspace (str): 基礎工作區名稱，變體未指定 workspace 時使用 `<base>-<name>`
+        workspaces (Optional[List[str]]): 直接比較的既有工作區
+        variants (Optional[List[Dict[str, Any]]]): WorkspaceConfig 變體
+
+    Returns:
+        List[SweepTarget]: 比較目標
+    """
+    targets = [SweepTarget(name=workspace, workspace=workspace) for workspace in dict.fromkeys(workspaces or [])]
+
+    allowed_fields = {f.name for f in fields(WorkspaceConfig)}
+    for index, variant in enumerate(variants or [], 1):
+        variant = dict(variant)
+        name = str(variant.pop('name', None) or f"variant-{index}")
+        workspace = str(variant.pop('workspace', None) or f"{base_workspace}-{name}")
+        unknown = set(variant) - allowed_fields
+        if unknown:
+            raise ValueError(f"變體 '{name}' 含有未知的 WorkspaceConfig 欄位: {', '.join(sorted(unknown))}")
+        targets.append(SweepTarget(name=name, workspace=workspace, overrides=variant))
+
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError("比較目標名稱重複")
+    if len(targets) < 1:
+        raise ValueError("至少需要一個比較目標")
+    return targets
+
+
+def _prepare_target(config: Config, logger: Logger, target: SweepTarget, analyzer,
+                    session) -> Tuple[QAVerificationSystem, Optional[str]]:
+    """為目標建立專屬的 QAVerificationSystem (共用分析器與 HTTP 連線) 並取得 (或建立) 工作區"""
+    target_config = copy.deepcopy(config)
+    if target.overrides:
+        target_config.workspace = replace(config.workspace, **target.overrides)
+    system = QAVerificationSystem(target_config, logger, similarity_analyzer=analyzer, session=session)
+    slug = system.get_workspace_slug(target.workspace)
+    if not slug:
+        slug = system.create_workspace(target.workspace)
+    return system, slug
+
+
+def _summarize(target: SweepTarget, scores: List[Optional[Dict[str, float]]], stats: List[Optional[Dict]],
+               metric_names: List[str], pass_metric: str, threshold: float) -> Dict[str, Any]:
+    answered = [s for s in scores if s is not None]
+    durations = [s['duration'] for s in stats if s and s.get('duration') is not None]
+
+    def stat(values: np.ndarray, fn) -> Optional[float]:
+        return round(float(fn(values)), 4) if values.size else None
+
+    summary = {
+        'target': target.name,
+        'workspace': target.workspace,
+        'answered': len(answered),
+        'failed': len(scores) - len(answered),
+    }
+    for metric in metric_names:
+        values = np.array(metrics.metric_values(answered, metric))
+        summary[f'{metric}_mean'] = stat(values, np.mean)
+        summary[f'{metric}_median'] = stat(values, np.median)
+    passed = np.array([metrics.is_passed(s, pass_metric, threshold) for s in answered])
+    summary['pass_rate'] = stat(passed, np.mean)
+    summary['mean_latency'] = round(float(np.mean(durations)), 3) if durations else None
+    return summary
+
+
+def _write_comparison_workbook(path: str, rows: List[Tuple[str, str, str, int]], targets: List[SweepTarget],
+                               responses: Dict[str, List[Optional[str]]], scores: Dict[str, List[Optional[Dict[str, float]]]],
+                               metric_names: List[str]):
+    wb = Workbook()
+    wb.remove(wb.active)
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+
+    headers = ['問題', '標準答案']
+    for target in targets:
+        headers.append(f'{target.name} 回答')
+        headers.extend(f'{target.name} {header}' for header in metrics.score_headers(metric_names))
+
+    sheets = {}
+    for index, (sheet_name, question, answer, _) in enumerate(rows):
+        ws = sheets.get(sheet_name)
+        if ws is None:
+            ws = wb.create_sheet(title=sheet_name[:31])
+            for col, header in enumerate(headers, 1):
+                cell = ws.cell(row=1, column=col, value=header)
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = Alignment(horizontal="center", vertical="center")
+            sheets[sheet_name] = ws
+        values = [question, answer]
+        for target in targets:
+            score = scores[target.name][index]
+            values.append(responses[target.name][index])
+            values.extend(score[metric] if score else None for metric in metric_names)
+        ws.append(values)
+    wb.save(path)
+
+
+def _write_summary(output_dir: str, summaries: List[Dict[str, Any]], pass_metric: str, threshold: float):
+    fieldnames = list(summaries[0].keys())
+    with open(os.path.join(output_dir, SUMMARY_CSV), 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    with open(os.path.join(output_dir, SUMMARY_TXT), 'w', encoding='utf-8') as f:
+        f.write("多工作區比較摘要\n")
+        f.write("=" * 50 + "\n\n")
+        f.write(f"合格標準: {metrics.get_metric(pass_metric).header} >= {threshold}\n\n")
+        rank_key = f'{pass_metric}_mean'
+        ranked = sorted(summaries, key=lambda s: s[rank_key] if s[rank_key] is not None else -1, reverse=True)
+        for rank, summary in enumerate(ranked, 1):
+            f.write(f"#{rank} {summary['target']} (工作區: {summary['workspace']})\n")
+            f.write("-" * 30 + "\n")
+            for key in fieldnames[2:]:
+                f.write(f"{key}: {summary[key]}\n")
+            f.write("\n")
+
+
+def run_sweep(config: Config, logger: Logger, args: argparse.Namespace, targets: List[SweepTarget], web_mode: bool = False):
+    """
+    以同一份 Excel 同時驗證多個工作區 / 模型並產生比較報告
+
+    Args:
+        config (Config): 系統配置物件
+        logger (Logger): 日誌記錄器實例
+        args (argparse.Namespace): 命令列參數 (使用 excel 與 output)
+        targets (List[SweepTarget]): 比較目標
+        web_mode (bool): 是否為 Web 模式
+    """
+    logger.info(f"[START] 多工作區比較啟動，共 {len(targets)} 個目標", progress=0, status="系統初始化中...")
+    with telemetry.STAGE_SECONDS.labels(stage='init').time():
+        analyzer = get_shared_analyzer(config.analyzer.model, config.analyzer.backend)
+        base_system = QAVerificationSystem(config, logger, similarity_analyzer=analyzer)
+
+    # 1. 驗證 API 金鑰 (所有目標共用同一個 AnythingLLM)
+    logger.info("[INFO] 驗證 API 金鑰...", progress=10, status="驗證 API 金鑰...")
+    with telemetry.STAGE_SECONDS.labels(stage='validate_api_key').time():
+        api_key_valid = base_system.validate_api_key()
+    if not api_key_valid:
+        logger.error("[ERROR] API 金鑰無效，終止程序。")
+        return
+
+    # 2. 準備每個目標的工作區
+    ready: List[Tuple[SweepTarget, QAVerificationSystem, str]] = []
+    with telemetry.STAGE_SECONDS.labels(stage='workspace').time():
+        for target in targets:
+            system, slug = _prepare_target(config, logger, target, analyzer, base_system.session)
+            if slug:
+                ready.append((target, system, slug))
+                logger.info(f"[SUCCESS] 目標 '{target.name}' 使用工作區 slug: {slug}")
+            else:
+                logger.error(f"[ERROR] 無法獲取或創建目標 '{target.name}' 的工作區，將跳過此目標。")
+    if not ready:
+        logger.error("[ERROR] 沒有可用的比較目標，終止程序。")
+        return
+    logger.info(f"[SUCCESS] {len(ready)} 個目標已就緒", progress=20, status="工作區準備完成")
+
+    # 3. 只解析一次 Excel，並預先編碼標準答案
+    with telemetry.STAGE_SECONDS.labels(stage='load_excel').time():
+        excel_handler = ExcelHandler(args.excel, logger)
+        rows = [
+            (sheet_name, question, answer, row_index)
+            for sheet_name, qa_pairs in excel_handler.get_all_qa_pairs().items()
+            for question, answer, row_index in qa_pairs
+        ]
+    if any(spec.model == metrics.MODEL_SENTENCE_TRANSFORMER for spec in base_system.metrics):
+        with telemetry.STAGE_SECONDS.labels(stage='reference_embeddings').time():
+            analyzer.precompute_references([answer for _, _, answer, _ in rows])
+    logger.info(f"[INFO] 共 {len(rows)} 個問答對，將發送至 {len(ready)} 個目標", progress=30, status="開始處理問答對...")
+
+    # 4. 同時對所有目標發送問題
+    answers: Dict[str, List[Optional[Tuple[str, Dict]]]] = {target.name: [None] * len(rows) for target, _, _ in ready}
+    total_requests = len(rows) * len(ready)
+    max_workers = base_system.chat_workers * len(ready)
+    with telemetry.STAGE_SECONDS.labels(stage='chat').time(), \
+            ThreadPoolExecutor(max_workers=max_workers,
+                               thread_name_prefix=worker_thread_prefix(base_system.task_id)) as executor:
+        futures = {}
+        for index, (_, question, _, _) in enumerate(rows):
+            for target, system, slug in ready:
+                futures[executor.submit(system.get_llm_answer, slug, question)] = (target.name, index)
+        for completed, future in enumerate(as_completed(futures), 1):
+            name, index = futures[future]
+            try:
+                answers[name][index] = future.result()
+            except TaskCancelled:
+                # 取消後尚未送出的請求直接略過，已送出的請求照常完成
+                continue
+            except Exception as e:
+                logger.error(f"[ERROR] 目標 '{name}' 第 {index + 1} 筆發生錯誤: {e}", exc_info=True)
+            if web_mode or completed == total_requests:
+                concurrency_detail = base_system.concurrency_detail()
+                logger.info(f"[PROGRESS] 已完成 {completed}/{total_requests} 個請求",
+                            progress=30 + (completed / total_requests) * 45,
+                            status=f"處理中: {completed}/{total_requests} 個請求 - 並行數 {concurrency_detail['concurrency_limit']}",
+                            detail=concurrency_detail)
+
+    # 5. 所有目標的回答一起依長度分桶批次評分 (標準答案向量已共用)
+    responses: Dict[str, List[Optional[str]]] = {}
+    scores: Dict[str, List[Optional[Dict[str, float]]]] = {}
+    logger.info("[INFO] 計算相似度...", progress=75, status="計算相似度...")
+    with telemetry.STAGE_SECONDS.labels(stage='scoring').time():
+        pending = [
+            (target.name, i) for target, _, _ in ready
+            for i, answer in enumerate(answers[target.name]) if answer
+        ]
+        try:
+            pending_scores = base_system.score_pairs(
+                [answers[name][i][0] for name, i in pending], [rows[i][2] for _, i in pending]
+            )
+        except TaskCancelled:
+            # 評分途中取消：比較報告只包含回答，不含分數
+            pending_scores = [None] * len(pending)
+        for target, _, _ in ready:
+            responses[target.name] = [answer[0] if answer else None for answer in answers[target.name]]
+            scores[target.name] = [None] * len(rows)
+        for (name, i), score in zip(pending, pending_scores):
+            scores[name][i] = score
+        scored = sum(1 for score in pending_scores if score)
+        telemetry.ROWS_PROCESSED.labels(result='scored').inc(scored)
+        telemetry.ROWS_PROCESSED.labels(result='failed').inc(len(rows) * len(ready) - scored)
+        for target, _, _ in ready:
+            answered = sum(1 for score in scores[target.name] if score)
+            logger.info(f"[INFO] 目標 '{target.name}' 評分完成 ({answered}/{len(rows)})")
+
+    # 6. 產生比較報告
+    output_dir = args.output
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info("[INFO] 生成比較報告...", progress=85, status="生成比較報告...")
+    threshold = config.analyzer.similarity_threshold
+    pass_metric = config.analyzer.pass_metric
+    metric_names = base_system.metric_names
+    targets_ready = [target for target, _, _ in ready]
+    summaries = [
+        _summarize(target, scores[target.name], [answer[1] if answer else None for answer in answers[target.name]],
+                   metric_names, pass_metric, threshold)
+        for target in targets_ready
+    ]
+    try:
+        with telemetry.STAGE_SECONDS.labels(stage='charts').time():
+            analyzer.generate_comparison_chart(
+                {name: [s for s in target_scores if s] for name, target_scores in scores.items()}, output_dir
+            )
+        _write_summary(output_dir, summaries, pass_metric, threshold)
+        with telemetry.STAGE_SECONDS.labels(stage='save_excel').time():
+            _write_comparison_workbook(os.path.join(output_dir, COMPARISON_WORKBOOK), rows, targets_ready, responses, scores,
+                                       metric_names)
+        logger.info(f"[SUCCESS] 比較報告已儲存至 '{output_dir}' 目錄。", progress=100, status="完成")
+    except Exception as e:
+        logger.error(f"[ERROR] 儲存比較報告時發生錯誤: {e}", exc_info=True)
+
+    for summary in summaries:
+        means = '，'.join(f"平均 {metrics.get_metric(metric).header} {summary[f'{metric}_mean']}" for metric in metric_names)
+        logger.info(f"[RESULT] {summary['target']}: {means}，合格率 {summary['pass_rate']}")
+    logger.info("[COMPLETE] 多工作區比較流程全部完成！")
@@ -0,0 +1,390 @@
+"""
+CSV / JSONL / Parquet 問答集的串流讀寫
+其他系統匯出的問答資料常為 CSV、JSONL 或 Parquet，且可能有數百萬列。此模組的處理器提供與 ExcelHandler 相同的介面
+(count_qa_pairs / iter_qa_chunks / write_results / save_workbook)，process_qa_pairs 以固定大小的區塊讀取問答對，
+結果依輸入順序逐區塊寫入相同格式的輸出檔 (保留所有原始欄位，並加上 llm_response 與各指標分數欄位)，
+讀寫所需的記憶體只與區塊大小有關。
+"""
+
+import csv
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from excel_handler import ExcelHandler, scan_workbook
+from logger import Logger
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xltx', '.xltm')
+TABULAR_EXTENSIONS = ('.csv', '.jsonl', '.ndjson', '.parquet')
+
+# 依欄位名稱 (不分大小寫) 辨識問題與標準答案欄位；CSV 與 Parquet 找不到時使用前兩欄
+QUESTION_COLUMNS = ('question', 'query', 'prompt', 'q', '問題')
+ANSWER_COLUMNS = ('answer', 'standard_answer', 'expected_answer', 'reference', 'ground_truth', 'a', '標準答案', '答案')
+RESPONSE_COLUMN = 'llm_response'
+
+# Parquet 每次讀取與寫入的列數 (一個 row group)
+_PARQUET_BATCH_ROWS = 4096
+
+# (工作表名稱, 問題, 標準答案, 原始列索引)
+QARow = Tuple[str, str, str, int]
+# (LLM 回答, 相似度分數)，無法取得回答時為 None
+QAResult = Optional[Tuple[str, Dict[str, Any]]]
+
+
+def _find_column(fieldnames: Iterable[Any], candidates: Tuple[str, ...]) -> Optional[Any]:
+    lowered = {}
+    for name in fieldnames:
+        lowered.setdefault(str(name).strip().lower(), name)
+    return next((lowered[candidate] for candidate in candidates if candidate in lowered), None)
+
+
+def _text(value: Any) -> str:
+    return '' if value is None else str(value).strip()
+
+
+class TabularHandler:
+    """
+    串流問答集處理器的基底類別
+
+    子類別實作 _read_records (逐筆產生 dict 形式的原始列) 與輸出的 _open_output / _write_record / _close_output。
+    結果先寫入暫存檔，save_workbook 時移至輸出路徑；問題或標準答案為空白的列原樣寫出，LLM 回答與分數留空。
+    """
+    extension = ''
+
+    def __init__(self, file_path: str, logger: Logger):
+        self.file_path = file_path
+        self.logger = logger
+        # 串流格式只有一個「工作表」，以檔名 (不含副檔名) 作為進度與統計中的名稱
+        self.sheet_name = os.path.splitext(os.path.basename(file_path))[0]
+        self.fieldnames: List[Any] = []
+        self.question_column: Optional[Any] = None
+        self.answer_column: Optional[Any] = None
+        self._total: Optional[int] = None
+        # 已讀取但尚未寫出的原始列：(列索引, 原始列, 是否為問答對)，依輸入順序
+        self._pending: Deque[Tuple[int, Dict[str, Any], bool]] = deque()
+        self._results: Dict[int, QAResult] = {}
+        self._score_keys: Optional[List[str]] = None
+        self._spool_path: Optional[str] = None
+
+        if not os.path.exists(file_path):
+            error_msg = f"[ERROR] 問答集檔案不存在: {file_path}"
+            self.logger.error(error_msg)
+            raise FileNotFoundError(error_msg)
+        file_size = os.path.getsize(file_path)
+        if file_size == 0:
+            error_msg = f"[ERROR] 問答集檔案是空的: {file_path}"
+            self.logger.error(error_msg)
+            raise ValueError(error_msg)
+        self.logger.info(f"[INFO] 以串流模式讀取問答集: {file_path} (大小: {file_size} bytes)")
+
+    # --- 讀取 ---
+
+    def _read_records(self, qa_only: bool = False) -> Iterator[Dict[str, Any]]:
+        """逐筆讀取原始列 (qa_only 時可只讀取問題與標準答案欄位)"""
+        raise NotImplementedError
+
+    def _qa_of(self, record: Dict[str, Any]) -> Tuple[str, str]:
+        return _text(record.get(self.question_column)), _text(record.get(self.answer_column))
+
+    def count_qa_pairs(self) -> Dict[str, int]:
+        """計算有效問答對的數量 (第一次呼叫時掃描整個檔案，之後使用快取)"""
+        if self._total is None:
+            self._total = sum(1 for record in self._read_records(qa_only=True) if all(self._qa_of(record)))
+        return {self.sheet_name: self._total}
+
+    def get_total_qa_pairs(self) -> int:
+        return self.count_qa_pairs()[self.sheet_name]
+
+    def iter_qa_chunks(self, chunk_size: int) -> Iterator[List[QARow]]:
+        """
+        依輸入順序逐區塊產生問答對
+
+        Yields:
+            List[QARow]: 最多 chunk_size 筆的 (工作表名稱, 問題, 標準答案, 原始列索引)
+        """
+        chunk: List[QARow] = []
+        for index, record in enumerate(self._read_records()):
+            question, answer = self._qa_of(record)
+            is_qa = bool(question and answer)
+            self._pending.append((index, record, is_qa))
+            if is_qa:
+                chunk.append((self.sheet_name, question, answer, index))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+        self._flush()
+
+    # --- 寫入 ---
+
+    def _open_output(self, fieldnames: List[Any], score_keys: List[str]):
+        raise NotImplementedError
+
+    def _write_record(self, record: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _close_output(self):
+        raise NotImplementedError
+
+    def _result_columns(self) -> List[str]:
+        return [RESPONSE_COLUMN, *self._score_keys]
+
+    def write_results(self, rows: List[QARow], results: List[QAResult], score_keys: List[str]) -> None:
+        """
+        寫入 iter_qa_chunks 產生的一個區塊的結果
+
+        Args:
+            rows (List[QARow]): iter_qa_chunks 產生的區塊
+            results (List[QAResult]): 每一列的 (LLM 回答, 相似度分數)，無法取得回答時為 None
+            score_keys (List[str]): 分數欄位 (輸出檔的欄位在寫入第一列時決定)
+        """
+        if self._score_keys is None:
+            self._score_keys = list(score_keys)
+        for row, result in zip(rows, results):
+            self._results[row[3]] = result
+        self._flush()
+
+    def _flush(self, force: bool = False):
+        """依輸入順序寫出已有結果的列 (force 時未完成的列也以空白結果寫出)"""
+        if self._spool_path is None:
+            if self._score_keys is None:
+                self._score_keys = []
+            fd, self._spool_path = tempfile.mkstemp(prefix='qa_results_', suffix=self.extension)
+            os.close(fd)
+            self._open_output(self.fieldnames, self._score_keys)
+        result_columns = set(self._result_columns())
+        while self._pending:
+            index, record, is_qa = self._pending[0]
+            if is_qa and index not in self._results and not force:
+                break
+            self._pending.popleft()
+            result = self._results.pop(index, None)
+            llm_response, similarity_scores = result if result else ('', {})
+            # 輸入已有同名欄位 (例如以前一次的結果檔重新驗證) 時以本次結果取代
+            output = {key: value for key, value in record.items() if key not in result_columns}
+            output[RESPONSE_COLUMN] = llm_response
+            for key in self._score_keys:
+                output[key] = similarity_scores.get(key)
+            self._write_record(output)
+
+    def write_score_headers(self, score_headers: List[str]) -> None:
+        """欄位標題在寫入第一列時已寫出 (使用指標名稱而非 Excel 的中文標題)"""
+
+    def save_workbook(self, output_path: str):
+        """寫出剩餘的列並將結果檔移至 output_path (與輸入相同的格式)"""
+        try:
+            self._flush(force=True)
+            self._close_output()
+            shutil.move(self._spool_path, output_path)
+            self._spool_path = None
+            self.logger.info(f"[SUCCESS] 結果檔案成功儲存至: {output_path}")
+        except Exception as e:
+            self.logger.error(f"[ERROR] 儲存結果檔案至 '{output_path}' 時發生錯誤: {e}", exc_info=True)
+
+
+class CsvHandler(TabularHandler):
+    """
+    CSV 問答集 (UTF-8，可含 BOM)
+
+    第一列含可辨識的問題與標準答案欄位名稱時視為標題列，否則與 Excel 相同，以前兩欄作為問題與標準答案，
+    輸出時加上 question、answer、column_3... 標題。
+    """
+    extension = '.csv'
+
+    def _read_records(self, qa_only: bool = False) -> Iterator[Dict[str, Any]]:
+        with open(self.file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            first = next(reader, None)
+            if first is None:
+                return
+            question_column = _find_column(first, QUESTION_COLUMNS)
+            answer_column = _find_column(first, ANSWER_COLUMNS)
+            if question_column is not None and answer_column is not None:
+                rows = reader
+                self.fieldnames = first
+            else:
+                rows = itertools.chain([first], reader)
+                self.fieldnames = ['question', 'answer'] + [f'column_{i}' for i in range(3, len(first) + 1)]
+                question_column, answer_column = 'question', 'answer'
+            self.question_column, self.answer_column = question_column, answer_column
+            warned = qa_only
+            for row in rows:
+                if len(row) > len(self.fieldnames) and not warned:
+                    self.logger.warning(f"[WARNING] '{os.path.basename(self.file_path)}' 有些列的欄數多於標題列，"
+                                        f"多出的欄位不會寫入結果檔")
+                    warned = True
+                yield dict(zip(self.fieldnames, row))
+
+    def _open_output(self, fieldnames: List[Any], score_keys: List[str]):
+        columns = [name for name in fieldnames if name not in self._result_columns()] + self._result_columns()
+        self._file = open(self._spool_path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def _write_record(self, record: Dict[str, Any]):
+        self._writer.writerow(record)
+
+    def _close_output(self):
+        self._file.close()
+
+
+class JsonlHandler(TabularHandler):
+    """
+    JSONL 問答集：每行一個 JSON 物件 (或 [問題, 標準答案] 陣列)
+
+    問題與標準答案依欄位名稱辨識 (例如 question / answer)，輸出為加上 llm_response 與分數欄位的 JSONL。
+    """
+    extension = '.jsonl'
+
+    def _read_records(self, qa_only: bool = False) -> Iterator[Dict[str, Any]]:
+        with open(self.file_path, 'r', encoding='utf-8-sig') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError as e:
+                    if not qa_only:
+                        self.logger.warning(f"[WARNING] '{os.path.basename(self.file_path)}' 第 {line_number} 行"
+                                            f"不是有效的 JSON，將被跳過: {e}")
+                    continue
+                if isinstance(item, list) and len(item) == 2:
+                    item = {'question': item[0], 'answer': item[1]}
+                yield item if isinstance(item, dict) else {'value': item}
+
+    def _qa_of(self, record: Dict[str, Any]) -> Tuple[str, str]:
+        # 每行的欄位可能不同，逐行辨識
+        return (_text(record.get(_find_column(record, QUESTION_COLUMNS))),
+                _text(record.get(_find_column(record, ANSWER_COLUMNS))))
+
+    def _open_output(self, fieldnames: List[Any], score_keys: List[str]):
+        self._file = open(self._spool_path, 'w', encoding='utf-8')
+
+    def _write_record(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def _close_output(self):
+        self._file.close()
+
+
+class ParquetHandler(TabularHandler):
+    """
+    Parquet 問答集 (需要 pyarrow)
+
+    以 row group 為單位串流讀取，輸出沿用輸入的 schema，並加上 llm_response (字串) 與分數 (浮點數) 欄位。
+    """
+    extension = '.parquet'
+
+    def __init__(self, file_path: str, logger: Logger):
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            error_msg = "[ERROR] 讀寫 Parquet 問答集需要安裝 pyarrow (pip install pyarrow)"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        super().__init__(file_path, logger)
+
+    def _read_records(self, qa_only: bool = False) -> Iterator[Dict[str, Any]]:
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(self.file_path)
+        self.schema = parquet_file.schema_arrow
+        self.fieldnames = self.schema.names
+        if len(self.fieldnames) < 2:
+            raise ValueError(f"'{os.path.basename(self.file_path)}' 的欄數少於 2")
+        self.question_column = _find_column(self.fieldnames, QUESTION_COLUMNS) or self.fieldnames[0]
+        self.answer_column = _find_column(self.fieldnames, ANSWER_COLUMNS) or self.fieldnames[1]
+        columns = [self.question_column, self.answer_column] if qa_only else None
+        for batch in parquet_file.iter_batches(batch_size=_PARQUET_BATCH_ROWS, columns=columns):
+            yield from batch.to_pylist()
+
+    def _open_output(self, fieldnames: List[Any], score_keys: List[str]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        fields = [field for field in self.schema if field.name not in self._result_columns()]
+        fields.append(pa.field(RESPONSE_COLUMN, pa.string()))
+        fields.extend(pa.field(key, pa.string() if key == 'scoring_tier' else pa.float64()) for key in score_keys)
+        self._output_schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(self._spool_path, self._output_schema)
+        self._buffer: List[Dict[str, Any]] = []
+
+    def _write_buffer(self):
+        import pyarrow as pa
+
+        if self._buffer:
+            self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=self._output_schema))
+            self._buffer = []
+
+    def _write_record(self, record: Dict[str, Any]):
+        self._buffer.append(record)
+        if len(self._buffer) >= _PARQUET_BATCH_ROWS:
+            self._write_buffer()
+
+    def _close_output(self):
+        self._write_buffer()
+        self._writer.close()
+
+
+# process_qa_pairs 接受的問答集處理器
+QAFileHandler = Union[ExcelHandler, TabularHandler]
+
+_HANDLERS = {
+    '.csv': CsvHandler,
+    '.jsonl': JsonlHandler,
+    '.ndjson': JsonlHandler,
+    '.parquet': ParquetHandler,
+}
+
+
+def is_tabular_file(filename: str) -> bool:
+    """是否為以串流模式處理的問答集 (CSV / JSONL / Parquet)"""
+    return filename.lower().endswith(TABULAR_EXTENSIONS)
+
+
+def open_qa_file(file_path: str, logger: Logger) -> QAFileHandler:
+    """
+    依副檔名開啟問答集：Excel 使用 ExcelHandler，CSV / JSONL / Parquet 使用對應的串流處理器
+
+    Raises:
+        FileNotFoundError: 檔案不存在
+        ValueError: 不支援的格式、檔案是空的或缺少 Parquet 所需的 pyarrow
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in EXCEL_EXTENSIONS:
+        return ExcelHandler(file_path, logger)
+    if extension not in _HANDLERS:
+        error_msg = f"[ERROR] 不支援的檔案格式: {extension}。支援的格式: {', '.join(EXCEL_EXTENSIONS + TABULAR_EXTENSIONS)}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    return _HANDLERS[extension](file_path, logger)
+
+
+def prescan_qa_file(file_path: str, logger: Logger) -> Dict[str, int]:
+    """
+    以唯讀方式快速檢查問答集並計算各工作表的問答對數量，用於在任務排入佇列前拒絕無效的檔案
+    (Excel 以 openpyxl 唯讀模式逐列讀取，CSV / JSONL / Parquet 串流掃描，皆不會將整個檔案載入記憶體)
+
+    Returns:
+        Dict[str, int]: 工作表名稱 (串流格式為檔名) -> 問答對數量
+
+    Raises:
+        ValueError: 不支援的格式、檔案無法解析或沒有任何問答對
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension in EXCEL_EXTENSIONS:
+            counts = scan_workbook(file_path)
+        else:
+            counts = open_qa_file(file_path, logger).count_qa_pairs()
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        raise ValueError(f"無法讀取 '{os.path.basename(file_path)}': {e}")
+    if not sum(counts.values()):
+        raise ValueError(f"'{os.path.basename(file_path)}' 中沒有任何有效的問答對 (第一欄為問題、第二欄為標準答案)")
+    return counts
@@ -0,0 +1,90 @@
+"""
+執行中任務的取消與暫停/繼續 (協作式)
+驗證流程在送出每個聊天請求、上傳每個文件與每個評分批次之前呼叫 checkpoint()：
+暫停時在此等待 (已送出的請求照常完成，暫停中的任務不佔用並行名額與速率限制的權杖)，
+取消時拋出 TaskCancelled，由流程停止送出新的請求並儲存已完成的部分結果。
+控制器依任務 ID 在整個程序內共用，QAVerificationSystem 以其 task_id 取得。
+"""
+
+import threading
+from typing import Dict, Optional
+
+
+class TaskCancelled(Exception):
+    """任務已被取消"""
+
+
+class TaskControl:
+    """一個任務的取消與暫停狀態"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._cancelled = False
+        self._paused = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    @property
+    def paused(self) -> bool:
+        return self._paused and not self._cancelled
+
+    @property
+    def state(self) -> str:
+        """running / paused / cancelled"""
+        if self._cancelled:
+            return 'cancelled'
+        return 'paused' if self._paused else 'running'
+
+    def cancel(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def pause(self):
+        with self._condition:
+            self._paused = True
+
+    def resume(self):
+        with self._condition:
+            self._paused = False
+            self._condition.notify_all()
+
+    def checkpoint(self):
+        """
+        暫停時等待繼續或取消
+
+        Raises:
+            TaskCancelled: 任務已被取消
+        """
+        with self._condition:
+            while self._paused and not self._cancelled:
+                self._condition.wait()
+            if self._cancelled:
+                raise TaskCancelled("任務已被取消")
+
+
+_controls: Dict[str, TaskControl] = {}
+_controls_lock = threading.Lock()
+
+
+def register_control(task_id: str) -> TaskControl:
+    """建立 (或取得) 任務的控制器"""
+    with _controls_lock:
+        control = _controls.get(task_id)
+        if control is None:
+            control = _controls[task_id] = TaskControl()
+        return control
+
+
+def get_control(task_id: Optional[str]) -> Optional[TaskControl]:
+    """取得任務的控制器，未註冊時返回 None"""
+    with _controls_lock:
+        return _controls.get(task_id) if task_id else None
+
+
+def remove_control(task_id: str):
+    """任務結束後移除控制器"""
+    with _controls_lock:
+        _controls.pop(task_id, None)
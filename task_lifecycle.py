@@ -0,0 +1,253 @@
+"""
+Web 任務的生命週期管理與背景清理
+- 任務結束後，記憶體中的任務狀態 (SSE 佇列、單筆結果、任務 logger) 保留 state_ttl 秒
+- 任務的上傳檔案與輸出目錄保留 retention 秒；所有已結束任務的檔案總大小超過 quota_bytes 時，從最舊的任務開始刪除
+- 到期時間以最小堆積排序，由背景執行緒在最近的到期時間醒來處理，不需在每個請求中掃描所有任務或整個目錄
+- 任務的檔案大小只在結束時計算一次 (只走訪該任務自己的路徑)，執行中的任務不會被清理
+"""
+
+import heapq
+import itertools
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import telemetry
+from logger import Logger
+
+# 上傳目錄與輸出目錄中以任務 ID 開頭的項目 (output/<task_id>、uploads/<task_id>、uploads/<task_id>_<檔名>)
+_TASK_ENTRY = re.compile(r'^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?:_.*)?$')
+
+
+def disk_usage(path: str) -> int:
+    """檔案或目錄 (含子目錄) 的總大小，不存在時為 0"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+@dataclass
+class TaskRecord:
+    """一個任務在磁碟上的檔案與清理狀態"""
+    task_id: str
+    paths: List[str] = field(default_factory=list)
+    finished_time: Optional[float] = None  # None 表示仍在執行中
+    size: int = 0  # 結束時計算的檔案總大小 (bytes)
+    has_state: bool = True  # 記憶體中的任務狀態尚未釋放
+    has_files: bool = True  # 磁碟上的檔案尚未刪除
+
+
+class TaskLifecycleManager:
+    """任務狀態與檔案的到期、磁碟配額管理"""
+
+    def __init__(self, release_state: Callable[[str], None], state_ttl: float = 3600.0,
+                 retention: float = 7 * 24 * 3600, quota_bytes: int = 0, sweep_interval: float = 60.0,
+                 logger: Optional[Logger] = None):
+        """
+        Args:
+            release_state (Callable[[str], None]): 釋放任務在記憶體中的狀態 (以任務 ID 呼叫)
+            state_ttl (float): 任務結束後保留任務狀態的秒數
+            retention (float): 任務結束後保留檔案的秒數，0 表示不依時間刪除
+            quota_bytes (int): 已結束任務的檔案總大小上限，0 表示不限制
+            sweep_interval (float): 背景執行緒最長的休眠秒數
+        """
+        self.release_state = release_state
+        self.state_ttl = state_ttl
+        self.retention = retention
+        self.quota_bytes = quota_bytes
+        self.sweep_interval = sweep_interval
+        self.logger = logger
+        self._records: Dict[str, TaskRecord] = {}
+        # (到期時間, 序號, 任務 ID)：任務狀態依結束時間 + state_ttl 排序
+        self._state_heap: List[Tuple[float, int, str]] = []
+        # (結束時間, 序號, 任務 ID)：檔案依結束時間排序，堆積頂端即為最舊的任務
+        self._files_heap: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._total_bytes = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    @property
+    def total_bytes(self) -> int:
+        """已結束任務的檔案總大小"""
+        return self._total_bytes
+
+    def track(self, task_id: str, *paths: str):
+        """開始追蹤執行中的任務與其檔案 (路徑可以尚未建立)"""
+        with self._condition:
+            record = self._records.setdefault(task_id, TaskRecord(task_id))
+            record.paths.extend(path for path in paths if path not in record.paths)
+
+    def finish(self, task_id: str):
+        """任務結束：計算檔案大小並排入到期佇列"""
+        with self._condition:
+            record = self._records.get(task_id)
+            if record is None or record.finished_time is not None:
+                return
+            paths = list(record.paths)
+        size = sum(disk_usage(path) for path in paths)
+        now = time.time()
+        with self._condition:
+            record.finished_time = now
+            record.size = size
+            self._total_bytes += size
+            heapq.heappush(self._state_heap, (now + self.state_ttl, next(self._sequence), task_id))
+            heapq.heappush(self._files_heap, (now, next(self._sequence), task_id))
+            self._condition.notify()
+
+    def refresh(self, task_id: str):
+        """已結束的任務又產生新的檔案時 (例如單筆驗證的報告)，重新計算其大小"""
+        with self._condition:
+            record = self._records.get(task_id)
+            if record is None or record.finished_time is None or not record.has_files:
+                return
+            paths = list(record.paths)
+        size = sum(disk_usage(path) for path in paths)
+        with self._condition:
+            if record.has_files:
+                self._total_bytes += size - record.size
+                record.size = size
+                self._condition.notify()
+
+    def adopt_existing(self, *directories: str) -> int:
+        """
+        伺服器啟動時接管先前留下的任務檔案 (只在啟動時掃描一次)，
+        以檔案的最後修改時間作為結束時間
+
+        Returns:
+            int: 接管的任務數
+        """
+        entries: Dict[str, List[str]] = {}
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                match = _TASK_ENTRY.match(name)
+                if match:
+                    entries.setdefault(match.group(1), []).append(os.path.join(directory, name))
+        adopted = 0
+        for task_id, paths in entries.items():
+            finished_time = max(os.path.getmtime(path) for path in paths)
+            size = sum(disk_usage(path) for path in paths)
+            with self._condition:
+                if task_id in self._records:
+                    continue
+                self._records[task_id] = TaskRecord(task_id, paths, finished_time, size, has_state=False)
+                self._total_bytes += size
+                heapq.heappush(self._files_heap, (finished_time, next(self._sequence), task_id))
+            adopted += 1
+        return adopted
+
+    def start(self):
+        """啟動背景清理執行緒"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='task-lifecycle-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _next_wakeup(self, now: float) -> float:
+        """距離下一個到期時間的秒數 (最多 sweep_interval)"""
+        timeout = self.sweep_interval
+        if self._state_heap:
+            timeout = min(timeout, self._state_heap[0][0] - now)
+        if self._files_heap and self.retention > 0:
+            timeout = min(timeout, self._files_heap[0][0] + self.retention - now)
+        return max(timeout, 0.0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                self._condition.wait(self._next_wakeup(time.time()))
+                if self._stopped:
+                    return
+            try:
+                self.sweep()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"[ERROR] 清理過期任務時發生錯誤: {e}", exc_info=True)
+
+    def _pop_expired_state(self, now: float) -> Optional[str]:
+        while self._state_heap and self._state_heap[0][0] <= now:
+            _, _, task_id = heapq.heappop(self._state_heap)
+            record = self._records.get(task_id)
+            if record is not None and record.has_state:
+                record.has_state = False
+                if not record.has_files:
+                    del self._records[task_id]
+                return task_id
+        return None
+
+    def _pop_files(self, now: float) -> Optional[Tuple[TaskRecord, str]]:
+        """取出下一個要刪除檔案的任務：先處理超過保留時間的，再處理超過配額時最舊的"""
+        while self._files_heap:
+            finished_time, _, task_id = self._files_heap[0]
+            record = self._records.get(task_id)
+            if record is None or not record.has_files:
+                heapq.heappop(self._files_heap)
+                continue
+            if self.retention > 0 and finished_time + self.retention <= now:
+                reason = 'expired'
+            elif self.quota_bytes > 0 and self._total_bytes > self.quota_bytes:
+                reason = 'quota'
+            else:
+                return None
+            heapq.heappop(self._files_heap)
+            record.has_files = False
+            self._total_bytes -= record.size
+            if not record.has_state:
+                del self._records[task_id]
+            return record, reason
+        return None
+
+    def sweep(self, now: Optional[float] = None):
+        """釋放到期的任務狀態，並刪除超過保留時間或超過配額的任務檔案"""
+        now = time.time() if now is None else now
+        while True:
+            with self._condition:
+                task_id = self._pop_expired_state(now)
+            if task_id is None:
+                break
+            self.release_state(task_id)
+            telemetry.TASK_GC_RELEASED.inc()
+
+        while True:
+            with self._condition:
+                popped = self._pop_files(now)
+            if popped is None:
+                break
+            record, reason = popped
+            for path in record.paths:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            telemetry.TASK_GC_REMOVED.labels(reason=reason).inc()
+            telemetry.TASK_GC_RECLAIMED_BYTES.labels(reason=reason).inc(record.size)
+            if self.logger:
+                self.logger.info(f"[INFO] 已刪除任務 {record.task_id} 的檔案 ({record.size} bytes，原因: {reason})")
+
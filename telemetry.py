@@ -0,0 +1,353 @@
+"""
+系統監控指標模組
+此模組提供 Prometheus 文字格式的計數器 (Counter)、量表 (Gauge) 與直方圖 (Histogram)，
+由 QAVerificationSystem、SimilarityAnalyzer 及 Web 任務生命週期更新，
+並由 Flask 的 `/metrics` 端點輸出。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 預設的直方圖區間 (秒)，涵蓋毫秒級評分到數分鐘的 LLM 生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """所有指標的共同基底，負責標籤管理與文字輸出。"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        """取得指定標籤組合的子指標。"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指標 {self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._new_child()
+                self._children[key] = child
+            return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"指標 {self.name} 需要先呼叫 labels()")
+        return self._children[()]
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("計數器只能遞增")
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+
+class Counter(_Metric):
+    """單調遞增的計數器。"""
+
+    metric_type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def get(self) -> float:
+        return self._default().get()
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._children.items())
+        return [('_total', _format_labels(self.labelnames, key), child.get()) for key, child in items]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """設定在輸出時才計算數值的回呼函式。"""
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float('nan')
+        return self._value
+
+
+class Gauge(_Metric):
+    """可增可減的量表。"""
+
+    metric_type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+    def track_inprogress(self):
+        return self._default().track_inprogress()
+
+    def get(self) -> float:
+        return self._default().get()
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._children.items())
+        return [('', _format_labels(self.labelnames, key), child.get()) for key, child in items]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._upper_bounds = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self._upper_bounds):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {'count': self._count, 'sum': self._sum}
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        with self._lock:
+            result, running = [], 0
+            for bound, count in zip(self._upper_bounds, self._counts):
+                running += count
+                result.append((bound, running))
+            return result
+
+
+class Histogram(_Metric):
+    """累積區間的直方圖，用於延遲與耗時分佈。"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        bounds = tuple(sorted(float(b) for b in buckets))
+        if not bounds or bounds[-1] != float('inf'):
+            bounds = bounds + (float('inf'),)
+        self.buckets = bounds
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def snapshot(self) -> Dict[str, float]:
+        return self._default().snapshot()
+
+    def snapshots(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """回傳所有標籤組合的 count/sum，供效能測試計算前後差值。"""
+        with self._lock:
+            items = list(self._children.items())
+        return {key: child.snapshot() for key, child in items}
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._children.items())
+        samples = []
+        for key, child in items:
+            for bound, count in child.cumulative():
+                samples.append(('_bucket', _format_labels(self.labelnames, key, {'le': _format_value(bound)}), count))
+            snap = child.snapshot()
+            labels = _format_labels(self.labelnames, key)
+            samples.append(('_sum', labels, snap['sum']))
+            samples.append(('_count', labels, snap['count']))
+        return samples
+
+
+class Registry:
+    """收集所有指標並輸出 Prometheus 文字格式。"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指標名稱重複: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def generate_latest() -> str:
+    """以 Prometheus 文字格式輸出目前所有指標。"""
+    return REGISTRY.render()
+
+
+# --- 任務生命週期 ---
+
+TASKS_STARTED = counter('qa_tasks_started', '已啟動的驗證任務數', ('kind',))
+TASKS_FINISHED = counter('qa_tasks_finished', '已結束的驗證任務數', ('kind', 'status'))
+TASKS_RUNNING = gauge('qa_tasks_running', '目前執行中的驗證任務數', ('kind',))
+TASK_QUEUE_DEPTH = gauge('qa_task_queue_depth', '任務佇列深度 (pending 任務數與尚未送出的 SSE 訊息數)', ('queue',))
+TASK_DURATION_SECONDS = histogram('qa_task_duration_seconds', '驗證任務的總執行時間', ('kind',))
+TASK_GC_RELEASED = counter('qa_task_gc_released', '到期後釋放的任務狀態數 (SSE 佇列、單筆結果與任務 logger)')
+TASK_GC_REMOVED = counter('qa_task_gc_removed', '背景清理刪除檔案的任務數 (expired: 超過保留時間, quota: 超過磁碟配額)', ('reason',))
+TASK_GC_RECLAIMED_BYTES = counter('qa_task_gc_reclaimed_bytes', '背景清理刪除任務檔案釋放的磁碟空間 (bytes)', ('reason',))
+TASK_DISK_BYTES = gauge('qa_task_disk_bytes', '已結束任務的上傳檔案與輸出目錄總大小 (bytes)')
+
+# --- AnythingLLM 請求 ---
+
+CHAT_REQUESTS = counter('qa_chat_requests', '送往 AnythingLLM 的聊天請求數', ('status',))
+CHAT_LATENCY_SECONDS = histogram('qa_chat_latency_seconds', 'AnythingLLM 聊天請求的回應時間')
+CHAT_TTFT_SECONDS = histogram('qa_chat_ttft_seconds', '串流聊天的首個 token 延遲 (time to first token)')
+CHAT_TOKENS_PER_SECOND = histogram('qa_chat_tokens_per_second', '串流聊天的生成速度 (每秒 token 數)',
+                                   buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500))
+CHAT_CONCURRENCY_LIMIT = gauge('qa_chat_concurrency_limit', '聊天請求的並行上限 (自適應並行控制時會隨延遲與錯誤率調整)', ('target',))
+CHAT_IN_FLIGHT = gauge('qa_chat_in_flight', '進行中的聊天請求數', ('target',))
+API_CACHE_REQUESTS = counter('qa_api_cache_requests', '工作區列表與 API 金鑰驗證快取的查詢數', ('cache', 'result'))
+RATE_LIMIT_WAIT_SECONDS = histogram('qa_rate_limit_wait_seconds', '等待速率限制權杖的時間', ('target',))
+PRIORITY_WAIT_SECONDS = histogram('qa_priority_wait_seconds', '依優先等級等待並行名額 (聊天請求與評分批次) 的時間',
+                                  ('limiter', 'priority'))
+API_REQUESTS = counter('qa_api_requests', '其他 AnythingLLM API 請求數 (驗證、工作區、上傳)', ('endpoint', 'status'))
+
+# --- 問答處理與模型推論 ---
+
+NORMALIZER_DROPPED_BYTES = counter('qa_normalizer_dropped_bytes', '回答正規化時移除的位元組數 (think 區塊、Markdown、引用等)')
+
+ROWS_PROCESSED = counter('qa_rows_processed', '已處理的問答對數', ('result',))
+SCORING_SECONDS = histogram('qa_scoring_seconds', '相似度模型推論時間', ('metric',))
+SCORING_ERRORS = counter('qa_scoring_errors', '相似度計算失敗次數')
+SCORING_BATCHES = counter('qa_scoring_batches', '相似度模型的評分批次數')
+SCORING_TIERS = counter('qa_scoring_tiers', '依評分層級統計的問答對數 (lexical: 字元指標直接判定, model: 模型評分)', ('tier',))
+SCORING_TOKENS = counter('qa_scoring_tokens', '評分批次的 token 數 (real: 實際內容, padded: 含填充)', ('kind',))
+MODEL_LOAD_SECONDS = histogram('qa_model_load_seconds', '評分模型載入時間', ('model',))
+STAGE_SECONDS = histogram('qa_stage_seconds', '驗證流程各階段耗時', ('stage',))
@@ -0,0 +1,261 @@
+"""
+LLM 回答文字正規化模組
+此模組提供單一的回答正規化流程：移除推理模型輸出的 <think>...</think> 區塊 (包含未關閉的標籤)、
+整理空白、移除 Markdown 標記與引用標註，並回報被移除的位元組數。
+同一套規則可用於完整文字或串流區塊，讓評分不需等待完整回答後再做第二次掃描。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+
+# --- 行內規則 (皆為線性時間的預先編譯樣式) ---
+
+_CODE_FENCE = re.compile(r'^\s*(```|~~~)')
+_HEADING = re.compile(r'^\s{0,3}#{1,6}\s+')
+_BLOCKQUOTE = re.compile(r'^\s*>\s?')
+_LIST_BULLET = re.compile(r'^(\s*)[-*+]\s+')
+_LINK = re.compile(r'!?\[([^\]\n]*)\]\([^)\n]*\)')
+_STRONG = re.compile(r'\*\*|__|~~')
+_EMPHASIS = re.compile(r'(?<![\*\w])\*(?!\s)([^*\n]+?)(?<!\s)\*(?!\*)')
+_INLINE_CODE = re.compile(r'`')
+_CITATION = re.compile(r'\[\^?\d+(?:\s*[,\-–]\s*\d+)*\]|\[(?:citation|source):\s*[^\]\n]{0,40}\]|【[^】\n]{0,40}】')
+_INNER_SPACES = re.compile(r'[ \t　]{2,}')
+
+
+def _partial_tag_suffix(text: str, tag: str) -> int:
+    """回傳 text 結尾可能是 tag 開頭片段的長度，用於保留跨區塊的標籤"""
+    max_len = min(len(text), len(tag) - 1)
+    for length in range(max_len, 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode('utf-8'))
+
+
+class StreamingThinkStripper:
+    """
+    逐段移除 <think>...</think> 區塊的串流處理器
+
+    每次 feed() 只會掃描新收到的文字，標籤被切在兩個區塊之間時會暫存結尾片段，
+    未關閉的 <think> 區塊會被視為思考內容並整段捨棄。
+    """
+
+    def __init__(self):
+        self._pending = ''
+        self._in_think = False
+        self.dropped_chars = 0
+
+    def feed(self, chunk: str) -> str:
+        """
+        處理新的文字區塊
+
+        Args:
+            chunk (str): 新收到的文字
+
+        Returns:
+            str: 可安全輸出的已清理文字
+        """
+        text = self._pending + chunk
+        self._pending = ''
+        output = []
+        pos = 0
+        while pos < len(text):
+            tag = THINK_CLOSE if self._in_think else THINK_OPEN
+            index = text.find(tag, pos)
+            if index == -1:
+                keep = _partial_tag_suffix(text[pos:], tag)
+                end = len(text) - keep
+                if self._in_think:
+                    self.dropped_chars += end - pos
+                else:
+                    output.append(text[pos:end])
+                self._pending = text[end:]
+                break
+            if self._in_think:
+                self.dropped_chars += index + len(tag) - pos
+            else:
+                output.append(text[pos:index])
+                self.dropped_chars += len(tag)
+            self._in_think = not self._in_think
+            pos = index + len(tag)
+        return ''.join(output)
+
+    def flush(self) -> str:
+        """串流結束時輸出暫存的片段"""
+        pending, self._pending = self._pending, ''
+        if self._in_think:
+            self.dropped_chars += len(pending)
+            return ''
+        return pending
+
+
+@dataclass
+class NormalizedText:
+    """正規化結果"""
+    text: str
+    original_bytes: int
+    dropped_bytes: int
+
+
+class ResponseNormalizer:
+    """
+    LLM 回答的正規化流程
+
+    規則依序為：移除 <think> 區塊 → 逐行移除 Markdown 與引用標註、整理空白 → 去除首尾空白。
+    normalize() 與 stream() 共用相同的處理器，因此兩種模式的輸出完全一致。
+    """
+
+    def __init__(self, strip_think: bool = True, normalize_whitespace: bool = False,
+                 strip_markdown: bool = False, strip_citations: bool = False):
+        """
+        Args:
+            strip_think (bool): 移除 <think>...</think> 區塊 (未關閉的標籤會移除到結尾)
+            normalize_whitespace (bool): 去除行尾空白、合併連續空白與多餘空行
+            strip_markdown (bool): 移除標題、清單、強調、程式碼區塊圍欄與連結語法
+            strip_citations (bool): 移除 [1]、[^2]、【3†source】等引用標註
+        """
+        self.strip_think = strip_think
+        self.normalize_whitespace = normalize_whitespace
+        self.strip_markdown = strip_markdown
+        self.strip_citations = strip_citations
+
+    @classmethod
+    def from_config(cls, normalizer_config) -> 'ResponseNormalizer':
+        """由 NormalizerConfig 建立正規化器"""
+        return cls(
+            strip_think=normalizer_config.strip_think,
+            normalize_whitespace=normalizer_config.normalize_whitespace,
+            strip_markdown=normalizer_config.strip_markdown,
+            strip_citations=normalizer_config.strip_citations,
+        )
+
+    @property
+    def line_based(self) -> bool:
+        """是否需要以行為單位處理 (串流模式下會暫存到換行才輸出)"""
+        return self.normalize_whitespace or self.strip_markdown or self.strip_citations
+
+    def clean_line(self, line: str) -> Optional[str]:
+        """
+        套用行內規則
+
+        Returns:
+            Optional[str]: 清理後的行，整行應被移除時返回 None
+        """
+        if self.strip_markdown:
+            if _CODE_FENCE.match(line):
+                return None
+            line = _HEADING.sub('', line)
+            line = _BLOCKQUOTE.sub('', line)
+            line = _LIST_BULLET.sub(r'\1', line)
+            line = _LINK.sub(r'\1', line)
+            line = _STRONG.sub('', line)
+            line = _EMPHASIS.sub(r'\1', line)
+            line = _INLINE_CODE.sub('', line)
+        if self.strip_citations:
+            line = _CITATION.sub('', line)
+        if self.normalize_whitespace:
+            line = _INNER_SPACES.sub(' ', line.rstrip())
+        return line
+
+    def stream(self) -> 'StreamingNormalizer':
+        """建立串流模式的處理器"""
+        return StreamingNormalizer(self)
+
+    def normalize(self, text: str) -> NormalizedText:
+        """正規化完整的回答文字"""
+        stream = self.stream()
+        stream.feed(text)
+        stream.flush()
+        return stream.result()
+
+
+class StreamingNormalizer:
+    """
+    串流模式的正規化處理器
+
+    feed() 回傳可立即輸出的已清理文字；行內規則啟用時會暫存到換行才輸出，
+    結尾的空白也會暫存，直到確認後面還有內容，以符合完整文字 strip() 的結果。
+    """
+
+    def __init__(self, normalizer: ResponseNormalizer):
+        self._normalizer = normalizer
+        self._think = StreamingThinkStripper() if normalizer.strip_think else None
+        self._line_parts: List[str] = []  # 尚未遇到換行的行 (以片段暫存，不重複串接)
+        self._pending_whitespace = ''
+        self._started = False
+        self._blank_lines = 0
+        self._parts: List[str] = []
+        self._original_bytes = 0
+
+    def _process_lines(self, text: str, final: bool) -> str:
+        # 只在新收到的文字中尋找換行，整行到齊時才串接片段，長行的處理時間與長度成線性
+        lines = text.split('\n')
+        self._line_parts.append(lines[0])
+        if len(lines) == 1 and not final:
+            return ''
+        lines[0] = ''.join(self._line_parts)
+        self._line_parts = []
+        if not final:
+            self._line_parts.append(lines.pop())
+        output = []
+        for index, line in enumerate(lines):
+            cleaned = self._normalizer.clean_line(line)
+            if cleaned is None:
+                continue
+            if self._normalizer.normalize_whitespace and not cleaned.strip():
+                self._blank_lines += 1
+                if self._blank_lines > 1:
+                    continue
+            else:
+                self._blank_lines = 0
+            # 最後一行在 final 時沒有換行結尾
+            newline = '' if final and index == len(lines) - 1 else '\n'
+            output.append(cleaned + newline)
+        return ''.join(output)
+
+    def _emit(self, text: str, final: bool) -> str:
+        if self._normalizer.line_based:
+            text = self._process_lines(text, final)
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ''
+            self._started = True
+        combined = self._pending_whitespace + text
+        stripped = combined.rstrip()
+        self._pending_whitespace = '' if final else combined[len(stripped):]
+        if stripped:
+            self._parts.append(stripped)
+        return stripped
+
+    def feed(self, chunk: str) -> str:
+        """
+        處理新的文字區塊
+
+        Args:
+            chunk (str): 新收到的原始文字
+
+        Returns:
+            str: 可立即輸出的已清理文字
+        """
+        self._original_bytes += _utf8_len(chunk)
+        text = self._think.feed(chunk) if self._think else chunk
+        return self._emit(text, final=False)
+
+    def flush(self) -> str:
+        """串流結束時輸出剩餘的已清理文字"""
+        tail = self._think.flush() if self._think else ''
+        return self._emit(tail, final=True)
+
+    def result(self) -> NormalizedText:
+        """目前為止的完整正規化結果 (應在 flush() 之後呼叫)"""
+        text = ''.join(self._parts)
+        return NormalizedText(text=text, original_bytes=self._original_bytes,
+                              dropped_bytes=self._original_bytes - _utf8_len(text))
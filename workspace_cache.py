@@ -0,0 +1,83 @@
+"""
+AnythingLLM 工作區資訊快取
+每次執行與每次單筆驗證都要以工作區名稱查詢 slug，而 AnythingLLM 只提供列出所有工作區的 API。
+此模組依 AnythingLLM 位址與 API 金鑰，在整個程序內快取工作區列表 (含設定) 與 API 金鑰驗證結果，
+並建立名稱 / slug 的索引，避免每次都重新下載並逐一比對。
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import telemetry
+
+CacheKey = Tuple[str, str]
+
+
+def cache_key(base_url: str, api_key: Optional[str]) -> CacheKey:
+    """快取鍵：AnythingLLM 位址與 API 金鑰的雜湊 (不在記憶體中保留金鑰本身)"""
+    digest = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+    return base_url.rstrip('/'), digest
+
+
+@dataclass
+class WorkspaceDirectory:
+    """工作區列表與名稱 / slug 索引"""
+    workspaces: List[Dict]
+    index: Dict[str, Dict] = field(default_factory=dict)
+
+    def __post_init__(self):
+        # 與逐一比對相同：名稱或 slug 相符的第一個工作區優先
+        for workspace in self.workspaces:
+            if isinstance(workspace, dict):
+                for identifier in (workspace.get('name'), workspace.get('slug')):
+                    if identifier is not None:
+                        self.index.setdefault(identifier, workspace)
+
+    def find(self, identifier: str) -> Optional[Dict]:
+        """依名稱或 slug 尋找工作區"""
+        return self.index.get(identifier)
+
+
+class TTLCache:
+    """依鍵快取載入結果，超過存活時間後重新載入；載入時拋出的例外不會被快取"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries: Dict[CacheKey, Tuple[float, object]] = {}
+
+    def get_or_load(self, key: CacheKey, loader: Callable[[], object], ttl: float, refresh: bool = False):
+        """
+        取得快取的值，不存在、已過期或 refresh 為 True 時呼叫 loader 載入
+
+        Args:
+            key (CacheKey): 快取鍵 (見 cache_key)
+            loader (Callable[[], object]): 載入函式
+            ttl (float): 存活時間 (秒)，0 表示不快取
+            refresh (bool): 是否略過快取重新載入
+        """
+        now = time.monotonic()
+        if ttl > 0 and not refresh:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < ttl:
+                telemetry.API_CACHE_REQUESTS.labels(cache=self.name, result='hit').inc()
+                return entry[1]
+        telemetry.API_CACHE_REQUESTS.labels(cache=self.name, result='miss').inc()
+        value = loader()
+        if ttl > 0:
+            with self._lock:
+                self._entries[key] = (time.monotonic(), value)
+        return value
+
+    def invalidate(self, key: CacheKey):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# 工作區列表 (WorkspaceDirectory) 與 API 金鑰驗證結果，依 (位址, 金鑰雜湊) 在整個程序內共用
+WORKSPACES = TTLCache('workspaces')
+API_KEYS = TTLCache('auth')